@@ -1,18 +1,111 @@
-from fastapi import FastAPI
+import hmac
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from routes import router
+from core.admission import AdmissionMiddleware, admission
+from core.archive import task_archiver
+from core.compression import CompressionMiddleware
+from core.db import SCHEMA_VERSION, engine, migrate, warm_pool, write_engine
+from core.events import outbox_relay
+from core.metrics import MetricsMiddleware, instrument_engine, metrics
+from core.writequeue import group_writer
+from routes import compile_templates, router
 
-app = FastAPI(title="Simple To-Do App")
 
-templates = Jinja2Templates(directory="templates")
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def warm_up() -> dict:
+    """Migrate the schema, fill the connection pools and compile templates.
+
+    Returns how long each step took, in milliseconds.
+    """
+    timings = {}
+    started = time.perf_counter()
+    timings["migrations"] = await migrate()
+    timings["migrate_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    engines = {engine, write_engine}  # one engine under the development profile
+    timings["connections"] = sum([await warm_pool(bind) for bind in engines])
+    timings["pools_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    timings["templates"] = compile_templates()
+    timings["templates_ms"] = _elapsed_ms(started)
+    return timings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    app.state.ready = False
+    app.state.startup = await warm_up()
+    app.state.startup["total_ms"] = _elapsed_ms(started)
+    outbox_relay.start()
+    task_archiver.start()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    await task_archiver.stop()
+    await outbox_relay.stop()
+    # Flush writes still waiting for a group commit.
+    await group_writer.stop()
+
+
+app = FastAPI(title="Simple To-Do App", lifespan=lifespan)
+app.state.ready = False
 
 app.include_router(router, prefix="/tasks")
 
+# Scrapers can't log in, so /metrics takes its own static bearer token;
+# leave it unset to serve metrics to anyone who can reach the port.
+METRICS_TOKEN = os.getenv("TODO_METRICS_TOKEN")
+
+instrument_engine(engine, "read")
+instrument_engine(write_engine, "write")
+metrics.collectors.append(admission.metric_lines)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness: 503 until startup has migrated the schema and warmed up."""
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True, "schema_version": SCHEMA_VERSION, "startup": app.state.startup}
+
+
+# Inside CORS, so that 429 and 503 answers still carry CORS headers.
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+app.add_middleware(CompressionMiddleware)
+
+# Added last so it is the outermost layer and times everything below it.
+app.add_middleware(MetricsMiddleware)
@@ -1,14 +1,30 @@
 # core/auth.py
+import hashlib
+import heapq
+import os
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from jose import jwt, JWTError
-from fastapi import HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer
+from schemas import CurrentUser
 
 
 SECRET_KEY = "secretkey"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 5
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+TOKEN_CACHE_SIZE = int(os.getenv("TODO_TOKEN_CACHE_SIZE", "10000"))
+
+# Value of the ``typ`` claim. Both kinds are signed with the same key and
+# carry the same identity, so only this claim keeps a long-lived refresh
+# token from being used as a bearer credential, and an access token from
+# being exchanged for fresh tokens.
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
 
 
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
@@ -17,7 +33,8 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
 
     payload = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    payload.update({"exp": expire})
+    # jti makes every token unique, so revoking one never hits a twin.
+    payload.update({"exp": expire, "jti": uuid.uuid4().hex, "typ": ACCESS_TOKEN})
     token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
     return token
 
@@ -27,16 +44,172 @@ def create_refresh_token(data: Dict[str, Any]) -> str:
 
     payload = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    payload.update({"exp": expire})
+    payload.update({"exp": expire, "jti": uuid.uuid4().hex, "typ": REFRESH_TOKEN})
     token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
     return token
 
-def verify_token(token: str) -> str:
+class VerifiedTokenCache:
+    """Bounded LRU of tokens whose signature and claims were already verified.
+
+    Entries are keyed by the token's SHA-256 digest and are dropped once the
+    token's ``exp`` has passed, so a cached token is never accepted after it
+    would have failed ``jwt.decode``; an expiry heap purges them on insert
+    so dead tokens don't hold LRU slots. Revoked digests are remembered
+    until their own expiry. Both live in this process only and are only
+    touched from the event loop.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._expiry = []  # heap of (exp, digest)
+        self._revoked = {}
+        self._revoked_expiry = []  # heap of (exp, digest)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revocations = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, digest: bytes) -> Optional[Dict[str, Any]]:
+        payload = self._entries.get(digest)
+        if payload is None:
+            self.misses += 1
+            return None
+        if payload["exp"] <= time.time():
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return payload
+
+    def peek(self, digest: bytes) -> Optional[Dict[str, Any]]:
+        """The cached claims of a live, unrevoked token, without counting a
+        lookup or refreshing its LRU position."""
+        payload = self._entries.get(digest)
+        if payload is None or payload["exp"] <= time.time() or digest in self._revoked:
+            return None
+        return payload
+
+    def _purge_expired(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            _, digest = heapq.heappop(self._expiry)
+            payload = self._entries.get(digest)
+            if payload is not None and payload["exp"] <= now:
+                del self._entries[digest]
+        if len(self._expiry) > 2 * self.max_entries:
+            # Heap items of LRU-evicted entries linger until their exp.
+            self._expiry = [(payload["exp"], digest) for digest, payload in self._entries.items()]
+            heapq.heapify(self._expiry)
+
+    def put(self, digest: bytes, payload: Dict[str, Any]):
+        self._purge_expired(time.time())
+        self._entries[digest] = payload
+        self._entries.move_to_end(digest)
+        heapq.heappush(self._expiry, (payload["exp"], digest))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def is_revoked(self, digest: bytes) -> bool:
+        return digest in self._revoked
+
+    def revoke(self, digest: bytes, exp: float):
+        self._entries.pop(digest, None)
+        now = time.time()
+        while self._revoked_expiry and self._revoked_expiry[0][0] <= now:
+            _, expired = heapq.heappop(self._revoked_expiry)
+            self._revoked.pop(expired, None)
+        if exp > now and digest not in self._revoked:
+            self._revoked[digest] = exp
+            heapq.heappush(self._revoked_expiry, (exp, digest))
+            self.revocations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "revoked": len(self._revoked),
+            "revocations": self.revocations,
+        }
+
+
+token_cache = VerifiedTokenCache()
+
+
+def decode_token(token: str, token_type: Optional[str] = None) -> Dict[str, Any]:
+    """Verify ``token`` and return its claims.
+
+    With ``token_type`` (ACCESS_TOKEN or REFRESH_TOKEN) tokens of any other
+    kind, including ones minted without a ``typ`` claim, are rejected.
+    """
+    digest = token_cache.digest(token)
+    if token_cache.is_revoked(digest):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
+    payload = token_cache.get(digest)
+    if payload is None:
+        payload = _verify(token, digest)
+    if token_type is not None and payload.get("typ") != token_type:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong token type")
+    return payload
+
+
+def _verify(token: str, digest: bytes) -> Dict[str, Any]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub: Optional[str] = payload.get("sub")
-        if not sub:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing user identifier")
-        return sub
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+    if not payload.get("sub"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing user identifier")
+    if "exp" in payload:
+        token_cache.put(digest, payload)
+    return payload
+
+
+def revoke_token(token: str) -> None:
+    """Reject ``token`` from now until it expires (logout, refresh rotation)."""
+    payload = decode_token(token)
+    token_cache.revoke(token_cache.digest(token), payload["exp"])
+
+def verify_token(token: str) -> str:
+    return decode_token(token, ACCESS_TOKEN)["sub"]
+
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    """FastAPI dependency resolving the bearer token to the calling user.
+
+    The user id travels in the token's ``uid`` claim, so no database lookup
+    is needed per request, and repeat tokens skip signature verification
+    through ``token_cache``. It is ``async`` so it runs on the event loop
+    rather than in the threadpool, which also keeps the cache single-threaded.
+    """
+    payload = decode_token(token, ACCESS_TOKEN)
+    if "uid" not in payload:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing user identifier")
+    return CurrentUser(id=payload["uid"], username=payload["sub"])
+
+
+async def get_page_user(request: Request) -> CurrentUser:
+    """get_current_user for server-rendered pages.
+
+    A browser navigating to a page can't attach an Authorization header, so
+    the token may also come from the ``access_token`` cookie.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = request.cookies.get("access_token")
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token)
@@ -0,0 +1,48 @@
+# benchmarks/auth.py
+"""Bearer-token verification with and without the verified-token cache.
+
+    python -m benchmarks.auth --tokens 100 --requests 100000
+"""
+import argparse
+import json
+import random
+import time
+
+from jose import jwt
+
+import auth
+
+
+def measure(verify, tokens, requests: int):
+    order = random.Random(3).choices(tokens, k=requests)
+    started = time.perf_counter()
+    for token in order:
+        verify(token)
+    elapsed = time.perf_counter() - started
+    return {"requests": requests, "seconds": elapsed, "per_second": requests / elapsed, "us_per_call": elapsed / requests * 1e6}
+
+
+def run(token_count: int, requests: int):
+    tokens = [auth.create_access_token({"sub": f"user{n}", "uid": n}) for n in range(token_count)]
+    uncached = measure(lambda token: jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]), tokens, requests)
+    auth.token_cache = auth.VerifiedTokenCache()
+    cached = measure(auth.decode_token, tokens, requests)
+    return {
+        "tokens": token_count,
+        "uncached_jwt_decode": uncached,
+        "cached_decode_token": cached,
+        "speedup": cached["per_second"] / uncached["per_second"],
+        "cache": auth.token_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=100_000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tokens, args.requests), indent=2))
+
+
+if __name__ == "__main__":
+    main()
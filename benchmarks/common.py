@@ -0,0 +1,96 @@
+# benchmarks/common.py
+"""Helpers shared by the benchmark scripts: seeding and latency summaries."""
+import itertools
+import random
+import statistics
+import string
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import statements
+from core.db import create_engines, init_db, init_users_table
+
+STATUSES = ("Pending", "In Progress", "Completed")
+
+
+def vocabulary(size: int = 20000, seed: int = 7):
+    rng = random.Random(seed)
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(size)]
+
+
+def fake_tasks(count: int, seed: int = 42, users: int = 1):
+    """Yield ``count`` reproducible task dicts ready for statements.INSERT_TASKS.
+
+    Words follow a Zipf-like distribution, as in real text: a few are very
+    common, most are rare. Tasks are spread over user ids 1..``users``.
+    """
+    rng = random.Random(seed)
+    words = vocabulary()
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    def phrase(low, high):
+        return " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(low, high)))
+
+    for _ in range(count):
+        yield {
+            "title": phrase(2, 6).capitalize(),
+            "description": phrase(5, 30),
+            "due_date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "priority": rng.randint(1, 3),
+            "status": rng.choice(STATUSES),
+            "user_id": rng.randint(1, users),
+        }
+
+
+async def create_database(path, rows: int = 0, profile: str = "production", batch: int = 5000, users: int = 1):
+    """Create a database at ``path`` holding ``rows`` seeded tasks over ``users`` users.
+
+    Returns the ``(read_engine, write_engine)`` pair; dispose both when done.
+    """
+    read_engine, write_engine = create_engines(path, profile=profile)
+    await init_db(write_engine)
+    await init_users_table(write_engine)
+    pending = []
+    async with AsyncSession(write_engine) as session:
+        await session.execute(
+            text("INSERT INTO users (username, password) VALUES (:username, :password)"),
+            [{"username": f"user{n}", "password": "password"} for n in range(1, users + 1)],
+        )
+        for task in fake_tasks(rows, users=users):
+            pending.append(task)
+            if len(pending) == batch:
+                await session.execute(statements.INSERT_TASKS, pending)
+                pending = []
+        if pending:
+            await session.execute(statements.INSERT_TASKS, pending)
+        await session.commit()
+    return read_engine, write_engine
+
+
+@contextmanager
+def stopwatch(samples: list):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - started)
+
+
+def percentile(sorted_samples, fraction: float):
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+    }
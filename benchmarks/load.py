@@ -0,0 +1,227 @@
+# benchmarks/load.py
+"""Load test of the task API, driven in-process through httpx's ASGI transport.
+
+    python -m benchmarks.load --rows 100000 --requests 2000 --concurrency 32 --output baseline.json
+    python -m benchmarks.load --rows 100000 --requests 2000 --concurrency 32 --baseline baseline.json --margin 0.2
+
+Each endpoint (login, create, get, list, update, delete) is hit ``--requests``
+times by ``--concurrency`` concurrent clients against a freshly seeded
+temporary database; throughput and latency percentiles are printed as JSON.
+With ``--baseline`` the run exits non-zero when any endpoint's latency grows,
+or its throughput drops, by more than ``--margin`` against the stored run.
+Logins pay the full bcrypt cost; set TODO_BCRYPT_ROUNDS to change it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+PASSWORD = "load-test-password"
+
+
+async def seed(write_engine, rows: int, users: int, batch: int = 5000):
+    """Add ``users`` users owning ``rows`` tasks; return ``[(username, [task_id, ...]), ...]``."""
+    from benchmarks.common import fake_tasks
+    from core import statements
+    from core.hashing import password_hasher
+
+    prefix = uuid.uuid4().hex[:8]
+    password_hash = await password_hasher.hash(PASSWORD)
+    async with AsyncSession(write_engine) as session:
+        user_ids = []
+        for n in range(users):
+            result = await session.execute(
+                text("INSERT INTO users (username, password) VALUES (:username, :password) RETURNING id"),
+                {"username": f"load-{prefix}-{n}", "password": password_hash},
+            )
+            user_ids.append(result.scalar_one())
+        pending = []
+        for task in fake_tasks(rows, users=users):
+            task["user_id"] = user_ids[task["user_id"] - 1]
+            pending.append(task)
+            if len(pending) == batch:
+                await session.execute(statements.INSERT_TASKS, pending)
+                pending = []
+        if pending:
+            await session.execute(statements.INSERT_TASKS, pending)
+        await session.commit()
+        owned = {user_id: [] for user_id in user_ids}
+        result = await session.execute(
+            text("SELECT task_id, user_id FROM tasks WHERE user_id BETWEEN :low AND :high"),
+            {"low": min(user_ids), "high": max(user_ids)},
+        )
+        for task_id, user_id in result:
+            if user_id in owned:
+                owned[user_id].append(task_id)
+    return [(f"load-{prefix}-{n}", owned[user_id]) for n, user_id in enumerate(user_ids)]
+
+
+async def drive(requests, concurrency: int):
+    """Run ``requests`` (zero-argument coroutine factories) ``concurrency`` at a time."""
+    from benchmarks.common import summarize
+
+    pending = iter(requests)
+    samples, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for request in pending:
+            started = time.perf_counter()
+            response = await request()
+            samples.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {**summarize(samples), "errors": errors, "seconds": elapsed, "per_second": len(samples) / elapsed}
+
+
+async def run(rows: int, users: int, requests: int, concurrency: int, seed_value: int = 11):
+    # Imported here so that main() can point TODO_DB_PATH at a scratch file
+    # before core.db builds its engines.
+    from app import app
+    from core.db import write_engine
+
+    accounts = await seed(write_engine, rows, users)
+    rng = random.Random(seed_value)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+        tokens = {}
+        for username, _ in accounts:
+            response = await client.post("/tasks/login", json={"username": username, "password": PASSWORD})
+            tokens[username] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        def pick():
+            username, task_ids = rng.choice(accounts)
+            return tokens[username], task_ids
+
+        def login(username):
+            return lambda: client.post("/tasks/login", json={"username": username, "password": PASSWORD})
+
+        created = []
+
+        def create(headers, n):
+            async def request():
+                response = await client.post("/tasks/api/", json={"title": f"Load {n}", "priority": 2}, headers=headers)
+                if response.status_code == 200:
+                    created.append((headers, response.json()["task_id"]))
+                return response
+            return request
+
+        def get(headers, task_id):
+            return lambda: client.get(f"/tasks/api/{task_id}", headers=headers)
+
+        def page(headers):
+            return lambda: client.get("/tasks/api/", params={"limit": 20}, headers=headers)
+
+        def update(headers, task_id):
+            return lambda: client.put(f"/tasks/api/{task_id}", json={"status": "In Progress"}, headers=headers)
+
+        def delete(headers, task_id):
+            return lambda: client.delete(f"/tasks/api/{task_id}", headers=headers)
+
+        def existing(factory):
+            # Seeded tasks when there are any, otherwise the ones created above.
+            calls = []
+            for _ in range(requests):
+                headers, task_ids = pick()
+                if task_ids:
+                    calls.append(factory(headers, rng.choice(task_ids)))
+                elif created:
+                    calls.append(factory(*rng.choice(created)))
+            return calls
+
+        # login is far slower than the rest (bcrypt), so it gets a tenth of the requests.
+        results["login"] = await drive([login(rng.choice(accounts)[0]) for _ in range(max(1, requests // 10))], concurrency)
+        results["create"] = await drive([create(pick()[0], n) for n in range(requests)], concurrency)
+        results["get"] = await drive(existing(get), concurrency)
+        results["list"] = await drive([page(pick()[0]) for _ in range(requests)], concurrency)
+        results["update"] = await drive(existing(update), concurrency)
+        # Only delete what this run created, so the seeded data stays intact.
+        results["delete"] = await drive([delete(headers, task_id) for headers, task_id in created], concurrency)
+
+    return {
+        "rows": rows,
+        "users": users,
+        "requests": requests,
+        "concurrency": concurrency,
+        "endpoints": results,
+    }
+
+
+def compare(current, baseline, margin: float):
+    """Endpoints that regressed by more than ``margin`` (0.2 = 20%) against ``baseline``."""
+    regressions = []
+    for endpoint, stats in current["endpoints"].items():
+        reference = baseline.get("endpoints", {}).get(endpoint)
+        if not reference:
+            continue
+        for key in LATENCY_KEYS:
+            if stats[key] > reference[key] * (1 + margin):
+                regressions.append(f"{endpoint} {key}: {stats[key]:.2f} > {reference[key]:.2f} (+{margin:.0%})")
+        if stats["per_second"] < reference["per_second"] / (1 + margin):
+            regressions.append(
+                f"{endpoint} per_second: {stats['per_second']:.1f} < {reference['per_second']:.1f} (-{margin:.0%})"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000, help="seeded tasks, e.g. 1000 to 1000000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--profile", default="production", help="TODO_DB_PROFILE for the run")
+    parser.add_argument("--output", type=Path, help="also write the results here, e.g. to use as a baseline")
+    parser.add_argument("--baseline", type=Path, help="fail if this stored run is exceeded by --margin")
+    parser.add_argument("--margin", type=float, default=0.2)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["TODO_DB_PATH"] = str(Path(tmp.name) / "load.db")
+    os.environ["TODO_DB_PROFILE"] = args.profile
+    os.environ.setdefault("TODO_LOG_LEVEL", "WARNING")
+    from core.db import engine, init_db, init_users_table, write_engine
+    from core.writequeue import group_writer
+
+    async def bench():
+        await init_db()
+        await init_users_table()
+        try:
+            return await run(args.rows, args.users, args.requests, args.concurrency)
+        finally:
+            # What the app's lifespan would do on shutdown.
+            await group_writer.stop()
+            await engine.dispose()
+            await write_engine.dispose()
+
+    with tmp:
+        results = asyncio.run(bench())
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.margin)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
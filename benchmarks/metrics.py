@@ -0,0 +1,85 @@
+# benchmarks/metrics.py
+"""Per-request and per-query cost of the metrics instrumentation.
+
+    python -m benchmarks.metrics --requests 20000 --queries 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+from core.metrics import MetricsMiddleware, MetricsRegistry, instrument_engine
+
+
+async def _app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def _receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def _send(message):
+    pass
+
+
+async def time_requests(app, requests: int):
+    scope = {"type": "http", "method": "GET", "path": "/"}
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), _receive, _send)
+    return time.perf_counter() - started
+
+
+def time_queries(engine, queries: int):
+    with engine.connect() as conn:
+        statement = text("SELECT 1")
+        started = time.perf_counter()
+        for _ in range(queries):
+            conn.execute(statement)
+        return time.perf_counter() - started
+
+
+async def run(requests: int, queries: int):
+    bare = await time_requests(_app, requests)
+    wrapped = await time_requests(MetricsMiddleware(_app, MetricsRegistry()), requests)
+
+    # Timed on sync engines: the hooks run on the sync side anyway, and
+    # aiosqlite's per-statement thread hop (~250µs) would drown them in noise.
+    path = os.path.join(tempfile.mkdtemp(prefix="todo-bench-"), "metrics.db")
+    plain_engine = create_engine(f"sqlite:///{path}")
+    hooked_engine = create_engine(f"sqlite:///{path}")
+    instrument_engine(hooked_engine, "bench", MetricsRegistry())
+    try:
+        time_queries(plain_engine, 100)
+        time_queries(hooked_engine, 100)
+        plain = min(time_queries(plain_engine, queries) for _ in range(3))
+        hooked = min(time_queries(hooked_engine, queries) for _ in range(3))
+    finally:
+        plain_engine.dispose()
+        hooked_engine.dispose()
+
+    return {
+        "requests": requests,
+        "middleware_overhead_us": (wrapped - bare) / requests * 1e6,
+        "queries": queries,
+        "query_hook_overhead_us": (hooked - plain) / queries * 1e6,
+        "query_us_without_hooks": plain / queries * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.queries)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/projection.py
+"""Bytes on the wire and latency of full versus projected task lists.
+
+    python -m benchmarks.projection --rows 20000 --limit 200 --requests 200
+
+Fetches the same listing page through the whole app (httpx's ASGI
+transport, response cache off) with every column and with
+``fields=task_id,title,status``, each uncompressed, gzipped and, when the
+brotli package is installed, brotli-compressed. ``wire_bytes`` is the body
+as sent, before the client decodes it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from core.compression import ENCODERS
+
+PROJECTION = "task_id,title,status"
+
+
+async def measure(client, headers, params, encoding: str, requests: int):
+    from benchmarks.common import summarize
+
+    samples, wire_bytes = [], 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with client.stream("GET", "/tasks/api/", params=params,
+                                 headers={**headers, "Accept-Encoding": encoding}) as response:
+            await response.aread()
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+        wire_bytes = response.num_bytes_downloaded
+    return {**summarize(samples), "wire_bytes": wire_bytes}
+
+
+async def run(rows: int, limit: int, requests: int):
+    # Imported here so that main() can configure the app through the
+    # environment before core.db and core.cache are first imported.
+    from app import app
+    from benchmarks.load import PASSWORD, seed
+    from core.db import write_engine
+
+    ((username, _),) = await seed(write_engine, rows, users=1)
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        response = await client.post("/tasks/login", json={"username": username, "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        for variant, fields in (("full", None), ("projected", PROJECTION)):
+            params = {"limit": limit, **({"fields": fields} if fields else {})}
+            for encoding in ("identity", *ENCODERS):
+                await measure(client, headers, params, encoding, 3)  # warm up
+                results[f"{variant}/{encoding}"] = await measure(client, headers, params, encoding, requests)
+    return {"rows": rows, "limit": limit, "requests": requests, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=200, help="tasks per page")
+    parser.add_argument("--requests", type=int, default=200, help="requests per variant")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["TODO_DB_PATH"] = str(Path(tmp.name) / "projection.db")
+    os.environ.setdefault("TODO_DB_PROFILE", "production")
+    os.environ.setdefault("TODO_LOG_LEVEL", "WARNING")
+    # Every request should pay for its query and serialization.
+    os.environ["TODO_CACHE_BACKEND"] = "none"
+    os.environ.setdefault("TODO_BCRYPT_ROUNDS", "4")
+    from core.db import engine, init_db, write_engine
+
+    async def bench():
+        await init_db()
+        try:
+            return await run(args.rows, args.limit, args.requests)
+        finally:
+            await engine.dispose()
+            await write_engine.dispose()
+
+    with tmp:
+        results = asyncio.run(bench())
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/search.py
+"""Full-text search versus a LIKE scan on a seeded table.
+
+    python -m benchmarks.search --rows 200000 --queries 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.common import create_database, stopwatch, summarize, vocabulary
+from core import queries
+
+LIKE_SQL = text(
+    "SELECT * FROM tasks WHERE title LIKE :pattern OR description LIKE :pattern "
+    "ORDER BY created_at DESC, task_id DESC LIMIT :limit"
+)
+
+
+async def run(rows: int, query_count: int, limit: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        read_engine, write_engine = await create_database(Path(tmp) / "bench.db", rows)
+        # Search terms span the frequency range, from common words to rare ones.
+        words = random.Random(1).sample(vocabulary()[:5000], query_count)
+        fts_samples, like_samples = [], []
+        async with AsyncSession(read_engine) as session:
+            for word in words:
+                with stopwatch(fts_samples):
+                    await queries.search_tasks(session, word, limit=limit)
+                with stopwatch(like_samples):
+                    (await session.execute(LIKE_SQL, {"pattern": f"%{word}%", "limit": limit})).fetchall()
+        await read_engine.dispose()
+        await write_engine.dispose()
+
+    fts, like = summarize(fts_samples), summarize(like_samples)
+    return {
+        "rows": rows,
+        "limit": limit,
+        "fts5_bm25": fts,
+        "like_scan": like,
+        "speedup_p50": like["p50_ms"] / fts["p50_ms"] if fts["p50_ms"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.rows, args.queries, args.limit)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
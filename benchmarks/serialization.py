@@ -0,0 +1,77 @@
+# benchmarks/serialization.py
+"""Task page serialization: FastAPI response_model versus the fast paths.
+
+    python -m benchmarks.serialization --sizes 100 10000 100000
+"""
+import argparse
+import asyncio
+import json
+from unittest import mock
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from benchmarks.common import fake_tasks, stopwatch, summarize
+from core import serialization
+from schemas import TaskPage
+
+
+def fake_page(rows: int):
+    """A page of ``rows`` tasks shaped like list_tasks() output."""
+    items = []
+    for task_id, task in enumerate(fake_tasks(rows), start=1):
+        items.append({
+            "task_id": task_id,
+            **task,
+            "created_at": "2025-01-01 12:00:00",
+            "completed_at": None,
+            "updated_at": "2025-01-01 12:00:00.000",
+        })
+    return {"items": items, "next_cursor": None}
+
+
+async def model_path(field, page):
+    # What FastAPI does for a route declaring response_model=TaskPage.
+    content = await serialize_response(field=field, response_content=page)
+    return JSONResponse(content).body
+
+
+def fast_path(mode, page):
+    with mock.patch.object(serialization, "SERIALIZATION", mode):
+        return serialization.render("list_tasks", TaskPage, page).body
+
+
+async def run(sizes, repeat: int):
+    field = create_model_field("response", TaskPage, mode="serialization")
+    results = {}
+    for size in sizes:
+        page = fake_page(size)
+        rounds = max(3, repeat * 1000 // max(size, 1000))
+        samples = {"model": [], "adapter": [], "trusted": []}
+        for _ in range(rounds):
+            with stopwatch(samples["model"]):
+                body = await model_path(field, page)
+            for mode in ("adapter", "trusted"):
+                with stopwatch(samples[mode]):
+                    fast_path(mode, page)
+        summaries = {mode: summarize(values) for mode, values in samples.items()}
+        results[size] = {
+            **summaries,
+            "bytes": len(body),
+            "adapter_speedup_p50": summaries["model"]["p50_ms"] / summaries["adapter"]["p50_ms"],
+            "trusted_speedup_p50": summaries["model"]["p50_ms"] / summaries["trusted"]["p50_ms"],
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.sizes, args.repeat)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/shards.py
+"""Write throughput of the sharded store as the shard count grows.
+
+    python -m benchmarks.shards --shards 1 2 4 8 --writes 4000 --concurrency 64
+
+Every write is its own transaction (one create_task call), issued by
+``--concurrency`` concurrent writers for users spread over all shards.
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import fake_tasks
+from core.shards import ShardedTaskStore, shard_paths
+
+
+async def measure(count: int, writes: int, concurrency: int, users: int, profile: str, shard_key: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ShardedTaskStore(shard_paths(count, Path(tmp) / "bench.db"), profile=profile, shard_key=shard_key)
+        await store.init()
+        tasks = iter(list(fake_tasks(writes, users=users)))
+
+        async def writer():
+            for task in tasks:
+                await store.create_task(**task)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(writer() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        await store.dispose()
+    return {"shards": count, "writes": writes, "seconds": elapsed, "writes_per_second": writes / elapsed}
+
+
+async def run(counts, writes: int, concurrency: int, users: int, profile: str, shard_key: str):
+    results = [await measure(count, writes, concurrency, users, profile, shard_key) for count in counts]
+    base = results[0]["writes_per_second"]
+    for result in results:
+        result["speedup"] = result["writes_per_second"] / base
+    return {"profile": profile, "shard_key": shard_key, "concurrency": concurrency, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writes", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--profile", default="durable", help="engine profile of every shard")
+    parser.add_argument("--shard-key", default="user", choices=("user", "task"))
+    args = parser.parse_args()
+    random.seed(0)
+    result = asyncio.run(run(args.shards, args.writes, args.concurrency, args.users, args.profile, args.shard_key))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# benchmarks/statements.py
+"""Per-call overhead of the query layer and its compiled-statement cache hits.
+
+    python -m benchmarks.statements --rows 10000 --calls 2000 --rounds 5
+
+Calls the ``core.queries`` functions directly (no HTTP, no response cache)
+against a seeded database: single-task reads, filtered listing pages and
+partial updates cycling through every combination of updated fields. Each
+call is mostly Python overhead (building, compiling and dispatching the
+statement), as SQLite answers these from a warm page cache in microseconds.
+The thread hop of the async driver makes single samples noisy, so as with
+timeit the best round's mean (``best_mean_ms``) is the figure to compare.
+Alongside the latencies it reports how often SQLAlchemy found the statement
+already compiled (``cache_hit``). Compare runs with ``--baseline``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.common import STATUSES, create_database, stopwatch, summarize
+from core import queries
+from core.metrics import CACHE_RESULTS
+
+
+def cache_counter(counts: dict):
+    """An after_cursor_execute listener tallying compiled-cache outcomes into ``counts``."""
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            name = CACHE_RESULTS.get(context.cache_hit, "no_key")
+            counts[name] = counts.get(name, 0) + 1
+
+    return count
+
+
+def update_combinations():
+    """Every non-empty subset of the updatable fields, as update_task kwargs."""
+    values = {
+        "title": "Renamed",
+        "description": "Changed",
+        "due_date": "2026-01-01",
+        "priority": 3,
+        "status": "In Progress",
+        "completed_at": "2026-01-02T00:00:00",
+    }
+    for size in range(1, len(queries.UPDATABLE_FIELDS) + 1):
+        for fields in itertools.combinations(queries.UPDATABLE_FIELDS, size):
+            yield {field: values[field] for field in fields}
+
+
+async def measure(name, calls, rounds, operation, engine):
+    samples, means, counts = [], [], {}
+    await operation(0)  # warm up
+    listener = cache_counter(counts)
+    event.listen(engine.sync_engine, "after_cursor_execute", listener)
+    try:
+        for _ in range(rounds):
+            started = len(samples)
+            for n in range(calls):
+                with stopwatch(samples):
+                    await operation(n)
+            means.append(sum(samples[started:]) / calls)
+    finally:
+        event.remove(engine.sync_engine, "after_cursor_execute", listener)
+    # Among cacheable statements: each transaction's BEGIN is plain SQL.
+    cacheable = counts.get("hit", 0) + counts.get("miss", 0)
+    return name, {
+        **summarize(samples),
+        "best_mean_ms": min(means) * 1000,
+        "cache": counts,
+        "hit_ratio": counts.get("hit", 0) / cacheable if cacheable else None,
+    }
+
+
+async def run(rows: int, calls: int, rounds: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        read_engine, write_engine = await create_database(Path(tmp) / "bench.db", rows)
+        updates = list(update_combinations())
+        results = {}
+        async with AsyncSession(read_engine) as reader, AsyncSession(write_engine, expire_on_commit=False) as writer:
+
+            async def get_task(n):
+                await queries.get_task_by_id(reader, n % rows + 1, user_id=1)
+
+            async def list_page(n):
+                filters = ({}, {"status": STATUSES[n % 3]}, {"priority": n % 3 + 1}, {"sort": "due_date"})[n % 4]
+                await queries.list_tasks(reader, limit=20, user_id=1, **filters)
+
+            async def update_task(n):
+                # Left uncommitted (and rolled back below): commits cost the
+                # same either way and would drown out the statement overhead.
+                await queries.update_task(writer, n % rows + 1, user_id=1, commit=False, **updates[n % len(updates)])
+
+            for name, engine, operation in (
+                ("get_task", read_engine, get_task),
+                ("list_tasks", read_engine, list_page),
+                ("update_task", write_engine, update_task),
+            ):
+                key, result = await measure(name, calls, rounds, operation, engine)
+                results[key] = result
+            await writer.rollback()
+        await read_engine.dispose()
+        await write_engine.dispose()
+    return {"rows": rows, "calls": calls, "rounds": rounds, "update_shapes": len(updates), "results": results}
+
+
+def compare(results: dict, baseline: dict):
+    return {
+        name: {
+            "best_mean_ms": (baseline["results"][name]["best_mean_ms"], result["best_mean_ms"]),
+            "hit_ratio": (baseline["results"][name]["hit_ratio"], result["hit_ratio"]),
+        }
+        for name, result in results["results"].items()
+        if name in baseline["results"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--calls", type=int, default=2000, help="calls per operation and round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="results saved by an earlier run, to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.rows, args.calls, args.rounds))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        results["versus_baseline"] = compare(results, json.loads(Path(args.baseline).read_text()))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
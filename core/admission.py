@@ -0,0 +1,397 @@
+# app/core/admission.py
+"""Admission control: rate limits, concurrency limits and load shedding.
+
+Every request to a database-bound route passes ``AdmissionMiddleware``
+before it reaches the router:
+
+1. The client's token bucket for the route must hold a token, or the request
+   is answered 429 at once with ``Retry-After`` set to when the next token
+   arrives. Clients are told apart by the user of an access token already
+   verified in ``auth.token_cache``, else by address. Buckets live in this process or, with
+   ``TODO_RATE_BACKEND=redis``, in Redis so that all workers share them.
+2. It then takes a slot in its route's concurrency pool, ``read`` or
+   ``write`` by default, so a burst of writes queueing on the single writer
+   connection cannot occupy the slots reads need. With no slot free it waits
+   in a bounded FIFO queue; a full queue or a wait past the deadline answers
+   503 with ``Retry-After``. Pools protect this process's connections, so
+   they are always per process.
+
+Routes are named ``"METHOD /path/template"``. ``TODO_ADMISSION_ROUTES`` takes
+a JSON object of per-route overrides: ``pool`` (a pool name, or null to
+exempt the route), ``rate`` (tokens per second, 0 for no limit) and
+``burst``. Counters and gauges are exported on ``/metrics`` and at
+``GET /tasks/api/admission/stats``.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+import auth
+from core.metrics import Histogram, _histogram_lines, _labels
+from utils.logger import logger
+
+ADMISSION_ENABLED = os.getenv("TODO_ADMISSION", "1") == "1"
+READ_CONCURRENCY = int(os.getenv("TODO_READ_CONCURRENCY", "32"))
+WRITE_CONCURRENCY = int(os.getenv("TODO_WRITE_CONCURRENCY", "8"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("TODO_ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("TODO_ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+# Per client and route; 0 turns the default limit off (routes may still set one).
+RATE_LIMIT = float(os.getenv("TODO_RATE_LIMIT", "0"))
+RATE_BURST = float(os.getenv("TODO_RATE_BURST", "0")) or max(1.0, 2 * RATE_LIMIT)
+RATE_BACKEND = os.getenv("TODO_RATE_BACKEND", "memory")  # memory or redis
+RATE_MAX_CLIENTS = int(os.getenv("TODO_RATE_MAX_CLIENTS", "100000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Routes that never queue: probes and scrapes must answer under load, and a
+# change feed stream is open for minutes and would pin a slot throughout.
+DEFAULT_ROUTES = {
+    "GET /health": {"pool": None},
+    "GET /ready": {"pool": None},
+    "GET /metrics": {"pool": None},
+    "GET /tasks/api/events": {"pool": None},
+}
+ROUTES = {**DEFAULT_ROUTES, **json.loads(os.getenv("TODO_ADMISSION_ROUTES", "{}"))}
+
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def take_token(tokens: float, updated: float, now: float, rate: float, burst: float):
+    """Refill a bucket up to ``now`` and take one token.
+
+    Returns the bucket's new token count and 0.0, or, when it is empty, the
+    unchanged count and the seconds until a token will be there.
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryRateLimiter:
+    """Token buckets in a bounded dict; a client pushed out starts with a full bucket."""
+
+    def __init__(self, max_clients: int = RATE_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens, wait = take_token(tokens, updated, now, rate, burst)
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisRateLimiter:
+    """Token buckets in Redis hashes, shared by every worker.
+
+    Each take is an optimistic transaction (WATCH, read, MULTI/EXEC) retried
+    when another worker touched the bucket in between. Redis errors are
+    logged and the request let through, as with the task cache: an
+    unavailable limiter must not take the API down.
+    """
+
+    PREFIX = "admission:bucket:"
+    RETRIES = 5
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str = REDIS_URL):
+        import redis.asyncio as redis
+
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        from redis.exceptions import RedisError, WatchError
+
+        name = self.PREFIX + hashlib.sha1(key.encode()).hexdigest()
+        try:
+            for _ in range(self.RETRIES):
+                try:
+                    async with self.client.pipeline(transaction=True) as pipe:
+                        await pipe.watch(name)
+                        stored, updated = await pipe.hmget(name, "tokens", "updated")
+                        # Wall clock: the buckets are shared between processes.
+                        now = time.time()
+                        if stored is None:
+                            stored, updated = burst, now
+                        tokens, wait = take_token(float(stored), float(updated), now, rate, burst)
+                        pipe.multi()
+                        pipe.hset(name, mapping={"tokens": repr(tokens), "updated": repr(now)})
+                        # Once full again the bucket is the same as no bucket.
+                        pipe.pexpire(name, max(1, math.ceil((burst - tokens) / rate * 1000)))
+                        await pipe.execute()
+                        return wait
+                except WatchError:
+                    continue
+            # Constant contention on one bucket: that client is far over its rate.
+            return 1 / rate
+        except RedisError as e:
+            logger.warning("Rate limiter unavailable: %s", e)
+            return 0.0
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` requests at once; up to ``queue_size`` more wait in FIFO order."""
+
+    def __init__(self, name: str, limit: int, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT_MS / 1000):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+        self.wait_seconds = Histogram()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Take a slot, waiting up to ``timeout``; raises Rejected (503) otherwise."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            raise Rejected(503, "queue_full", self.timeout)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # release() handed us the slot just as we gave up: pass it on.
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected(503, "timeout", self.timeout)
+            raise
+        finally:
+            self.wait_seconds.observe(time.perf_counter() - started)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the next waiter; active is unchanged.
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    def __init__(self, pools, limiter=None, routes=None, rate: float = RATE_LIMIT, burst: float = RATE_BURST):
+        self.pools = {pool.name: pool for pool in pools}
+        self.limiter = limiter or MemoryRateLimiter()
+        self.routes = dict(ROUTES if routes is None else routes)
+        self.rate = rate
+        self.burst = burst
+        self.admitted = {}  # pool -> count
+        self.rejected = {}  # (pool, reason) -> count
+        self._policies = {}
+
+    def policy(self, route: str) -> dict:
+        """Pool, rate and burst for ``"METHOD /template"``, defaults filled in."""
+        policy = self._policies.get(route)
+        if policy is None:
+            override = self.routes.get(route, {})
+            method = route.split(" ", 1)[0]
+            if "rate" in override:
+                # Routes with their own rate get their own bucket.
+                rate, burst, bucket = float(override["rate"]), max(1.0, 2 * float(override["rate"])), route
+            else:
+                rate, burst, bucket = self.rate, self.burst, "default"
+            policy = self._policies[route] = {
+                "pool": override.get("pool", "read" if method in READ_METHODS else "write"),
+                "rate": rate,
+                "burst": float(override.get("burst", burst)),
+                "bucket": bucket,
+            }
+            if policy["pool"] is not None and policy["pool"] not in self.pools:
+                raise ValueError(f"Unknown admission pool {policy['pool']!r} for {route}")
+        return policy
+
+    async def admit(self, route: str, client: str):
+        """Check the rate limit and take a pool slot; returns the pool to release, or None.
+
+        Raises Rejected when the request must be turned away.
+        """
+        policy = self.policy(route)
+        if policy["pool"] is None:
+            return None
+        if policy["rate"] > 0:
+            wait = await self.limiter.take(f"{client}:{policy['bucket']}", policy["rate"], policy["burst"])
+            if wait > 0:
+                self._count_rejection(policy["pool"], "rate")
+                raise Rejected(429, "rate", wait)
+        pool = self.pools[policy["pool"]]
+        try:
+            await pool.acquire()
+        except Rejected as e:
+            self._count_rejection(pool.name, e.reason)
+            raise
+        self.admitted[pool.name] = self.admitted.get(pool.name, 0) + 1
+        return pool
+
+    def _count_rejection(self, pool: str, reason: str):
+        self.rejected[(pool, reason)] = self.rejected.get((pool, reason), 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "limiter": type(self.limiter).__name__,
+            "pools": {
+                name: {
+                    "limit": pool.limit,
+                    "active": pool.active,
+                    "queued": pool.queued,
+                    "queue_size": pool.queue_size,
+                    "admitted": self.admitted.get(name, 0),
+                }
+                for name, pool in self.pools.items()
+            },
+            "rejected": {f"{pool}:{reason}": count for (pool, reason), count in sorted(self.rejected.items())},
+        }
+
+    def metric_lines(self):
+        """Prometheus lines for core.metrics.MetricsRegistry.collectors."""
+        gauges = (
+            ("todo_admission_limit", "Concurrent requests allowed per pool.", lambda pool: pool.limit),
+            ("todo_admission_in_flight", "Requests holding a pool slot.", lambda pool: pool.active),
+            ("todo_admission_queued", "Requests waiting for a pool slot.", lambda pool: pool.queued),
+        )
+        for name, help_text, read in gauges:
+            yield f"# HELP {name} {help_text}"
+            yield f"# TYPE {name} gauge"
+            for pool_name, pool in sorted(self.pools.items()):
+                yield f"{name}{_labels(pool=pool_name)} {read(pool)}"
+        yield "# HELP todo_admission_admitted_total Requests admitted per pool."
+        yield "# TYPE todo_admission_admitted_total counter"
+        for pool_name, count in sorted(self.admitted.items()):
+            yield f"todo_admission_admitted_total{_labels(pool=pool_name)} {count}"
+        yield "# HELP todo_admission_rejected_total Requests turned away, by pool and reason (rate, queue_full, timeout)."
+        yield "# TYPE todo_admission_rejected_total counter"
+        for (pool_name, reason), count in sorted(self.rejected.items()):
+            yield f"todo_admission_rejected_total{_labels(pool=pool_name, reason=reason)} {count}"
+        yield "# HELP todo_admission_queue_wait_seconds Time queued requests waited for a slot."
+        yield "# TYPE todo_admission_queue_wait_seconds histogram"
+        for pool_name, pool in sorted(self.pools.items()):
+            yield from _histogram_lines("todo_admission_queue_wait_seconds", pool.wait_seconds, pool=pool_name)
+
+
+def _token(scope):
+    """The bearer token of a request, or its ``access_token`` cookie."""
+    cookie = None
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+        elif name == b"cookie" and b"access_token=" in value:
+            cookie = value.split(b"access_token=", 1)[1].split(b";", 1)[0].decode("latin-1")
+    return cookie
+
+
+def client_key(scope) -> str:
+    """Who a request counts against: its verified user if any, else its address.
+
+    The middleware runs before authentication, so only tokens the token cache
+    has already verified name a user. Any other token may be made up, and a
+    bucket per token would give a client a fresh bucket per request.
+    """
+    token = _token(scope)
+    if token:
+        payload = auth.token_cache.peek(auth.token_cache.digest(token))
+        if payload is not None and payload.get("typ") == auth.ACCESS_TOKEN and "uid" in payload:
+            return f"user:{payload['uid']}"
+    client = scope.get("client")
+    return "addr:" + (client[0] if client else "unknown")
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware in front of the router; see the module docstring."""
+
+    MAX_CACHED_PATHS = 4096
+
+    def __init__(self, app, controller: "AdmissionController" = None):
+        self.app = app
+        self.controller = controller or admission
+        self._routes = {}
+
+    def _route(self, scope):
+        # Same matching the router does next; cached per concrete path.
+        key = (scope["method"], scope.get("root_path", ""), scope["path"])
+        if key not in self._routes:
+            if len(self._routes) >= self.MAX_CACHED_PATHS:
+                self._routes.clear()
+            found = None
+            for route in scope["app"].router.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    found = route
+                    break
+            self._routes[key] = found
+        return self._routes[key]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope)
+        if route is None or not hasattr(route, "path"):
+            await self.app(scope, receive, send)
+            return
+        try:
+            pool = await self.controller.admit(f"{scope['method']} {route.path}", client_key(scope))
+        except Rejected as e:
+            # Lets MetricsMiddleware label the rejection with its route.
+            scope["route"] = route
+            detail = "Too many requests" if e.status_code == 429 else "Server busy, try again later"
+            response = JSONResponse(
+                {"detail": detail},
+                status_code=e.status_code,
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if pool is not None:
+                pool.release()
+
+
+def build_limiter(name: str = RATE_BACKEND):
+    if name == "memory":
+        return MemoryRateLimiter()
+    if name == "redis":
+        return RedisRateLimiter.from_url()
+    raise ValueError(f"Unknown rate limit backend: {name}")
+
+
+admission = AdmissionController(
+    [ConcurrencyLimiter("read", READ_CONCURRENCY), ConcurrencyLimiter("write", WRITE_CONCURRENCY)],
+    limiter=build_limiter(),
+)
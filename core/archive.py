@@ -0,0 +1,170 @@
+# app/core/archive.py
+"""Hot/cold split of tasks: completed tasks move to ``tasks_archive``.
+
+Listings, indexes and the search index only ever need open and recently
+finished work, so ``TaskArchiver`` moves tasks that have been ``Completed``
+for longer than ``TODO_ARCHIVE_AFTER_DAYS`` out of ``tasks`` into
+``tasks_archive`` (see ``core.db.TASK_ARCHIVE_DDL``). Each batch is one short
+write transaction that copies the rows and deletes them, so other writers
+queue behind at most ``TODO_ARCHIVE_BATCH_SIZE`` rows at a time. After a run
+the freed pages are returned with ``PRAGMA incremental_vacuum``.
+
+Archived tasks are read-only: ``queries.get_task_by_id`` falls through to the
+archive, listings show them with ``include_archived``, a delete removes them,
+but they no longer appear in search or in the stats summary.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+from core.cache import task_cache
+from core.db import TIMESTAMP_MS, WriteSessionLocal
+from utils.logger import logger
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("TODO_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("TODO_ARCHIVE_BATCH_SIZE", "500"))
+# How often the background job runs; 0 turns it off.
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("TODO_ARCHIVE_INTERVAL_SECONDS", "3600"))
+# Free pages handed back per run; 0 means all of them.
+ARCHIVE_VACUUM_PAGES = int(os.getenv("TODO_ARCHIVE_VACUUM_PAGES", "2000"))
+
+ARCHIVE_COLUMNS = (
+    "task_id, title, description, due_date, priority, status, "
+    "created_at, completed_at, user_id, updated_at"
+)
+
+# Matches idx_tasks_completed, so finding a batch never scans open tasks.
+DUE_SQL = text(
+    "SELECT task_id FROM tasks WHERE status = 'Completed' "
+    "AND COALESCE(completed_at, updated_at) < :cutoff "
+    "ORDER BY COALESCE(completed_at, updated_at) LIMIT :limit"
+)
+COPY_SQL = text(
+    f"INSERT INTO tasks_archive ({ARCHIVE_COLUMNS}, archived_at) "
+    f"SELECT {ARCHIVE_COLUMNS}, {TIMESTAMP_MS} FROM tasks WHERE task_id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+REMOVE_SQL = text("DELETE FROM tasks WHERE task_id IN :ids").bindparams(bindparam("ids", expanding=True))
+
+
+def archive_cutoff(after_days: float = ARCHIVE_AFTER_DAYS, now: datetime = None) -> str:
+    # Day granularity: a date prefix compares correctly against timestamps
+    # stored with either a space or a "T" separator.
+    return ((now or datetime.utcnow()) - timedelta(days=after_days)).date().isoformat()
+
+
+class TaskArchiver:
+    def __init__(
+        self,
+        session_factory=WriteSessionLocal,
+        after_days: float = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        interval: float = ARCHIVE_INTERVAL_SECONDS,
+        vacuum_pages: int = ARCHIVE_VACUUM_PAGES,
+    ):
+        self.session_factory = session_factory
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self._worker = None
+        self._loop = None
+        self.runs = 0
+        self.batches = 0
+        self.archived = 0
+        self.pages_freed = 0
+        self.errors = 0
+        self.last_run_seconds = 0.0
+
+    def start(self):
+        """Start the periodic job on the running loop, unless it is off or already running there."""
+        if self.interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None or self._worker.done():
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error("Task archival failed: %s", e)
+
+    async def archive_batch(self, cutoff: str) -> int:
+        """Move up to ``batch_size`` due tasks in one transaction; returns how many."""
+        async with self.session_factory() as session:
+            ids = (await session.execute(DUE_SQL, {"cutoff": cutoff, "limit": self.batch_size})).scalars().all()
+            if ids:
+                await session.execute(COPY_SQL, {"ids": ids})
+                await session.execute(REMOVE_SQL, {"ids": ids})
+            await session.commit()
+        if ids:
+            # Cached copies still show the live row, without archived_at.
+            await task_cache.invalidate(ids)
+        self.batches += bool(ids)
+        self.archived += len(ids)
+        return len(ids)
+
+    async def vacuum(self) -> int:
+        """Return free pages to the filesystem; returns how many were freed.
+
+        A no-op unless the file uses incremental auto-vacuum.
+        """
+        async with self.session_factory() as session:
+            before = (await session.execute(text("PRAGMA freelist_count"))).scalar()
+            await session.execute(text(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})"))
+            after = (await session.execute(text("PRAGMA freelist_count"))).scalar()
+            await session.commit()
+        self.pages_freed += before - after
+        return before - after
+
+    async def run_once(self, now: datetime = None) -> int:
+        """Archive every due task, batch by batch, then vacuum; returns how many moved."""
+        started = time.perf_counter()
+        cutoff = archive_cutoff(self.after_days, now)
+        moved = 0
+        while True:
+            count = await self.archive_batch(cutoff)
+            moved += count
+            if count < self.batch_size:
+                break
+            # Let queued writers in between batches.
+            await asyncio.sleep(0)
+        if moved:
+            await self.vacuum()
+            logger.info("Archived %d completed tasks", moved)
+        self.runs += 1
+        self.last_run_seconds = time.perf_counter() - started
+        return moved
+
+    def stats(self) -> dict:
+        return {
+            "running": self._worker is not None and not self._worker.done(),
+            "after_days": self.after_days,
+            "batch_size": self.batch_size,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "batches": self.batches,
+            "archived": self.archived,
+            "pages_freed": self.pages_freed,
+            "errors": self.errors,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+        }
+
+
+task_archiver = TaskArchiver()
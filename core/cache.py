@@ -0,0 +1,241 @@
+# app/core/cache.py
+"""Read-through cache for task lookups and task listings.
+
+Single tasks are cached under their id and dropped by the write paths in
+``core.queries``. Listing pages depend on many rows, so they are never
+dropped; instead their keys carry the owner's change counter (``task_changes``,
+bumped by triggers on every write to that owner's tasks). A write makes only
+that owner's stale pages unaddressable, and they age out.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from utils.logger import logger
+
+CACHE_BACKEND = os.getenv("TODO_CACHE_BACKEND", "memory")  # memory, redis or none
+CACHE_TTL = float(os.getenv("TODO_CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("TODO_CACHE_MAX_ENTRIES", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class NullBackend:
+    """Backend used when caching is disabled: every lookup is a miss."""
+
+    evictions = 0
+
+    async def get_task(self, task_id):
+        return None
+
+    async def set_task(self, task_id, task):
+        pass
+
+    async def delete_tasks(self, task_ids):
+        pass
+
+    async def get_page(self, key):
+        return None
+
+    async def set_page(self, key, page):
+        pass
+
+
+class LRUBackend:
+    """Bounded in-process LRU with a per-entry TTL, for single-node or test use."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_task(self, task_id):
+        return self._get(("task", task_id))
+
+    async def set_task(self, task_id, task):
+        self._set(("task", task_id), task)
+
+    async def delete_tasks(self, task_ids):
+        for task_id in task_ids:
+            self._entries.pop(("task", task_id), None)
+
+    async def get_page(self, key):
+        return self._get(("page", key))
+
+    async def set_page(self, key, page):
+        self._set(("page", key), page)
+
+
+class RedisBackend:
+    """Redis backend: tasks are stored as hashes, pages as JSON strings.
+
+    Redis errors are logged and treated as misses so that an unavailable
+    cache never fails a request.
+    """
+
+    def __init__(self, client, ttl: float = CACHE_TTL):
+        self.client = client
+        self.ttl = int(ttl)
+        self.evictions = 0  # Redis evicts on its own; see INFO stats there.
+
+    @classmethod
+    def from_url(cls, url: str = REDIS_URL, **kwargs):
+        import redis.asyncio as redis
+
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    async def _call(self, method, *args, default=None):
+        from redis.exceptions import RedisError
+
+        try:
+            return await method(*args)
+        except RedisError as e:
+            logger.warning("Task cache unavailable: %s", e)
+            return default
+
+    async def get_task(self, task_id):
+        fields = await self._call(self.client.hgetall, f"task:{task_id}")
+        if not fields:
+            return None
+        return {field: json.loads(value) for field, value in fields.items()}
+
+    async def set_task(self, task_id, task):
+        async def write():
+            async with self.client.pipeline(transaction=False) as pipe:
+                key = f"task:{task_id}"
+                pipe.hset(key, mapping={field: json.dumps(value, default=str) for field, value in task.items()})
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+
+        await self._call(write)
+
+    async def delete_tasks(self, task_ids):
+        if task_ids:
+            await self._call(self.client.delete, *[f"task:{task_id}" for task_id in task_ids])
+
+    async def get_page(self, key):
+        value = await self._call(self.client.get, f"tasks:page:{key}")
+        return json.loads(value) if value else None
+
+    async def set_page(self, key, page):
+        await self._call(self.client.set, f"tasks:page:{key}", json.dumps(page, default=str), self.ttl)
+
+
+class TaskCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self._loading = {}
+
+    async def get_task(self, task_id, loader):
+        """Return the cached task or ``await loader()`` and cache its result."""
+        task = await self.backend.get_task(task_id)
+        if task is not None:
+            self.hits += 1
+            return task
+        self.misses += 1
+        token = self._loading[task_id] = object()
+        try:
+            task = await loader()
+        finally:
+            # invalidate() drops the token: a write landed while loading and
+            # the row we read may already be stale, so don't cache it.
+            filled = self._loading.get(task_id) is token
+            if filled:
+                del self._loading[task_id]
+        if task is not None and filled:
+            await self.backend.set_task(task_id, task)
+        return task
+
+    async def get_page(self, params: dict, loader):
+        """Return the cached listing page for ``params`` or load and cache it.
+
+        ``params`` must identify the page's data, the owner and their change
+        version included: writes don't drop cached pages.
+        """
+        key = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        page = await self.backend.get_page(key)
+        if page is not None:
+            self.hits += 1
+            return page
+        self.misses += 1
+        page = await loader()
+        await self.backend.set_page(key, page)
+        return page
+
+    @staticmethod
+    def _fragment_key(params: dict) -> str:
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"fragment:{digest}"
+
+    async def get_fragment(self, params: dict):
+        """Return a rendered fragment cached for ``params``, or None.
+
+        As with pages, ``params`` must carry a version of whatever the
+        fragment shows, such as the owner's change counter.
+        """
+        fragment = await self.backend.get_page(self._fragment_key(params))
+        if fragment is None:
+            self.fragment_misses += 1
+        else:
+            self.fragment_hits += 1
+        return fragment
+
+    async def set_fragment(self, params: dict, fragment):
+        await self.backend.set_page(self._fragment_key(params), fragment)
+
+    async def invalidate(self, task_ids=()):
+        """Drop the given tasks; listing pages go stale with their owner's change version."""
+        self.invalidations += 1
+        task_ids = list(task_ids)
+        for task_id in task_ids:
+            self._loading.pop(task_id, None)
+        await self.backend.delete_tasks(task_ids)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+            "fragment_hits": self.fragment_hits,
+            "fragment_misses": self.fragment_misses,
+        }
+
+
+def build_backend(name: str = CACHE_BACKEND):
+    if name == "memory":
+        return LRUBackend()
+    if name == "redis":
+        return RedisBackend.from_url()
+    if name == "none":
+        return NullBackend()
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+task_cache = TaskCache(build_backend())
@@ -0,0 +1,163 @@
+# app/core/compression.py
+"""Negotiated response compression: brotli when installed, else gzip.
+
+``CompressionMiddleware`` compresses responses whose client sent a matching
+``Accept-Encoding``, once they are at least ``TODO_COMPRESS_MIN_BYTES`` long
+(streamed responses, whose length isn't known up front, always qualify).
+Streamed bodies are compressed chunk by chunk and flushed after each one, so
+a page streamed in chunks still renders progressively. Event streams and
+responses that already carry a ``Content-Encoding`` pass through untouched.
+
+A compressed body is a different representation of the same resource, so a
+strong ``ETag`` is downgraded to a weak one; the conditional request
+handling in ``routes`` compares tags weakly and keeps answering 304.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("TODO_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("TODO_GZIP_LEVEL", "6"))
+# 4-5 is brotli's sweet spot for dynamic content: gzip's speed, smaller output.
+BROTLI_QUALITY = int(os.getenv("TODO_BROTLI_QUALITY", "4"))
+
+# Media types never worth compressing here: already compressed, or (event
+# streams) where any buffering would hold events back.
+SKIP_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int = GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int = BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+# Server preference when the client accepts several equally.
+PREFERENCE = ("br", "gzip")
+
+
+def negotiate(accept_encoding: str, available=ENCODERS):
+    """The encoding to use for an ``Accept-Encoding`` header, or None for identity."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    candidates = [
+        name for name in PREFERENCE
+        if name in available and weights.get(name, weights.get("*", 0.0)) > 0
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda name: weights.get(name, weights.get("*", 0.0)))
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware; see the module docstring."""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES, encoders=None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = ENCODERS if encoders is None else encoders
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encoders)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self.app, self.encoders[encoding], self.minimum_size)(scope, receive, send)
+
+
+class _CompressingResponder:
+    def __init__(self, app, encoder_class, minimum_size: int):
+        self.app = app
+        self.encoder_class = encoder_class
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start = None  # held back until we know whether to compress
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "")
+            self.passthrough = "content-encoding" in headers or media_type.startswith(SKIP_TYPES)
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body and len(body) < self.minimum_size:
+                # Small enough that compressing costs more than it saves.
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.encoder = self.encoder_class()
+            headers = MutableHeaders(raw=self.start["headers"])
+            headers["Content-Encoding"] = self.encoder.name
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            if more_body:
+                del headers["content-length"]
+            else:
+                compressed = self.encoder.finish(body)
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            await self.send(self.start)
+
+        chunk = self.encoder.compress(body) if more_body else self.encoder.finish(body)
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
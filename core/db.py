@@ -1,20 +1,124 @@
 # app/core/db.py
+import asyncio
+import os
+from contextlib import AsyncExitStack
 from pathlib import Path
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy import event, text
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-DB_PATH = BASE_DIR / "todo.db"
+DB_PATH = Path(os.getenv("TODO_DB_PATH", BASE_DIR / "todo.db"))
 
 DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    future=True,
-)
+# Engine profiles, selected with TODO_DB_PROFILE.
+#
+# development: one engine for reads and writes with SQL echo, as before.
+# production:  WAL journal plus tuned pragmas, a pool of query-only reader
+#              connections and a single writer connection. Writers queue on
+#              the writer pool instead of fighting over the file lock, and in
+#              WAL mode readers never block behind them.
+ENGINE_PROFILES = {
+    "development": {
+        "echo": True,
+        "pragmas": {},
+        "read_pool_size": 5,
+        "split_writer": False,
+    },
+    "production": {
+        "echo": False,
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,  # KiB
+            "temp_store": "MEMORY",
+        },
+        "read_pool_size": 8,
+        "split_writer": True,
+    },
+}
+# production, but every commit is fsynced before it returns (WAL's NORMAL
+# only syncs at checkpoints, so the last commits can be lost on power loss).
+ENGINE_PROFILES["durable"] = {
+    **ENGINE_PROFILES["production"],
+    "pragmas": {**ENGINE_PROFILES["production"]["pragmas"], "synchronous": "FULL"},
+}
+
+DB_PROFILE = os.getenv("TODO_DB_PROFILE", "development")
+
+
+def _configure(engine, pragmas, query_only=False, begin="BEGIN", path=None):
+    # pysqlite/aiosqlite defer BEGIN until the first DML statement, which
+    # breaks SAVEPOINT handling. Take over transaction control so that every
+    # session transaction starts with a real BEGIN and nested transactions
+    # behave.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        if path is not None and (not os.path.exists(path) or os.path.getsize(path) == 0):
+            # Only possible on a new file, before the journal mode is set: lets
+            # the archiver hand freed pages back a few at a time. Existing
+            # files need a one-off `python -m core.db vacuum`.
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if query_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql(begin)
+
+
+def create_engines(path=DB_PATH, profile: str = DB_PROFILE):
+    """Build the ``(read_engine, write_engine)`` pair for ``profile``.
+
+    Both are the same engine unless the profile splits out the writer.
+    """
+    try:
+        settings = ENGINE_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown database profile: {profile}")
+    url = f"sqlite+aiosqlite:///{path}"
+
+    if not settings["split_writer"]:
+        engine = create_async_engine(
+            url, echo=settings["echo"], future=True, pool_size=settings["read_pool_size"]
+        )
+        _configure(engine, settings["pragmas"], path=path)
+        return engine, engine
+
+    read_engine = create_async_engine(
+        url,
+        echo=settings["echo"],
+        future=True,
+        pool_size=settings["read_pool_size"],
+        max_overflow=0,
+    )
+    # One connection: concurrent writers wait for it in the pool (without
+    # blocking the event loop) instead of hitting "database is locked".
+    write_engine = create_async_engine(
+        url,
+        echo=settings["echo"],
+        future=True,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=60,
+    )
+    _configure(read_engine, settings["pragmas"], query_only=True, path=path)
+    # IMMEDIATE takes the write lock up front, so a transaction never fails
+    # halfway through when upgrading from a read lock.
+    _configure(write_engine, settings["pragmas"], begin="BEGIN IMMEDIATE", path=path)
+    return read_engine, write_engine
+
+
+engine, write_engine = create_engines()
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -22,41 +126,531 @@ AsyncSessionLocal = sessionmaker(
     class_=AsyncSession,
 )
 
-async def init_db():
-    """Initialization of tasks."""
-    async with engine.begin() as conn:
+WriteSessionLocal = sessionmaker(
+    bind=write_engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+)
+
+# Composite indexes backing the keyset-paginated listing. Every one leads
+# with the owner, so a user's listing walks only that user's slice of the
+# index whatever the filter/sort combination.
+TASK_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_created_at ON tasks (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_status_created_at ON tasks (user_id, status, created_at)",
+    # The implicit trailing rowid matches the listing's task_id tie-breaker,
+    # so sort=priority pages straight off the index. A priority filter with
+    # date order walks idx_tasks_user_created_at and skips the other two values.
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_priority ON tasks (user_id, priority)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_due_date ON tasks (user_id, due_date)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_status_due_date ON tasks (user_id, status, due_date)",
+    # Only open tasks, so the overdue count in the stats reads just the
+    # entries it counts. Queries must repeat the WHERE for SQLite to use it.
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_open_due_date ON tasks (user_id, due_date) WHERE status != 'Completed'",
+)
+
+# Indexes superseded by the above: the unscoped ones from before tasks had
+# owners, and a priority index whose created_at column defeated the
+# task_id tie-breaker.
+OBSOLETE_TASK_INDEXES = (
+    "idx_tasks_created_at",
+    "idx_tasks_status_created_at",
+    "idx_tasks_priority_created_at",
+    "idx_tasks_due_date",
+    "idx_tasks_status_due_date",
+    "idx_tasks_user_priority_created_at",
+)
+
+# Millisecond timestamp format of ``tasks.updated_at``.
+TIMESTAMP_MS = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Per-owner change counters behind the list ETags. Every insert, update and
+# delete bumps the owner's row (0 stands for tasks without an owner), so "has
+# anything of mine changed?" is a primary-key lookup instead of a query over
+# the tasks themselves.
+TASK_CHANGES_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS task_changes (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        changed_at TEXT NOT NULL
+    )
+    """,
+    *(
+        f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_changes_{event} AFTER {event.upper()} ON tasks BEGIN
+        INSERT INTO task_changes (user_id, version, changed_at)
+        VALUES (COALESCE({row}.user_id, 0), 1, {TIMESTAMP_MS})
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+        {extra}
+    END
+    """
+        for event, row, extra in (
+            ("insert", "new", ""),
+            ("delete", "old", ""),
+            (
+                "update",
+                "old",
+                # A task that changed owner also changes the new owner's listing.
+                f"""INSERT INTO task_changes (user_id, version, changed_at)
+        SELECT COALESCE(new.user_id, 0), 1, {TIMESTAMP_MS} WHERE new.user_id IS NOT old.user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;""",
+            ),
+        )
+    ),
+)
+
+# Transactional outbox behind the change feed (core.events). The triggers
+# write an event row inside the transaction that changed the task, so an
+# event exists exactly when its write committed, whichever code path made it.
+# AUTOINCREMENT keeps event ids from being reused after old events are pruned,
+# which is what lets consumers resume from an id.
+TASK_EVENT_FIELDS = (
+    "task_id", "title", "description", "due_date", "priority",
+    "status", "created_at", "completed_at", "user_id", "updated_at",
+)
+
+
+def _event_payload(row: str) -> str:
+    return "json_object(" + ", ".join(f"'{field}', {row}.{field}" for field in TASK_EVENT_FIELDS) + ")"
+
+
+def _insert_event(op: str, row: str, payload: str, where: str = "") -> str:
+    return f"""INSERT INTO task_events (user_id, task_id, op, payload, created_at)
+        SELECT COALESCE({row}.user_id, 0), {row}.task_id, '{op}', {payload}, {TIMESTAMP_MS}{where};"""
+
+
+TASK_EVENTS_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS task_events (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        task_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+    # Resuming a user's feed reads that user's events after an id.
+    "CREATE INDEX IF NOT EXISTS idx_task_events_user ON task_events (user_id, event_id)",
+    # How far each durable sink (e.g. Kafka) has been fed.
+    """
+    CREATE TABLE IF NOT EXISTS task_event_offsets (
+        sink TEXT PRIMARY KEY,
+        event_id INTEGER NOT NULL
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_events_insert AFTER INSERT ON tasks BEGIN
+        {_insert_event("created", "new", _event_payload("new"))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_events_delete AFTER DELETE ON tasks BEGIN
+        {_insert_event("deleted", "old", "json_object('task_id', old.task_id)")}
+    END
+    """,
+    # A task handed to another owner leaves the old owner's feed as a delete.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_events_update AFTER UPDATE ON tasks BEGIN
+        {_insert_event("deleted", "old", "json_object('task_id', old.task_id)", " WHERE new.user_id IS NOT old.user_id")}
+        {_insert_event("updated", "new", _event_payload("new"))}
+    END
+    """,
+)
+
+# Task counts per owner, status and priority, kept current by triggers so
+# GET /tasks/api/stats reads a handful of rows whatever the table size.
+# NULL status/priority count under '' and 0, a missing owner under 0.
+TASK_STATS_KEY = "COALESCE({row}.user_id, 0), COALESCE({row}.status, ''), COALESCE({row}.priority, 0)"
+TASK_STATS_MATCH = (
+    "user_id = COALESCE({row}.user_id, 0) AND status = COALESCE({row}.status, '') "
+    "AND priority = COALESCE({row}.priority, 0)"
+)
+
+
+def _count_task(row: str) -> str:
+    return f"""INSERT INTO task_stats (user_id, status, priority, task_count)
+        VALUES ({TASK_STATS_KEY.format(row=row)}, 1)
+        ON CONFLICT (user_id, status, priority) DO UPDATE SET task_count = task_count + 1;"""
+
+
+def _uncount_task(row: str) -> str:
+    match = TASK_STATS_MATCH.format(row=row)
+    return f"""UPDATE task_stats SET task_count = task_count - 1 WHERE {match};
+        DELETE FROM task_stats WHERE {match} AND task_count <= 0;"""
+
+
+TASK_STATS_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS task_stats (
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        task_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, status, priority)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_stats_insert AFTER INSERT ON tasks BEGIN
+        {_count_task("new")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_stats_delete AFTER DELETE ON tasks BEGIN
+        {_uncount_task("old")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_stats_update AFTER UPDATE OF user_id, status, priority ON tasks
+    WHEN old.user_id IS NOT new.user_id OR old.status IS NOT new.status OR old.priority IS NOT new.priority
+    BEGIN
+        {_uncount_task("old")}
+        {_count_task("new")}
+    END
+    """,
+)
+
+# What task_stats should hold, computed from the tasks themselves.
+TASK_STATS_FROM_TASKS = """
+    SELECT COALESCE(user_id, 0) AS user_id, COALESCE(status, '') AS status,
+           COALESCE(priority, 0) AS priority, COUNT(*) AS task_count
+    FROM tasks GROUP BY 1, 2, 3
+"""
+
+# Full-text index over title/description. It is an external-content FTS5
+# table: the text lives only in ``tasks`` and the triggers keep the index in
+# step with every insert, update and delete.
+TASK_SEARCH_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description,
+        content='tasks', content_rowid='task_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, title, description)
+        VALUES (new.task_id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+        VALUES ('delete', old.task_id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+        VALUES ('delete', old.task_id, old.title, old.description);
+        INSERT INTO tasks_fts (rowid, title, description)
+        VALUES (new.task_id, new.title, new.description);
+    END
+    """,
+)
+
+# Cold storage for completed tasks (see core.archive). Same columns as tasks
+# plus when the row was moved; task ids are never reused (AUTOINCREMENT), so
+# the two tables never hold the same id and can be read as one.
+TASK_ARCHIVE_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS tasks_archive (
+        task_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        due_date DATE,
+        priority INTEGER,
+        status TEXT,
+        created_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        user_id INTEGER,
+        updated_at TIMESTAMP,
+        archived_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_created_at ON tasks_archive (user_id, created_at)",
+    # What the archiver scans for: completed tasks by completion time, falling
+    # back to the last write for tasks completed without a completed_at.
+    "CREATE INDEX IF NOT EXISTS idx_tasks_completed ON tasks (COALESCE(completed_at, updated_at)) "
+    "WHERE status = 'Completed'",
+    # A task moved to the archive is not deleted as far as the change feed is
+    # concerned: it is announced once as "archived" instead.
+    "DROP TRIGGER IF EXISTS tasks_events_delete",
+    f"""
+    CREATE TRIGGER tasks_events_delete AFTER DELETE ON tasks BEGIN
+        {_insert_event("deleted", "old", "json_object('task_id', old.task_id)",
+                       " WHERE NOT EXISTS (SELECT 1 FROM tasks_archive WHERE task_id = old.task_id)")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_archive_events_insert AFTER INSERT ON tasks_archive BEGIN
+        {_insert_event("archived", "new", _event_payload("new"))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_archive_events_delete AFTER DELETE ON tasks_archive BEGIN
+        {_insert_event("deleted", "old", "json_object('task_id', old.task_id)")}
+    END
+    """,
+    # Listings that include archived tasks are versioned by task_changes too.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tasks_archive_changes_delete AFTER DELETE ON tasks_archive BEGIN
+        INSERT INTO task_changes (user_id, version, changed_at)
+        VALUES (COALESCE(old.user_id, 0), 1, {TIMESTAMP_MS})
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+    END
+    """,
+)
+
+USERS_DDL = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+async def _add_column(conn, table: str, column: str, definition: str):
+    """Add ``column`` to ``table`` unless it is already there; True if added."""
+    result = await conn.execute(text(f"PRAGMA table_info({table})"))
+    if column in {row[1] for row in result}:
+        return False
+    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    return True
+
+
+async def _create_users(conn):
+    await conn.execute(text(USERS_DDL))
+
+
+async def _create_tasks(conn):
+    await conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                description TEXT,
+                due_date DATE,
+                priority INTEGER DEFAULT 2, -- 1=Low, 2=Medium, 3=High
+                status TEXT DEFAULT 'Pending', -- Pending, In Progress, Completed
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP,
+                user_id INTEGER REFERENCES users (id),
+                updated_at TIMESTAMP
+            )
+            """
+        )
+    )
+
+
+async def _add_task_owner(conn):
+    await _add_column(conn, "tasks", "user_id", "INTEGER REFERENCES users (id)")
+
+
+async def _add_task_updated_at(conn):
+    if await _add_column(conn, "tasks", "updated_at", "TIMESTAMP"):
+        # ALTER TABLE can't add a non-constant default; the write paths
+        # set updated_at explicitly and existing rows start at created_at.
         await conn.execute(
             text(
-                """
-                CREATE TABLE IF NOT EXISTS tasks (
-                    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    due_date DATE,
-                    priority INTEGER DEFAULT 2, -- 1=Low, 2=Medium, 3=High
-                    status TEXT DEFAULT 'Pending', -- Pending, In Progress, Completed
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP
-                )
-                """
+                "UPDATE tasks SET updated_at = "
+                f"COALESCE(strftime('%Y-%m-%d %H:%M:%f', created_at), {TIMESTAMP_MS})"
             )
         )
 
-async def init_users_table():
-    """Initialization of users table."""
-    async with engine.begin() as conn:
-        await conn.execute(
+
+async def _create_task_changes(conn):
+    for statement in TASK_CHANGES_DDL:
+        await conn.execute(text(statement))
+
+
+async def _create_task_indexes(conn):
+    for name in OBSOLETE_TASK_INDEXES:
+        await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for statement in TASK_INDEXES:
+        await conn.execute(text(statement))
+
+
+async def _table_exists(conn, name: str) -> bool:
+    existing = await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+    )
+    return existing.first() is not None
+
+
+async def _create_search_index(conn):
+    search_index_exists = await _table_exists(conn, "tasks_fts")
+    for statement in TASK_SEARCH_DDL:
+        await conn.execute(text(statement))
+    if not search_index_exists:
+        # Index the rows of a database created before search existed.
+        await conn.execute(text("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')"))
+
+
+async def _create_task_events(conn):
+    for statement in TASK_EVENTS_DDL:
+        await conn.execute(text(statement))
+
+
+async def _create_task_archive(conn):
+    for statement in TASK_ARCHIVE_DDL:
+        await conn.execute(text(statement))
+
+
+async def _create_task_stats(conn):
+    stats_exist = await _table_exists(conn, "task_stats")
+    for statement in TASK_STATS_DDL:
+        await conn.execute(text(statement))
+    if not stats_exist:
+        # Count the rows of a database created before the summary existed.
+        await conn.execute(text(f"INSERT INTO task_stats {TASK_STATS_FROM_TASKS}"))
+
+
+# Schema migrations, applied in order by migrate(). A database records the
+# last one it has run in PRAGMA user_version, so startup skips everything it
+# has already seen. Each step is also idempotent on its own (IF NOT EXISTS,
+# column checks), because databases created before versioning start at 0
+# with some of the schema already in place. Append new steps; never edit or
+# renumber released ones.
+MIGRATIONS = (
+    (1, "users table", _create_users),
+    (2, "tasks table", _create_tasks),
+    (3, "tasks.user_id", _add_task_owner),
+    (4, "tasks.updated_at", _add_task_updated_at),
+    (5, "per-user change counters", _create_task_changes),
+    (6, "listing indexes", _create_task_indexes),
+    (7, "full-text search", _create_search_index),
+    (8, "change feed outbox", _create_task_events),
+    (9, "stats summary", _create_task_stats),
+    (10, "task archive", _create_task_archive),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+async def schema_version(bind=None) -> int:
+    async with (bind or write_engine).connect() as conn:
+        return (await conn.execute(text("PRAGMA user_version"))).scalar()
+
+
+async def migrate(bind=None) -> list:
+    """Bring the database up to SCHEMA_VERSION; returns the versions applied.
+
+    Every step commits together with its new user_version, and the version is
+    re-read inside the transaction, so an interrupted run resumes where it
+    stopped and two processes starting at once don't apply a step twice.
+    """
+    bind = bind or write_engine
+    if await schema_version(bind) >= SCHEMA_VERSION:
+        return []
+    applied = []
+    for version, _, step in MIGRATIONS:
+        async with bind.begin() as conn:
+            if (await conn.execute(text("PRAGMA user_version"))).scalar() >= version:
+                continue
+            await step(conn)
+            # PRAGMA takes no bound parameters; version is one of ours.
+            await conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+        applied.append(version)
+    return applied
+
+
+async def init_db(bind=None):
+    """Initialization of tasks: runs every pending migration."""
+    return await migrate(bind)
+
+
+async def warm_pool(bind=None) -> int:
+    """Open every pooled connection of ``bind`` and ping it; returns how many.
+
+    All of them are held at once so the pool really has that many distinct
+    connections (connect pragmas applied, file opened) when they go back.
+    """
+    bind = bind or engine
+    size = bind.sync_engine.pool.size()
+    async with AsyncExitStack() as stack:
+        connections = [await stack.enter_async_context(bind.connect()) for _ in range(size)]
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in connections))
+    return size
+
+
+async def assign_task_owner(username: str, bind=None) -> int:
+    """Give every task without an owner to ``username``; returns the row count.
+
+    Tasks created before ownership existed have a NULL ``user_id`` and are not
+    visible through the API until they are assigned.
+    """
+    async with (bind or write_engine).begin() as conn:
+        user_id = (
+            await conn.execute(text("SELECT id FROM users WHERE username = :username"), {"username": username})
+        ).scalar()
+        if user_id is None:
+            raise ValueError(f"Unknown user: {username}")
+        result = await conn.execute(
+            text("UPDATE tasks SET user_id = :user_id WHERE user_id IS NULL"), {"user_id": user_id}
+        )
+        return result.rowcount
+
+
+async def rebuild_search_index(bind=None):
+    """Rebuild the full-text index from the tasks table."""
+    async with (bind or write_engine).begin() as conn:
+        await conn.execute(text("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')"))
+
+
+async def check_task_stats(bind=None):
+    """Compare task_stats with a recount of the tasks.
+
+    Returns ``(user_id, status, priority, stored, actual)`` for every key
+    that disagrees; an empty list means the summary is consistent.
+    """
+    async with (bind or write_engine).connect() as conn:
+        result = await conn.execute(
             text(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
+                f"""
+                WITH actual AS ({TASK_STATS_FROM_TASKS})
+                SELECT a.user_id, a.status, a.priority, s.task_count, a.task_count
+                FROM actual a LEFT JOIN task_stats s USING (user_id, status, priority)
+                WHERE s.task_count IS NOT a.task_count
+                UNION ALL
+                SELECT s.user_id, s.status, s.priority, s.task_count, 0
+                FROM task_stats s LEFT JOIN actual a USING (user_id, status, priority)
+                WHERE a.task_count IS NULL
                 """
             )
         )
+        return [tuple(row) for row in result]
+
+
+async def rebuild_task_stats(bind=None):
+    """Recount task_stats from scratch."""
+    async with (bind or write_engine).begin() as conn:
+        await conn.execute(text("DELETE FROM task_stats"))
+        await conn.execute(text(f"INSERT INTO task_stats {TASK_STATS_FROM_TASKS}"))
+
+
+async def vacuum(bind=None):
+    """Switch the file to incremental auto-vacuum and rebuild it (one-off, slow).
+
+    VACUUM cannot run inside a transaction, so this goes around the session
+    machinery on a raw connection.
+    """
+    async with (bind or write_engine).connect() as conn:
+        raw = await conn.get_raw_connection()
+        cursor = await raw.driver_connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await cursor.close()
+        cursor = await raw.driver_connection.execute("VACUUM")
+        await cursor.close()
+
+
+async def init_users_table(bind=None):
+    """Initialization of users table."""
+    async with (bind or write_engine).begin() as conn:
+        await _create_users(conn)
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
@@ -65,6 +659,31 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def get_write_session() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency that provides a session on the writer connection."""
+    async with WriteSessionLocal() as session:
+        yield session
+
+
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(init_users_table())
\ No newline at end of file
+    import sys
+
+    async def main():
+        await migrate()
+        args = sys.argv[1:]
+        if "rebuild-search" in args:
+            await rebuild_search_index()
+        if "check-stats" in args:
+            mismatches = await check_task_stats()
+            for user_id, status, priority, stored, actual in mismatches:
+                print(f"user {user_id} status {status!r} priority {priority}: stored {stored}, actual {actual}")
+            print(f"{len(mismatches)} task_stats rows out of step")
+        if "rebuild-stats" in args:
+            await rebuild_task_stats()
+        if "vacuum" in args:
+            await vacuum()
+        if "assign-owner" in args:
+            username = args[args.index("assign-owner") + 1]
+            print(f"Assigned {await assign_task_owner(username)} tasks to {username}")
+
+    asyncio.run(main())
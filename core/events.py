@@ -0,0 +1,374 @@
+# app/core/events.py
+"""Task change feed: outbox relay, in-process broker and sinks.
+
+Every task write leaves a row in ``task_events`` in its own transaction (see
+``core.db.TASK_EVENTS_DDL``). ``OutboxRelay`` reads new rows in batches and
+hands them to the sinks (Kafka when ``TODO_KAFKA_BOOTSTRAP`` is set) and to
+``EventBroker``, which fans them out to the open ``GET /tasks/api/events``
+streams. Streams that resume from an event id, or fall behind, read the gap
+straight from the table, so the broker itself keeps no history.
+
+Delivery is at least once: a sink failure leaves the batch unpublished and
+it is retried on the next poll, and consumers skip ids they have seen.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, event, text
+
+from core.db import AsyncSessionLocal, WriteSessionLocal, write_engine
+from utils.logger import logger
+
+EVENTS_POLL_MS = float(os.getenv("TODO_EVENTS_POLL_MS", "250"))
+EVENTS_BATCH_SIZE = int(os.getenv("TODO_EVENTS_BATCH_SIZE", "500"))
+EVENTS_RETENTION_HOURS = float(os.getenv("TODO_EVENTS_RETENTION_HOURS", "24"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("TODO_EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_SUBSCRIBER_QUEUE = int(os.getenv("TODO_EVENTS_SUBSCRIBER_QUEUE", "1000"))
+KAFKA_BOOTSTRAP = os.getenv("TODO_KAFKA_BOOTSTRAP")
+KAFKA_TOPIC = os.getenv("TODO_KAFKA_TOPIC", "todo.task-events")
+
+# Old events are pruned at most this often.
+PRUNE_INTERVAL_SECONDS = 60
+
+EVENTS_AFTER_SQL = text(
+    "SELECT event_id, user_id, task_id, op, payload, created_at FROM task_events "
+    "WHERE event_id > :after ORDER BY event_id LIMIT :limit"
+)
+USER_EVENTS_AFTER_SQL = text(
+    "SELECT event_id, user_id, task_id, op, payload, created_at FROM task_events "
+    "WHERE user_id = :user_id AND event_id > :after ORDER BY event_id LIMIT :limit"
+)
+HEAD_SQL = text("SELECT COALESCE(MAX(event_id), 0) FROM task_events")
+OFFSETS_SQL = text("SELECT MIN(event_id) FROM task_event_offsets WHERE sink IN :sinks").bindparams(
+    bindparam("sinks", expanding=True)
+)
+
+
+def _event(row) -> dict:
+    event_id, user_id, task_id, op, payload, created_at = row
+    return {
+        "event_id": event_id,
+        "user_id": user_id,
+        "task_id": task_id,
+        "op": op,
+        "task": json.loads(payload),
+        "created_at": created_at,
+    }
+
+
+async def load_events(session, after: int, user_id: int = None, limit: int = EVENTS_BATCH_SIZE):
+    """Events with an id above ``after``, oldest first, optionally for one user."""
+    params = {"after": after, "limit": limit}
+    if user_id is None:
+        result = await session.execute(EVENTS_AFTER_SQL, params)
+    else:
+        result = await session.execute(USER_EVENTS_AFTER_SQL, {**params, "user_id": user_id})
+    return [_event(row) for row in result.fetchall()]
+
+
+class Subscription:
+    def __init__(self, user_id: int, max_queue: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def reset(self):
+        """Forget queued events; the caller re-reads them from the table."""
+        self.overflowed = False
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class EventBroker:
+    """Fans relayed events out to the subscribed streams of their owner."""
+
+    def __init__(self, max_queue: int = EVENTS_SUBSCRIBER_QUEUE):
+        self.max_queue = max_queue
+        self._subscribers = {}  # user_id -> set of Subscription
+        self.published = 0
+        self.overflows = 0
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.max_queue)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, events):
+        self.published += len(events)
+        for item in events:
+            for subscription in self._subscribers.get(item["user_id"], ()):
+                if subscription.overflowed:
+                    continue
+                try:
+                    subscription.queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    # The stream catches up from the table instead.
+                    subscription.overflowed = True
+                    self.overflows += 1
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class KafkaSink:
+    """Publishes events to a Kafka topic, keyed by owner to keep per-user order.
+
+    Takes any object with kafka-python's ``send(topic, key=, value=)`` and
+    ``flush()``; ``from_env`` builds a real ``KafkaProducer``.
+    """
+
+    name = "kafka"
+
+    def __init__(self, producer, topic: str = KAFKA_TOPIC, timeout: float = 30):
+        self.producer = producer
+        self.topic = topic
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, bootstrap: str = KAFKA_BOOTSTRAP, **kwargs):
+        from kafka import KafkaProducer
+
+        return cls(KafkaProducer(bootstrap_servers=bootstrap.split(","), acks="all", linger_ms=5), **kwargs)
+
+    def _send(self, events):
+        futures = [
+            self.producer.send(
+                self.topic,
+                key=str(item["user_id"]).encode(),
+                value=json.dumps(item, default=str).encode(),
+            )
+            for item in events
+        ]
+        self.producer.flush()
+        for future in futures:
+            future.get(timeout=self.timeout)  # raises if the broker refused it
+
+    async def publish(self, events):
+        # kafka-python blocks; keep it off the event loop.
+        await asyncio.get_running_loop().run_in_executor(None, self._send, events)
+
+
+def build_sinks():
+    return [KafkaSink.from_env()] if KAFKA_BOOTSTRAP else []
+
+
+class OutboxRelay:
+    def __init__(
+        self,
+        broker: EventBroker,
+        sinks=(),
+        read_session_factory=AsyncSessionLocal,
+        write_session_factory=WriteSessionLocal,
+        batch_size: int = EVENTS_BATCH_SIZE,
+        poll_interval: float = EVENTS_POLL_MS / 1000,
+        retention_hours: float = EVENTS_RETENTION_HOURS,
+    ):
+        self.broker = broker
+        self.sinks = list(sinks)
+        self.read_session_factory = read_session_factory
+        self.write_session_factory = write_session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention_hours = retention_hours
+        self.position = None
+        self._worker = None
+        self._loop = None
+        self._wake = None
+        self._pruned_at = 0.0
+        self.batches = 0
+        self.relayed = 0
+        self.errors = 0
+        self.pruned = 0
+        self.lag_events = 0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def start(self):
+        """Start the relay on the running loop unless it is already running there."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None or self._worker.done():
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+    def notify(self):
+        """Poll now rather than at the next interval (called after commits)."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._wake is not None and running is self._loop:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                relayed = await self.relay_once()
+                if not relayed:
+                    await self._prune()
+            except Exception as e:
+                self.errors += 1
+                relayed = 0
+                logger.error("Event relay failed: %s", e)
+            if relayed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def _initial_position(self, session) -> int:
+        if self.sinks:
+            # Durable sinks continue where they stopped before a restart.
+            stored = (
+                await session.execute(OFFSETS_SQL, {"sinks": [sink.name for sink in self.sinks]})
+            ).scalar()
+            if stored is not None:
+                return stored
+        # The broker only serves live streams, which read history themselves.
+        return (await session.execute(HEAD_SQL)).scalar()
+
+    async def relay_once(self) -> int:
+        """Relay the next batch; returns how many events it carried."""
+        async with self.read_session_factory() as session:
+            if self.position is None:
+                self.position = await self._initial_position(session)
+            events = await load_events(session, self.position, limit=self.batch_size)
+            head = (await session.execute(HEAD_SQL)).scalar() if events else self.position
+        if not events:
+            self.lag_events = 0
+            self.lag_seconds = 0.0
+            return 0
+
+        for sink in self.sinks:
+            await sink.publish(events)
+        self.broker.publish(events)
+        self.position = events[-1]["event_id"]
+        if self.sinks:
+            await self._store_offsets()
+
+        self.batches += 1
+        self.relayed += len(events)
+        self.lag_events = head - self.position
+        waited = datetime.utcnow() - datetime.fromisoformat(events[0]["created_at"])
+        self.lag_seconds = max(0.0, waited.total_seconds())
+        self.max_lag_seconds = max(self.max_lag_seconds, self.lag_seconds)
+        return len(events)
+
+    async def _store_offsets(self):
+        async with self.write_session_factory() as session:
+            await session.execute(
+                text(
+                    "INSERT INTO task_event_offsets (sink, event_id) VALUES (:sink, :event_id) "
+                    "ON CONFLICT (sink) DO UPDATE SET event_id = excluded.event_id"
+                ),
+                [{"sink": sink.name, "event_id": self.position} for sink in self.sinks],
+            )
+            await session.commit()
+
+    async def _prune(self):
+        """Delete relayed events older than the retention period."""
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL_SECONDS or self.position is None:
+            return
+        self._pruned_at = now
+        async with self.write_session_factory() as session:
+            result = await session.execute(
+                text(
+                    "DELETE FROM task_events WHERE event_id <= :position "
+                    "AND created_at < strftime('%Y-%m-%d %H:%M:%f', 'now', :age)"
+                ),
+                {"position": self.position, "age": f"-{self.retention_hours * 3600:.0f} seconds"},
+            )
+            await session.commit()
+        self.pruned += result.rowcount
+
+    def stats(self):
+        return {
+            "running": self._worker is not None and not self._worker.done(),
+            "position": self.position,
+            "batches": self.batches,
+            "relayed": self.relayed,
+            "avg_batch_size": self.relayed / self.batches if self.batches else 0.0,
+            "lag_events": self.lag_events,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "errors": self.errors,
+            "pruned": self.pruned,
+            "sinks": [sink.name for sink in self.sinks],
+            "subscribers": self.broker.subscriber_count(),
+            "subscriber_overflows": self.broker.overflows,
+        }
+
+
+def sse_frame(item: dict) -> str:
+    return f"id: {item['event_id']}\nevent: {item['op']}\ndata: {json.dumps(item, default=str)}\n\n"
+
+
+async def event_stream(
+    user_id: int,
+    after: int = None,
+    broker: EventBroker = None,
+    session_factory=AsyncSessionLocal,
+    heartbeat: float = EVENTS_HEARTBEAT_SECONDS,
+):
+    """Yield ``user_id``'s events as Server-Sent Events frames.
+
+    With ``after`` the stream first replays the stored events past that id,
+    then continues live; without it, it starts with the next change.
+    """
+    broker = broker or event_broker
+    subscription = broker.subscribe(user_id)
+    last = after or 0
+    catching_up = after is not None
+    try:
+        while True:
+            if catching_up or subscription.overflowed:
+                # Subscribed first and cleared before reading, so anything
+                # committed meanwhile is either in the read or in the queue.
+                subscription.reset()
+                async with session_factory() as session:
+                    backlog = await load_events(session, last, user_id=user_id)
+                for item in backlog:
+                    yield sse_frame(item)
+                    last = item["event_id"]
+                catching_up = len(backlog) == EVENTS_BATCH_SIZE
+                continue
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if item["event_id"] > last:
+                yield sse_frame(item)
+                last = item["event_id"]
+    finally:
+        broker.unsubscribe(subscription)
+
+
+event_broker = EventBroker()
+outbox_relay = OutboxRelay(event_broker, sinks=build_sinks())
+
+
+@event.listens_for(write_engine.sync_engine, "commit")
+def _wake_relay(conn):
+    outbox_relay.notify()
@@ -0,0 +1,137 @@
+# app/core/hashing.py
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (hundreds of milliseconds at production cost),
+so hashing and verification run in a small thread pool; bcrypt releases the
+GIL while it works. A semaphore caps how many run at once, and callers past
+the cap wait in line without blocking the loop. Rows still holding a
+plaintext password (from before hashing) verify by comparison and are
+flagged for rehashing.
+"""
+import asyncio
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("TODO_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("TODO_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_CONCURRENCY = int(os.getenv("TODO_HASH_MAX_CONCURRENCY", str(HASH_WORKERS)))
+
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(BCRYPT_PREFIXES)
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        rounds: int = BCRYPT_ROUNDS,
+        workers: int = HASH_WORKERS,
+        max_concurrency: int = HASH_MAX_CONCURRENCY,
+    ):
+        self.rounds = rounds
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._semaphore = None
+        self._loop = None
+        self._dummy_hash = None
+        self.waiting = 0
+        self.max_waiting = 0
+        self.running = 0
+        self.hashes = 0
+        self.verifications = 0
+        self.rehashes = 0
+        self.completed = 0
+        self.wait_total = 0.0
+        self.work_total = 0.0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        enqueued = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        acquired = False
+        try:
+            async with self._semaphore:
+                acquired = True
+                self.waiting -= 1
+                started = time.perf_counter()
+                self.wait_total += started - enqueued
+                self.running += 1
+                try:
+                    return await loop.run_in_executor(self._executor, func, *args)
+                finally:
+                    self.running -= 1
+                    self.completed += 1
+                    self.work_total += time.perf_counter() - started
+        finally:
+            if not acquired:
+                self.waiting -= 1
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.rounds)).decode()
+
+    async def hash(self, password: str) -> str:
+        self.hashes += 1
+        return await self._run(self._hash, password)
+
+    def needs_rehash(self, stored: str) -> bool:
+        if not is_hashed(stored):
+            return True
+        return int(stored.split("$")[2]) != self.rounds
+
+    async def verify(self, password: str, stored: str) -> bool:
+        """Check ``password`` against a stored bcrypt hash or legacy plaintext."""
+        self.verifications += 1
+        if not is_hashed(stored):
+            return hmac.compare_digest(password.encode(), stored.encode())
+        return await self._run(bcrypt.checkpw, password.encode(), stored.encode())
+
+    async def verify_and_update(self, password: str, stored: str):
+        """Verify ``password`` and return ``(ok, new_hash)``.
+
+        ``new_hash`` is set when the password checked out but ``stored`` is
+        plaintext or uses another cost, and should replace the stored value.
+        """
+        if not await self.verify(password, stored):
+            return False, None
+        if not self.needs_rehash(stored):
+            return True, None
+        self.rehashes += 1
+        return True, await self.hash(password)
+
+    async def verify_missing_user(self, password: str) -> bool:
+        """Spend a verification's worth of time for a username that doesn't exist.
+
+        Keeps login timing from revealing which usernames are registered.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = await self.hash("not a real password")
+        await self.verify(password, self._dummy_hash)
+        return False
+
+    def stats(self):
+        completed = self.completed
+        return {
+            "rounds": self.rounds,
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "hashes": self.hashes,
+            "verifications": self.verifications,
+            "rehashes": self.rehashes,
+            "avg_queue_wait_ms": self.wait_total / completed * 1000 if completed else 0.0,
+            "avg_work_ms": self.work_total / completed * 1000 if completed else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,244 @@
+# app/core/metrics.py
+"""Request, query and pool metrics, exposed in Prometheus text format.
+
+``MetricsMiddleware`` times every HTTP request by route template (never the
+raw path, so ids don't explode the label set). ``instrument_engine`` hooks
+SQLAlchemy's cursor events to time statements by their SQL with bound
+values already replaced by placeholders, and tallies whether each statement
+came out of the engine's compiled cache. Everything is recorded on the event
+loop thread into plain dicts and counters: a request costs a couple of
+``perf_counter`` calls and a bisect.
+"""
+import bisect
+import re
+import time
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.engine import default
+
+# Upper bounds in seconds, as in the Prometheus client defaults plus finer
+# steps at the low end where SQLite statements land.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ExecutionContext.cache_hit values. "no_key" is SQL sent as a plain string
+# (exec_driver_sql, e.g. the BEGIN of each transaction), which has nothing
+# to cache.
+CACHE_RESULTS = {
+    default.CACHE_HIT: "hit",
+    default.CACHE_MISS: "miss",
+    default.CACHING_DISABLED: "disabled",
+    default.NO_CACHE_KEY: "no_key",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.requests = {}  # (method, route, status) -> count
+        self.request_latency = {}  # (method, route) -> Histogram
+        self.query_latency = {}  # statement -> Histogram
+        self.query_errors = {}  # statement -> count
+        self.engines = {}  # name -> Engine
+        self.compiled_cache = {}  # (engine name, result) -> count
+        self.collectors = []  # callables yielding more exposition lines
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.request_latency.get((method, route))
+        if histogram is None:
+            histogram = self.request_latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_query(self, statement: str, seconds: float):
+        histogram = self.query_latency.get(statement)
+        if histogram is None:
+            histogram = self.query_latency[statement] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_compiled(self, engine: str, cache_hit):
+        key = (engine, CACHE_RESULTS.get(cache_hit, "no_key"))
+        self.compiled_cache[key] = self.compiled_cache.get(key, 0) + 1
+
+    def compiled_cache_stats(self) -> dict:
+        """Per engine: statements by cache outcome, the hit ratio among cacheable ones, and cache fill."""
+        result = {}
+        for name, engine in sorted(self.engines.items()):
+            counts = {outcome: self.compiled_cache.get((name, outcome), 0) for outcome in CACHE_RESULTS.values()}
+            cacheable = counts["hit"] + counts["miss"]
+            cache = engine._compiled_cache
+            result[name] = {
+                **counts,
+                "hit_ratio": counts["hit"] / cacheable if cacheable else None,
+                "entries": len(cache) if cache is not None else 0,
+                "capacity": cache.capacity if cache is not None else 0,
+            }
+        return result
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = [
+            "# HELP todo_http_requests_total HTTP requests by route template and status.",
+            "# TYPE todo_http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f"todo_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+        lines += [
+            "# HELP todo_http_request_duration_seconds HTTP request latency by route template.",
+            "# TYPE todo_http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self.request_latency.items()):
+            lines += _histogram_lines("todo_http_request_duration_seconds", histogram, method=method, route=route)
+        lines += [
+            "# HELP todo_db_query_duration_seconds SQL statement latency by normalized statement.",
+            "# TYPE todo_db_query_duration_seconds histogram",
+        ]
+        for statement, histogram in sorted(self.query_latency.items()):
+            lines += _histogram_lines("todo_db_query_duration_seconds", histogram, statement=statement)
+        lines += [
+            "# HELP todo_db_query_errors_total SQL statements that raised, by normalized statement.",
+            "# TYPE todo_db_query_errors_total counter",
+        ]
+        for statement, count in sorted(self.query_errors.items()):
+            lines.append(f"todo_db_query_errors_total{_labels(statement=statement)} {count}")
+        lines += [
+            "# HELP todo_db_compiled_cache_total Statements executed, by compiled-cache outcome.",
+            "# TYPE todo_db_compiled_cache_total counter",
+        ]
+        for (engine_name, outcome), count in sorted(self.compiled_cache.items()):
+            lines.append(f"todo_db_compiled_cache_total{_labels(engine=engine_name, result=outcome)} {count}")
+        lines += [
+            "# HELP todo_db_compiled_cache_entries Compiled statements held by the engine's cache.",
+            "# TYPE todo_db_compiled_cache_entries gauge",
+        ]
+        for engine_name, engine in sorted(self.engines.items()):
+            cache = engine._compiled_cache
+            lines.append(f"todo_db_compiled_cache_entries{_labels(engine=engine_name)} {len(cache) if cache is not None else 0}")
+        for name, help_text, read in POOL_GAUGES:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for engine_name, engine in sorted(self.engines.items()):
+                lines.append(f"{name}{_labels(engine=engine_name)} {read(engine.pool)}")
+        for collect in self.collectors:
+            lines += collect()
+        return "\n".join(lines) + "\n"
+
+
+POOL_GAUGES = (
+    ("todo_db_pool_size", "Configured connections per pool.", lambda pool: pool.size()),
+    ("todo_db_pool_checked_out", "Connections currently in use.", lambda pool: pool.checkedout()),
+    ("todo_db_pool_checked_in", "Idle connections held by the pool.", lambda pool: pool.checkedin()),
+    ("todo_db_pool_overflow", "Connections open beyond the pool size.", lambda pool: pool.overflow()),
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: Histogram, **labels):
+    for bound, total in histogram.cumulative():
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        yield f"{name}_bucket{_labels(**labels, le=le)} {total}"
+    yield f"{name}_sum{_labels(**labels)} {histogram.sum}"
+    yield f"{name}_count{_labels(**labels)} {histogram.count}"
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(statement: str) -> str:
+    """Collapse whitespace and expanded IN lists so one query shape is one label."""
+    statement = " ".join(statement.split())
+    return re.sub(r"\(\?(?:, \?)+\)", "(?, ...)", statement)
+
+
+metrics = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: no request/response objects, just the scope."""
+
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the (shared) scope.
+            route = scope.get("route")
+            self.registry.observe_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - started,
+            )
+
+
+def instrument_engine(engine, name: str, registry: MetricsRegistry = metrics):
+    """Time every statement run on ``engine`` and report its pool as ``name``.
+
+    Takes an ``AsyncEngine`` or a plain ``Engine``; the events live on the
+    sync engine either way.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if any(existing is sync_engine for existing in registry.engines.values()):
+        return
+    registry.engines[name] = sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        registry.observe_query(normalize_sql(statement), time.perf_counter() - started)
+        if context is not None:
+            registry.observe_compiled(name, context.cache_hit)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+        statement = exception_context.statement
+        if statement:
+            key = normalize_sql(statement)
+            registry.query_errors[key] = registry.query_errors.get(key, 0) + 1
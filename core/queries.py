@@ -1,35 +1,333 @@
 # app/core/queries.py
-from sqlalchemy import text
+import base64
+import functools
+import html
+import json
+import re
+from datetime import date
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from core import statements
+from core.cache import task_cache
 
+# Columns a task listing may be ordered by. ``task_id`` is always appended as
+# a tie-breaker so that (sort column, task_id) is unique and usable as a keyset.
+SORT_COLUMNS = ("created_at", "due_date", "priority")
+DEFAULT_SORT = "-created_at"
 
-async def create_task(session: AsyncSession,title: str,description: str = "",due_date: str = None,priority: int = 2,status: str = "Pending",):
-    result = await session.execute(text("""INSERT INTO tasks 
-                        (title, description, due_date, priority, status)
-                        VALUES (:title, :description, :due_date, :priority, :status)
-                        """),{"title": title,
+# Number of rows sent to the driver per executemany() call by the bulk API.
+BULK_BATCH_SIZE = 500
+
+TASK_FIELDS = ("title", "description", "due_date", "priority", "status")
+UPDATABLE_FIELDS = TASK_FIELDS + ("completed_at",)
+# Every column of ``tasks``, in table order; e.g. the CSV export header.
+TASK_COLUMNS = ("task_id",) + TASK_FIELDS + ("created_at", "completed_at", "user_id", "updated_at")
+
+# Every task function takes ``user_id``: when given, the statement only sees
+# that user's tasks (and new tasks are owned by them). None means unscoped,
+# for maintenance scripts and tests; the API always passes the caller's id.
+# The statements themselves come from core.statements, picked by shape.
+
+
+def _key_params(task_id, user_id, expected_updated_at=None) -> dict:
+    params = {"id": task_id}
+    if user_id is not None:
+        params["owner_id"] = user_id
+    if expected_updated_at is not None:
+        params["expected_updated_at"] = expected_updated_at
+    return params
+
+
+def _shaped(keys, rows):
+    """Rows as dicts, zipped against the column names fetched once per result.
+
+    About twice as fast as ``dict(row._mapping)`` per row on wide pages.
+    """
+    keys = tuple(keys)
+    return [dict(zip(keys, row)) for row in rows]
+
+
+async def create_task(session: AsyncSession,title: str,description: str = "",due_date: str = None,priority: int = 2,status: str = "Pending",user_id: int = None,commit: bool = True,):
+    """Insert a task and return the stored row in the same statement.
+
+    With ``commit=False`` the caller owns the transaction and the cache
+    invalidation, as for the other write functions.
+    """
+    result = await session.execute(statements.INSERT_TASK,{"title": title,
                         "description": description,
                         "due_date": due_date,
                         "priority": priority,
                         "status": status,
+                        "user_id": user_id,
                     },
                 )
-    await session.commit()
-    return result.lastrowid
+    row = result.fetchone()
+    if commit:
+        await session.commit()
+        await task_cache.invalidate()
+    return dict(row._mapping)
 
 
 
-async def get_all_tasks(session: AsyncSession):
-    result = await session.execute(text("SELECT * FROM tasks ORDER BY created_at DESC"))
-    rows = result.fetchall()
-    return [dict(row._mapping) for row in rows]
+async def get_all_tasks(session: AsyncSession, user_id: int = None):
+    result = await session.execute(statements.select_tasks(user_id is not None), {"owner_id": user_id})
+    return _shaped(result.keys(), result.fetchall())
 
 
-async def get_task_by_id(session: AsyncSession, task_id: int):
-    result = await session.execute(text("SELECT * FROM tasks WHERE task_id = :task_id"),
-        {"task_id": task_id},)
-    row = result.fetchone()
-    return dict(row._mapping) if row else None
+def parse_fields(fields) -> tuple:
+    """Normalize a ``fields=`` projection: a comma-separated string or a sequence of column names.
+
+    Returns the columns in table order, always including ``task_id`` (rows
+    need their identity, and cursors are built from it), or None for every
+    column. Raises ValueError for unknown columns.
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(fields) - set(TASK_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    wanted = set(fields) | {"task_id"}
+    return tuple(column for column in TASK_COLUMNS if column in wanted)
+
+
+def parse_sort(sort: str = DEFAULT_SORT):
+    """Split ``sort`` ("created_at", "-priority", ...) into (column, descending)."""
+    descending = sort.startswith("-")
+    column = sort.lstrip("-")
+    if column not in SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {column}")
+    return column, descending
+
+
+def _encode_token(payload) -> str:
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _decode_token(token: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise ValueError("Malformed cursor")
+
+
+def encode_cursor(sort: str, row: dict) -> str:
+    column, _ = parse_sort(sort)
+    return _encode_token([sort, row[column], row["task_id"]])
+
+
+def decode_cursor(cursor: str, sort: str):
+    """Return the (sort value, task_id) position encoded in ``cursor``."""
+    try:
+        cursor_sort, value, task_id = _decode_token(cursor)
+        task_id = int(task_id)
+    except (ValueError, TypeError):
+        raise ValueError("Malformed cursor")
+    if cursor_sort != sort:
+        raise ValueError("Cursor was issued for a different sort order")
+    return value, task_id
+
+
+def _filter_params(**filters) -> dict:
+    """The given filters as statement parameters; their names make up the statement's shape."""
+    params = {name: value for name, value in filters.items() if value is not None}
+    for name in ("due_from", "due_to"):
+        if name in params:
+            params[name] = str(params[name])
+    return params
+
+
+async def list_tasks(
+    session: AsyncSession,
+    limit: int = 50,
+    cursor: str = None,
+    sort: str = DEFAULT_SORT,
+    status: str = None,
+    priority: int = None,
+    due_from: str = None,
+    due_to: str = None,
+    user_id: int = None,
+    include_archived: bool = False,
+    fields=None,
+):
+    """Fetch one page of tasks using keyset pagination.
+
+    Returns ``(tasks, next_cursor)``; ``next_cursor`` is None on the last page.
+    Raises ValueError for an unknown sort column, field or an invalid cursor.
+    With ``include_archived`` archived tasks are listed too, with their
+    ``archived_at`` set (None on live tasks). ``fields`` (see parse_fields)
+    narrows the SELECT itself, so unwanted columns are never read off the
+    table or shipped through the driver.
+    """
+    column, descending = parse_sort(sort)
+    fields = parse_fields(fields)
+    # The sort column is read even when not wanted: the cursor is built from it.
+    columns = None if fields is None else tuple(dict.fromkeys(fields + (column,)))
+    params = _filter_params(status=status, priority=priority, due_from=due_from, due_to=due_to)
+    filters = tuple(params)
+    params["limit"] = limit + 1
+    if user_id is not None:
+        params["owner_id"] = user_id
+    cursor_shape = None
+    if cursor:
+        value, params["id"] = decode_cursor(cursor, sort)
+        params["cursor_value"] = value
+        cursor_shape = "null" if value is None else "value"
+
+    statement = statements.list_tasks(
+        columns, column, descending, include_archived, filters, cursor_shape, user_id is not None
+    )
+    result = await session.execute(statement, params)
+    tasks = _shaped(result.keys(), result.fetchall())
+
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(sort, tasks[-1])
+    if fields is not None and column not in fields:
+        for task in tasks:
+            del task[column]
+    return tasks, next_cursor
+
+
+async def stream_tasks(session: AsyncSession, status: str = None, priority: int = None, chunk_size: int = 500, user_id: int = None):
+    """Yield lists of task dicts from a server-side cursor, ``chunk_size`` rows at a time.
+
+    Rows are never materialised all at once, so memory stays flat however
+    large the table is.
+    """
+    params = _filter_params(status=status, priority=priority)
+    statement = statements.stream_tasks(tuple(params), user_id is not None)
+    if user_id is not None:
+        params["owner_id"] = user_id
+    result = await session.stream(
+        statement,
+        params,
+        execution_options={"yield_per": chunk_size},
+    )
+    keys = result.keys()
+    async for partition in result.partitions(chunk_size):
+        yield _shaped(keys, partition)
+
+
+# Snippet markers: control characters that cannot appear in escaped text, so
+# snippets can be HTML-escaped first and highlighted afterwards.
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def fts_query(q: str) -> str:
+    """Turn free text into an FTS5 query: all words must match, the last as a prefix.
+
+    Words are quoted so that FTS5 operators and punctuation typed by users
+    are matched literally instead of raising syntax errors.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        raise ValueError("Search query has no searchable words")
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+async def search_tasks(session: AsyncSession, q: str, limit: int = 20, cursor: str = None, user_id: int = None):
+    """Full-text search over title and description, best bm25 match first.
+
+    Title hits weigh more than description hits. Each result carries its
+    ``rank`` and HTML-safe ``title_snippet``/``description_snippet`` with the
+    matched terms wrapped in <mark>. Returns ``(results, next_cursor)``.
+    """
+    match = fts_query(q)
+    params = {
+        "match": match,
+        "mark_start": _MARK_START,
+        "mark_end": _MARK_END,
+        "limit": limit + 1,
+    }
+    if user_id is not None:
+        params["owner_id"] = user_id
+    offset = 0
+    if cursor:
+        try:
+            cursor_match, offset = _decode_token(cursor)
+            offset = int(offset)
+        except (ValueError, TypeError):
+            raise ValueError("Malformed cursor")
+        if cursor_match != match:
+            raise ValueError("Cursor was issued for a different search")
+
+    params["offset"] = offset
+
+    result = await session.execute(statements.search_tasks(user_id is not None), params)
+    hits = []
+    for row in result.fetchall():
+        hit = dict(row._mapping)
+        hit["title_snippet"] = _highlight(hit["title_snippet"])
+        hit["description_snippet"] = _highlight(hit["description_snippet"])
+        hits.append(hit)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = _encode_token([match, offset + limit])
+    return hits, next_cursor
+
+
+async def get_change_version(session: AsyncSession, user_id: int = None):
+    """Return ``(version, changed_at)`` of the owner's tasks without reading them.
+
+    ``version`` grows with every write to the owner's tasks (``None`` means
+    the unowned ones); ``changed_at`` is None while nothing has been written.
+    """
+    row = (await session.execute(statements.CHANGE_VERSION, {"owner_id": user_id or 0})).fetchone()
+    return (row.version, row.changed_at) if row else (0, None)
+
+
+async def get_task_stats(session: AsyncSession, user_id: int = None, today: date = None):
+    """Counts of the owner's tasks in total, by status, by priority and overdue.
+
+    The totals come from the trigger-maintained ``task_stats`` summary. A task
+    is overdue when its due date has passed and it is not Completed.
+    """
+    by_status, by_priority, total = {}, {}, 0
+    result = await session.execute(statements.TASK_STATS, {"owner_id": user_id or 0})
+    for status, priority, count in result:
+        by_status[status] = by_status.get(status, 0) + count
+        by_priority[priority] = by_priority.get(priority, 0) + count
+        total += count
+    overdue = (
+        await session.execute(
+            statements.OVERDUE_COUNT, {"owner_id": user_id or 0, "today": str(today or date.today())}
+        )
+    ).scalar()
+    return {"total": total, "by_status": by_status, "by_priority": by_priority, "overdue": overdue}
+
+
+async def get_task_by_id(session: AsyncSession, task_id: int, user_id: int = None):
+    """The task, looked up in the archive when it is not live; None if in neither.
+
+    Archived tasks come back with their ``archived_at`` set.
+    """
+    params = _key_params(task_id, user_id)
+    for table in ("tasks", "tasks_archive"):
+        result = await session.execute(statements.select_task(table, user_id is not None), params)
+        row = result.fetchone()
+        if row:
+            return dict(row._mapping)
+    return None
+
+
+async def is_archived(session: AsyncSession, task_id: int, user_id: int = None) -> bool:
+    result = await session.execute(statements.archived_task_exists(user_id is not None), _key_params(task_id, user_id))
+    return result.first() is not None
 
 
 async def update_task(
@@ -41,40 +339,189 @@ async def update_task(
     priority: int = None,
     status: str = None,
     completed_at: str = None,
+    user_id: int = None,
+    expected_updated_at: str = None,
+    commit: bool = True,
 ):
-    fields = []
-    params = {"task_id": task_id}
-
-    if title is not None:
-        fields.append("title = :title")
-        params["title"] = title
-    if description is not None:
-        fields.append("description = :description")
-        params["description"] = description
-    if due_date is not None:
-        fields.append("due_date = :due_date")
-        params["due_date"] = due_date
-    if priority is not None:
-        fields.append("priority = :priority")
-        params["priority"] = priority
-    if status is not None:
-        fields.append("status = :status")
-        params["status"] = status
-    if completed_at is not None:
-        fields.append("completed_at = :completed_at")
-        params["completed_at"] = completed_at
+    """Apply the non-None fields and return the updated row.
 
+    Returns None when the task does not exist, there is nothing to update,
+    or ``expected_updated_at`` is given and no longer matches the row.
+    """
+    values = {"title": title, "description": description, "due_date": due_date,
+              "priority": priority, "status": status, "completed_at": completed_at}
+    # In UPDATABLE_FIELDS order, so each combination maps to one statement.
+    fields = tuple(field for field in UPDATABLE_FIELDS if values[field] is not None)
     if not fields:
-        return False
+        return None
 
-    query = f"UPDATE tasks SET {', '.join(fields)} WHERE task_id = :task_id"
-    await session.execute(text(query), params)
-    await session.commit()
-    return True
+    statement = statements.update_task(fields, user_id is not None, expected_updated_at is not None)
+    params = _key_params(task_id, user_id, expected_updated_at)
+    params.update((field, values[field]) for field in fields)
+    result = await session.execute(statement, params)
+    row = result.fetchone()
+    if row is None:
+        return None
+    if commit:
+        await session.commit()
+        await task_cache.invalidate([task_id])
+    return dict(row._mapping)
 
 
-async def delete_task(session: AsyncSession, task_id: int):
-    await session.execute(text("DELETE FROM tasks WHERE task_id = :task_id"),
-                            {"task_id": task_id},)
-    await session.commit()
-    return True
+async def delete_task(session: AsyncSession, task_id: int, user_id: int = None, expected_updated_at: str = None, commit: bool = True):
+    """Delete a live or archived task; returns False when it did not exist (or ``expected_updated_at`` did not match)."""
+    params = _key_params(task_id, user_id, expected_updated_at)
+    for table in ("tasks", "tasks_archive"):
+        statement = statements.delete_task(table, user_id is not None, expected_updated_at is not None)
+        result = await session.execute(statement, params)
+        deleted = result.fetchone() is not None
+        if deleted:
+            break
+    if commit:
+        await session.commit()
+        if deleted:
+            await task_cache.invalidate([task_id])
+    return deleted
+
+
+# Bulk operations. Items are handled in batches of ``batch_size`` rows, each
+# batch being a single executemany() call, and the whole request is committed
+# once at the end.
+
+
+async def _existing_ids(session: AsyncSession, batch, user_id):
+    """Ids of the batch that exist and, when scoped, belong to ``user_id``.
+
+    Only these ids reach the UPDATE/DELETE statements, which is what scopes
+    the bulk writes to the owner.
+    """
+    params = {"ids": [item["task_id"] for _, item in batch]}
+    if user_id is None:
+        result = await session.execute(statements.EXISTING_IDS, params)
+    else:
+        result = await session.execute(statements.OWNED_IDS, {**params, "owner_id": user_id})
+    return {row[0] for row in result}
+
+
+async def _bulk_insert(session: AsyncSession, batch, user_id):
+    params = [
+        {
+            "title": item["title"],
+            "description": item.get("description", ""),
+            "due_date": item.get("due_date"),
+            "priority": item.get("priority", 2),
+            "status": item.get("status", "Pending"),
+            "user_id": user_id,
+        }
+        for _, item in batch
+    ]
+    # Ids come back from RETURNING rather than being inferred from
+    # last_insert_rowid(): nothing guarantees AUTOINCREMENT hands a batch one
+    # contiguous block (triggers, shards reseeding sqlite_sequence).
+    result = await session.execute(statements.INSERT_TASK_IDS, params)
+    task_ids = result.scalars().all()
+    return [
+        {"index": index, "task_id": task_id, "status": "created"}
+        for (index, _), task_id in zip(batch, task_ids)
+    ]
+
+
+def _has_changes(item) -> bool:
+    return any(item.get(field) is not None for field in UPDATABLE_FIELDS)
+
+
+async def _bulk_update(session: AsyncSession, batch, user_id):
+    existing = await _existing_ids(session, batch, user_id)
+    params = [
+        {**{field: item.get(field) for field in UPDATABLE_FIELDS}, "id": item["task_id"]}
+        for _, item in batch
+        if item["task_id"] in existing and _has_changes(item)
+    ]
+    if params:
+        await session.execute(statements.BULK_UPDATE, params)
+    results = []
+    for index, item in batch:
+        if item["task_id"] not in existing:
+            status = "not_found"
+        elif not _has_changes(item):
+            status = "noop"
+        else:
+            status = "updated"
+        results.append({"index": index, "task_id": item["task_id"], "status": status})
+    return results
+
+
+async def _bulk_delete(session: AsyncSession, batch, user_id):
+    existing = await _existing_ids(session, batch, user_id)
+    results, params = [], []
+    for index, item in batch:
+        task_id = item["task_id"]
+        # Only the first of repeated ids deletes a row; the rest find none.
+        if task_id in existing:
+            existing.discard(task_id)
+            params.append({"id": task_id})
+            status = "deleted"
+        else:
+            status = "not_found"
+        results.append({"index": index, "task_id": task_id, "status": status})
+    if params:
+        await session.execute(statements.BULK_DELETE, params)
+    return results
+
+
+async def _run_batch(session: AsyncSession, apply, batch, atomic: bool):
+    if atomic:
+        return await apply(session, batch)
+    try:
+        async with session.begin_nested():
+            return await apply(session, batch)
+    except SQLAlchemyError as e:
+        if len(batch) == 1:
+            index, item = batch[0]
+            return [{"index": index, "task_id": item.get("task_id"), "status": "failed", "detail": str(getattr(e, "orig", None) or e)}]
+        # Retry one item per savepoint to isolate the rows that failed.
+        results = []
+        for entry in batch:
+            results.extend(await _run_batch(session, apply, [entry], atomic))
+        return results
+
+
+async def bulk_write(
+    session: AsyncSession,
+    creates=(),
+    updates=(),
+    deletes=(),
+    batch_size: int = BULK_BATCH_SIZE,
+    atomic: bool = True,
+    user_id: int = None,
+):
+    """Apply creates, partial updates and deletes in a single transaction.
+
+    ``creates`` and ``updates`` are task dicts (updates carry ``task_id``),
+    ``deletes`` are task ids. With ``atomic`` any database error rolls back
+    the whole request and is re-raised; otherwise each batch runs in a
+    savepoint and failing items are reported individually as "failed".
+    Returns per-item results keyed "created", "updated" and "deleted".
+    """
+    operations = (
+        ("created", list(creates), functools.partial(_bulk_insert, user_id=user_id)),
+        ("updated", list(updates), functools.partial(_bulk_update, user_id=user_id)),
+        ("deleted", [{"task_id": task_id} for task_id in deletes], functools.partial(_bulk_delete, user_id=user_id)),
+    )
+    results = {}
+    try:
+        for key, items, apply in operations:
+            results[key] = []
+            for start in range(0, len(items), batch_size):
+                batch = list(enumerate(items[start:start + batch_size], start))
+                results[key].extend(await _run_batch(session, apply, batch, atomic))
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    await task_cache.invalidate(
+        result["task_id"]
+        for result in results["updated"] + results["deleted"]
+        if result["status"] in ("updated", "deleted")
+    )
+    return results
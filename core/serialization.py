@@ -0,0 +1,70 @@
+# app/core/serialization.py
+"""Response serialization modes for the task routes.
+
+``model``    return the data and let FastAPI validate it against the route's
+             ``response_model`` and encode it with the stdlib JSON encoder.
+``adapter``  validate and dump to JSON bytes in one pydantic-core call through
+             a cached ``TypeAdapter``; same output as ``model``.
+``trusted``  skip validation: the rows come straight from our own queries, so
+             encode them as they are with orjson. Timestamps keep SQLite's
+             "YYYY-MM-DD HH:MM:SS" form instead of ISO 8601's "T" separator.
+
+``TODO_SERIALIZATION`` sets the default mode; ``TODO_SERIALIZATION_ROUTES``
+overrides it per route, e.g. ``list_tasks=trusted,get_task=model``.
+"""
+import os
+from functools import lru_cache
+
+import orjson
+from fastapi import Response
+from pydantic import TypeAdapter
+
+SERIALIZATION_MODES = ("model", "adapter", "trusted")
+SERIALIZATION = os.getenv("TODO_SERIALIZATION", "adapter")
+
+
+def _parse_routes(value: str):
+    routes = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        route, _, mode = entry.partition("=")
+        routes[route.strip()] = mode.strip()
+    return routes
+
+
+ROUTE_SERIALIZATION = _parse_routes(os.getenv("TODO_SERIALIZATION_ROUTES", ""))
+
+for _mode in (SERIALIZATION, *ROUTE_SERIALIZATION.values()):
+    if _mode not in SERIALIZATION_MODES:
+        raise ValueError(f"Unknown serialization mode: {_mode}")
+
+
+def mode_for(route: str) -> str:
+    return ROUTE_SERIALIZATION.get(route, SERIALIZATION)
+
+
+@lru_cache(maxsize=None)
+def adapter_for(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def render(route: str, model, data, headers: dict = None, declared: bool = True):
+    """Return ``data`` the way ``route``'s mode prescribes.
+
+    In ``model`` mode the data itself is returned for FastAPI to serialize
+    (headers must then be set on the injected response); the other modes
+    return a finished ``Response`` carrying ``headers``. ``declared=False``
+    says ``model`` is not the route's ``response_model`` (e.g. a projection),
+    so FastAPI can't be left to validate: ``model`` mode then behaves like
+    ``adapter``.
+    """
+    mode = mode_for(route)
+    if mode == "model" and not declared:
+        mode = "adapter"
+    if mode == "model":
+        return data
+    if mode == "adapter":
+        adapter = adapter_for(model)
+        body = adapter.dump_json(adapter.validate_python(data))
+    else:
+        body = orjson.dumps(data, default=str)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,231 @@
+# app/core/shards.py
+"""Tasks partitioned across several SQLite files.
+
+Each shard is a complete task database (tables, triggers, indexes) with its
+own reader and writer engines, so N shards can commit N transactions at once
+where a single file allows one. Task ids stay globally unique by giving each
+shard its own id range: shard ``i`` hands out ``i << SHARD_ID_BITS`` and up,
+so the shard of any task is ``task_id >> SHARD_ID_BITS`` and point lookups,
+updates and deletes go to exactly one file. Shard 0's range starts at 0, so an
+existing ``todo.db`` can serve as shard 0 unchanged.
+
+``shard_key`` decides where new tasks go:
+
+``user``  a user's tasks all live on shard ``user_id % N``; everything scoped
+          to one user reads a single shard.
+``task``  new tasks are spread round-robin, so even one busy user's writes use
+          every shard; user-scoped reads then fan out.
+
+Reads that span shards run on all of them concurrently (``asyncio.gather``)
+and are merged: listings on their (sort value, task_id) keyset, which stays
+valid across shards, search on bm25 rank, stats by summing. bm25 weighs terms
+by per-shard statistics, so cross-shard search order is approximate.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import queries
+from core.db import DB_PATH, DB_PROFILE, create_engines, init_db
+
+SHARD_COUNT = int(os.getenv("TODO_SHARDS", "1"))
+SHARD_KEY = os.getenv("TODO_SHARD_KEY", "user")  # user or task
+
+# 2**53 / 2**40 = 8192 shards of a trillion ids each, and every id still fits
+# a JavaScript number.
+SHARD_ID_BITS = 40
+MAX_SHARDS = 1 << (53 - SHARD_ID_BITS)
+
+
+def shard_paths(count: int = SHARD_COUNT, path=DB_PATH):
+    """``todo.db``, ``todo.shard1.db``, ``todo.shard2.db``, ... for ``count`` shards."""
+    path = Path(path)
+    return [path] + [path.with_name(f"{path.stem}.shard{n}{path.suffix}") for n in range(1, count)]
+
+
+def shard_of(task_id: int) -> int:
+    return task_id >> SHARD_ID_BITS
+
+
+def _sort_key(column: str):
+    # SQLite puts NULLs first ascending and last descending, which is what
+    # this key gives with and without heapq.merge(reverse=True).
+    return lambda row: (row[column] is not None, row[column], row["task_id"])
+
+
+class Shard:
+    def __init__(self, number: int, path, profile: str = DB_PROFILE):
+        self.number = number
+        self.path = path
+        self.read_engine, self.write_engine = create_engines(path, profile=profile)
+
+    def reader(self) -> AsyncSession:
+        return AsyncSession(self.read_engine, expire_on_commit=False)
+
+    def writer(self) -> AsyncSession:
+        return AsyncSession(self.write_engine, expire_on_commit=False)
+
+
+class ShardedTaskStore:
+    def __init__(self, paths, profile: str = DB_PROFILE, shard_key: str = SHARD_KEY):
+        if not 1 <= len(paths) <= MAX_SHARDS:
+            raise ValueError(f"Shard count must be between 1 and {MAX_SHARDS}")
+        if shard_key not in ("user", "task"):
+            raise ValueError(f"Unknown shard key: {shard_key}")
+        self.shards = [Shard(number, path, profile) for number, path in enumerate(paths)]
+        self.shard_key = shard_key
+        self._next_shard = itertools.cycle(range(len(self.shards)))
+
+    async def init(self):
+        """Create or migrate every shard and reserve its id range."""
+        for shard in self.shards:
+            await init_db(shard.write_engine)
+            base = shard.number << SHARD_ID_BITS
+            async with shard.write_engine.begin() as conn:
+                highest = (await conn.execute(text("SELECT MAX(task_id) FROM tasks"))).scalar()
+                if highest is not None and shard_of(highest) != shard.number:
+                    raise ValueError(f"{shard.path} holds task ids outside shard {shard.number}'s range")
+                await conn.execute(
+                    text(
+                        "INSERT INTO sqlite_sequence (name, seq) SELECT 'tasks', :base "
+                        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'tasks')"
+                    ),
+                    {"base": base},
+                )
+                await conn.execute(
+                    text("UPDATE sqlite_sequence SET seq = :base WHERE name = 'tasks' AND seq < :base"),
+                    {"base": base},
+                )
+
+    async def dispose(self):
+        for shard in self.shards:
+            await shard.read_engine.dispose()
+            await shard.write_engine.dispose()
+
+    # Routing
+
+    def shard_for_task(self, task_id: int) -> Shard:
+        number = shard_of(task_id)
+        if not 0 <= number < len(self.shards):
+            raise LookupError(f"Task {task_id} belongs to unknown shard {number}")
+        return self.shards[number]
+
+    def shard_for_new_task(self, user_id: int = None) -> Shard:
+        if self.shard_key == "user":
+            return self.shards[(user_id or 0) % len(self.shards)]
+        return self.shards[next(self._next_shard)]
+
+    def shards_for_user(self, user_id: int = None):
+        if self.shard_key == "user" and user_id is not None:
+            return [self.shards[user_id % len(self.shards)]]
+        return self.shards
+
+    async def _fan_out(self, shards, query, *args, **kwargs):
+        async def run(shard):
+            async with shard.reader() as session:
+                return await query(session, *args, **kwargs)
+
+        return await asyncio.gather(*(run(shard) for shard in shards))
+
+    # Writes: one shard each
+
+    async def create_task(self, title: str, user_id: int = None, **fields):
+        async with self.shard_for_new_task(user_id).writer() as session:
+            return await queries.create_task(session, title=title, user_id=user_id, **fields)
+
+    async def update_task(self, task_id: int, **fields):
+        try:
+            shard = self.shard_for_task(task_id)
+        except LookupError:
+            return None
+        async with shard.writer() as session:
+            return await queries.update_task(session, task_id, **fields)
+
+    async def delete_task(self, task_id: int, **fields):
+        try:
+            shard = self.shard_for_task(task_id)
+        except LookupError:
+            return False
+        async with shard.writer() as session:
+            return await queries.delete_task(session, task_id, **fields)
+
+    # Reads
+
+    async def get_task_by_id(self, task_id: int, user_id: int = None):
+        try:
+            shard = self.shard_for_task(task_id)
+        except LookupError:
+            return None
+        async with shard.reader() as session:
+            return await queries.get_task_by_id(session, task_id, user_id=user_id)
+
+    async def list_tasks(self, limit: int = 50, sort: str = queries.DEFAULT_SORT, user_id: int = None, **filters):
+        """queries.list_tasks over the user's shards, same page and cursor format."""
+        shards = self.shards_for_user(user_id)
+        column, descending = queries.parse_sort(sort)
+        fields = queries.parse_fields(filters.pop("fields", None))
+        if len(shards) == 1:
+            async with shards[0].reader() as session:
+                return await queries.list_tasks(session, limit=limit, sort=sort, user_id=user_id, fields=fields, **filters)
+        # Merging needs the sort column of every row, wanted or not.
+        fetched = fields if fields is None or column in fields else fields + (column,)
+        pages = await self._fan_out(shards, queries.list_tasks, limit=limit, sort=sort, user_id=user_id, fields=fetched, **filters)
+        merged = list(
+            itertools.islice(
+                heapq.merge(*(tasks for tasks, _ in pages), key=_sort_key(column), reverse=descending),
+                limit + 1,
+            )
+        )
+        more = len(merged) > limit or any(next_cursor for _, next_cursor in pages)
+        tasks = merged[:limit]
+        next_cursor = queries.encode_cursor(sort, tasks[-1]) if more and tasks else None
+        if fetched is not fields:
+            for task in tasks:
+                del task[column]
+        return tasks, next_cursor
+
+    async def search_tasks(self, q: str, limit: int = 20, cursor: str = None, user_id: int = None):
+        """queries.search_tasks over the user's shards, same page and cursor format."""
+        shards = self.shards_for_user(user_id)
+        if len(shards) == 1:
+            async with shards[0].reader() as session:
+                return await queries.search_tasks(session, q, limit=limit, cursor=cursor, user_id=user_id)
+        match = queries.fts_query(q)
+        offset = 0
+        if cursor:
+            try:
+                cursor_match, offset = queries._decode_token(cursor)
+                offset = int(offset)
+            except (ValueError, TypeError):
+                raise ValueError("Malformed cursor")
+            if cursor_match != match:
+                raise ValueError("Cursor was issued for a different search")
+        # Offsets are global, so every shard contributes its best offset+limit hits.
+        pages = await self._fan_out(shards, queries.search_tasks, q, limit=offset + limit, user_id=user_id)
+        merged = list(
+            itertools.islice(
+                heapq.merge(*(hits for hits, _ in pages), key=lambda hit: (hit["rank"], hit["task_id"])),
+                offset,
+                offset + limit + 1,
+            )
+        )
+        more = len(merged) > limit or any(next_cursor for _, next_cursor in pages)
+        next_cursor = queries._encode_token([match, offset + limit]) if more else None
+        return merged[:limit], next_cursor
+
+    async def get_task_stats(self, user_id: int = None, today=None):
+        shards = self.shards_for_user(user_id)
+        results = await self._fan_out(shards, queries.get_task_stats, user_id=user_id, today=today)
+        combined = {"total": 0, "by_status": {}, "by_priority": {}, "overdue": 0}
+        for stats in results:
+            combined["total"] += stats["total"]
+            combined["overdue"] += stats["overdue"]
+            for group in ("by_status", "by_priority"):
+                for key, count in stats[group].items():
+                    combined[group][key] = combined[group].get(key, 0) + count
+        return combined
@@ -0,0 +1,300 @@
+# app/core/statements.py
+"""Prebuilt SQLAlchemy Core statements for the query layer.
+
+Every statement ``core.queries`` runs is built here once, from ``Table``
+descriptions of the schema, and then reused: fixed statements are module
+constants and statements whose shape depends on the call (filters, cursor,
+updated columns, ...) come from builders memoized on that shape. Reusing
+the same statement object keeps SQLAlchemy's cache key stable and lets it
+memoize the key, so a repeated call skips both building and compiling,
+and SQLite sees one SQL string per shape.
+
+All values are bound parameters; only the shape picks the statement. Bind
+names of WHERE clauses avoid column names (``id``, ``owner_id``), which
+SQLAlchemy reserves for the SET clause of UPDATE statements.
+
+The tables mirror the DDL in ``core.db``, which remains the source of truth
+for the schema. Dates and timestamps are declared as ``Text``, as stored, so
+rows come back with the same strings as before.
+"""
+from functools import lru_cache
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    Table,
+    Text,
+    and_,
+    bindparam,
+    column,
+    delete,
+    func,
+    insert,
+    literal_column,
+    null,
+    or_,
+    select,
+    table,
+    tuple_,
+    union_all,
+    update,
+)
+
+from core.db import TIMESTAMP_MS
+
+metadata = MetaData()
+
+
+def _task_columns():
+    return (
+        Column("task_id", Integer, primary_key=True),
+        Column("title", Text, nullable=False),
+        Column("description", Text),
+        Column("due_date", Text),
+        Column("priority", Integer),
+        Column("status", Text),
+        Column("created_at", Text),
+        Column("completed_at", Text),
+        Column("user_id", Integer),
+        Column("updated_at", Text),
+    )
+
+
+tasks = Table("tasks", metadata, *_task_columns())
+tasks_archive = Table("tasks_archive", metadata, *_task_columns(), Column("archived_at", Text))
+task_changes = Table(
+    "task_changes",
+    metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("version", Integer),
+    Column("changed_at", Text),
+)
+task_stats = Table(
+    "task_stats",
+    metadata,
+    Column("user_id", Integer),
+    Column("status", Text),
+    Column("priority", Integer),
+    Column("task_count", Integer),
+)
+# The full-text index (core.db) is only ever joined on its rowid and named
+# as a whole in MATCH and the ranking functions.
+tasks_fts = table("tasks_fts", column("rowid"))
+FTS = literal_column("tasks_fts")
+
+TABLES = {"tasks": tasks, "tasks_archive": tasks_archive}
+
+# Live and archived tasks (core.archive) read as one table, for listings
+# that ask for archived tasks too. task_ids never overlap between the two.
+ALL_TASKS = union_all(
+    select(*tasks.c, null().label("archived_at")),
+    select(*tasks_archive.c),
+).subquery("all_tasks")
+
+# New value of ``updated_at`` on every write: the current time in ms, but
+# always past the previous value so that two writes within one millisecond
+# still yield different validators (ETags) for the row.
+NEXT_UPDATED_AT = literal_column(
+    f"CASE WHEN {TIMESTAMP_MS} > COALESCE(updated_at, '') THEN {TIMESTAMP_MS} "
+    "ELSE strftime('%Y-%m-%d %H:%M:%f', updated_at, '+0.001 seconds') END"
+)
+
+NEW_TASK_VALUES = {
+    **{name: bindparam(name) for name in ("title", "description", "due_date", "priority", "status", "user_id")},
+    "updated_at": literal_column(TIMESTAMP_MS),
+}
+INSERT_TASK = insert(tasks).values(NEW_TASK_VALUES).returning(*tasks.c)
+# Bulk inserts: the same row shape, for executemany().
+INSERT_TASKS = insert(tasks).values(NEW_TASK_VALUES)
+# The bulk API reports the id of every row it created, in request order.
+INSERT_TASK_IDS = INSERT_TASKS.returning(tasks.c.task_id, sort_by_parameter_order=True)
+
+CHANGE_VERSION = select(task_changes.c.version, task_changes.c.changed_at).where(
+    task_changes.c.user_id == bindparam("owner_id")
+)
+TASK_STATS = select(task_stats.c.status, task_stats.c.priority, task_stats.c.task_count).where(
+    task_stats.c.user_id == bindparam("owner_id")
+)
+# Matches idx_tasks_user_open_due_date. 'Completed' has to be a literal, not
+# a parameter, for SQLite to see that the partial index applies.
+OVERDUE_COUNT = select(func.count()).select_from(tasks).where(
+    tasks.c.user_id == bindparam("owner_id"),
+    tasks.c.status != literal_column("'Completed'"),
+    tasks.c.due_date < bindparam("today"),
+)
+
+# A single statement shape for every partial update: NULL parameters keep the
+# current value, so all updates of a bulk batch share one executemany() call.
+BULK_UPDATE = (
+    update(tasks)
+    .values(
+        **{name: func.coalesce(bindparam(name), tasks.c[name])
+           for name in ("title", "description", "due_date", "priority", "status", "completed_at")},
+        updated_at=NEXT_UPDATED_AT,
+    )
+    .where(tasks.c.task_id == bindparam("id"))
+)
+BULK_DELETE = delete(tasks).where(tasks.c.task_id == bindparam("id"))
+EXISTING_IDS = select(tasks.c.task_id).where(tasks.c.task_id.in_(bindparam("ids", expanding=True)))
+OWNED_IDS = EXISTING_IDS.where(tasks.c.user_id == bindparam("owner_id"))
+
+
+def _key_conditions(source, scoped: bool, versioned: bool = False):
+    conditions = [source.c.task_id == bindparam("id")]
+    if scoped:
+        conditions.append(source.c.user_id == bindparam("owner_id"))
+    if versioned:
+        # Optimistic concurrency: the write only applies to the version the
+        # caller last saw (If-Match). '' stands for a row never stamped.
+        conditions.append(func.coalesce(source.c.updated_at, "") == bindparam("expected_updated_at"))
+    return conditions
+
+
+def _owned(source, scoped: bool):
+    return [source.c.user_id == bindparam("owner_id")] if scoped else []
+
+
+# Builders. Their arguments are the statement's shape and every argument
+# ranges over a small fixed set, so each cache is bounded by construction.
+
+
+@lru_cache(maxsize=None)
+def select_tasks(scoped: bool):
+    return select(tasks).where(*_owned(tasks, scoped)).order_by(tasks.c.created_at.desc())
+
+
+@lru_cache(maxsize=None)
+def select_task(table_name: str, scoped: bool):
+    source = TABLES[table_name]
+    return select(source).where(*_key_conditions(source, scoped))
+
+
+@lru_cache(maxsize=None)
+def archived_task_exists(scoped: bool):
+    return select(literal_column("1")).select_from(tasks_archive).where(*_key_conditions(tasks_archive, scoped))
+
+
+@lru_cache(maxsize=None)
+def update_task(fields: tuple, scoped: bool, versioned: bool):
+    """UPDATE of exactly ``fields`` (a subset of the updatable columns, in table order).
+
+    One statement per combination rather than a COALESCE over every column:
+    naming only the changed columns keeps the ``UPDATE OF title, description``
+    and ``UPDATE OF status, ...`` triggers from firing on unrelated writes.
+    """
+    return (
+        update(tasks)
+        .values(**{name: bindparam(name) for name in fields}, updated_at=NEXT_UPDATED_AT)
+        .where(*_key_conditions(tasks, scoped, versioned))
+        .returning(*tasks.c)
+    )
+
+
+@lru_cache(maxsize=None)
+def delete_task(table_name: str, scoped: bool, versioned: bool):
+    source = TABLES[table_name]
+    return delete(source).where(*_key_conditions(source, scoped, versioned)).returning(source.c.task_id)
+
+
+# Filters a listing or export may combine, keyed by parameter name.
+FILTERS = {
+    "status": lambda c: c.status == bindparam("status"),
+    "priority": lambda c: c.priority == bindparam("priority"),
+    "due_from": lambda c: c.due_date >= bindparam("due_from"),
+    "due_to": lambda c: c.due_date <= bindparam("due_to"),
+}
+
+
+def _keyset_condition(c, sort_column, descending: bool, null_cursor: bool):
+    """Rows strictly after (:cursor_value, :id) in sort order.
+
+    SQLite sorts NULLs first in ascending order and last in descending order,
+    so NULL sort values need their own branch.
+    """
+    if null_cursor:
+        if descending:
+            return and_(sort_column.is_(None), c.task_id < bindparam("id"))
+        return or_(and_(sort_column.is_(None), c.task_id > bindparam("id")), sort_column.is_not(None))
+    position = tuple_(sort_column, c.task_id)
+    after = tuple_(bindparam("cursor_value"), bindparam("id"))
+    if descending:
+        return or_(position < after, sort_column.is_(None))
+    return position > after
+
+
+@lru_cache(maxsize=1024)
+def list_tasks(columns, sort: str, descending: bool, include_archived: bool, filters: tuple, cursor, scoped: bool):
+    """One page of a keyset-paginated listing.
+
+    ``columns`` is None for every column; ``cursor`` is None on the first
+    page, else "null" or "value" after a NULL or non-NULL sort value.
+    """
+    source = ALL_TASKS if include_archived else tasks
+    c = source.c
+    sort_column = c[sort]
+    conditions = _owned(source, scoped) + [FILTERS[name](c) for name in filters]
+    if cursor is not None:
+        conditions.append(_keyset_condition(c, sort_column, descending, cursor == "null"))
+    order = (sort_column.desc(), c.task_id.desc()) if descending else (sort_column.asc(), c.task_id.asc())
+    return (
+        select(*(c if columns is None else (c[name] for name in columns)))
+        .where(*conditions)
+        .order_by(*order)
+        .limit(bindparam("limit"))
+    )
+
+
+@lru_cache(maxsize=None)
+def stream_tasks(filters: tuple, scoped: bool):
+    # created_at order walks the (user_id, ...created_at) indexes, with the
+    # rowid as tie-breaker, so the first chunk ships without a sort.
+    return (
+        select(tasks)
+        .where(*_owned(tasks, scoped), *(FILTERS[name](tasks.c) for name in filters))
+        .order_by(tasks.c.created_at, tasks.c.task_id)
+    )
+
+
+@lru_cache(maxsize=None)
+def search_tasks(scoped: bool):
+    """Full-text hits, best bm25 match first; title hits weigh more."""
+    t = tasks.alias("t")
+    rank = func.bm25(FTS, 10.0, 1.0).label("rank")
+    return (
+        select(
+            t,
+            rank,
+            func.snippet(FTS, 0, bindparam("mark_start"), bindparam("mark_end"), "…", 12).label("title_snippet"),
+            func.snippet(FTS, 1, bindparam("mark_start"), bindparam("mark_end"), "…", 24).label("description_snippet"),
+        )
+        .select_from(tasks_fts.join(t, t.c.task_id == tasks_fts.c.rowid))
+        .where(FTS.match(bindparam("match")), *_owned(t, scoped))
+        .order_by(rank, t.c.task_id)
+        .limit(bindparam("limit"))
+        .offset(bindparam("offset"))
+    )
+
+
+BUILDERS = {
+    builder.__name__: builder
+    for builder in (
+        select_tasks,
+        select_task,
+        archived_task_exists,
+        update_task,
+        delete_task,
+        list_tasks,
+        stream_tasks,
+        search_tasks,
+    )
+}
+
+
+def stats() -> dict:
+    """Statement shapes built so far, per builder, and how often each was reused."""
+    result = {}
+    for name, builder in BUILDERS.items():
+        info = builder.cache_info()
+        result[name] = {"shapes": info.currsize, "reused": info.hits, "built": info.misses}
+    return result
@@ -0,0 +1,166 @@
+# app/core/writequeue.py
+"""Group commit for task writes.
+
+With ``TODO_GROUP_COMMIT=1`` the write routes hand their create/update/delete
+calls to a background writer instead of running their own transaction. The
+writer takes whatever arrives within ``window`` seconds (or up to
+``max_batch`` operations), runs each one in a savepoint of a single
+transaction, commits once and resolves every caller's future with its own
+result. One fsync then pays for the whole batch.
+"""
+import asyncio
+import bisect
+import os
+import time
+
+from core import queries
+from core.cache import task_cache
+from core.db import WriteSessionLocal
+from utils.logger import logger
+
+GROUP_COMMIT = os.getenv("TODO_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("TODO_GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("TODO_GROUP_COMMIT_MAX_BATCH", "100"))
+
+OPERATIONS = {
+    "create": queries.create_task,
+    "update": queries.update_task,
+    "delete": queries.delete_task,
+}
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+
+class GroupCommitWriter:
+    def __init__(
+        self,
+        session_factory=WriteSessionLocal,
+        window: float = GROUP_COMMIT_WINDOW_MS / 1000,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+        enabled: bool = GROUP_COMMIT,
+    ):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self.enabled = enabled
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self.batches = 0
+        self.operations = 0
+        self.max_batch_seen = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, operation: str, **kwargs):
+        """Queue ``operation`` ("create", "update" or "delete") and await its result.
+
+        ``kwargs`` are the arguments of the matching ``core.queries`` function,
+        without the session. Raises whatever that function raised.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown write operation: {operation}")
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((operation, kwargs, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                logger.error("Group commit of %d operations failed: %s", len(batch), e)
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _commit(self, batch):
+        started = time.perf_counter()
+        self._record(batch, started)
+        outcomes = []
+        changed_ids = []
+        async with self.session_factory() as session:
+            for operation, kwargs, future, _ in batch:
+                try:
+                    # A savepoint per operation keeps one bad write from
+                    # failing the others in the batch.
+                    async with session.begin_nested():
+                        result = await OPERATIONS[operation](session, commit=False, **kwargs)
+                except Exception as e:
+                    outcomes.append((future, None, e))
+                    continue
+                outcomes.append((future, result, None))
+                if operation != "create" and result:
+                    changed_ids.append(kwargs["task_id"])
+            await session.commit()
+        await task_cache.invalidate(changed_ids)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _record(self, batch, now):
+        size = len(batch)
+        self.batches += 1
+        self.operations += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self.batch_size_counts[bisect.bisect_left(BATCH_SIZE_BUCKETS, size)] += 1
+        for *_, enqueued in batch:
+            waited = now - enqueued
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    async def stop(self):
+        """Let queued operations finish, then stop the background writer."""
+        if self._worker is None or self._worker.done():
+            return
+        self._queue.put_nowait(None)
+        await self._worker
+
+    def stats(self):
+        labels = [f"le_{bound}" for bound in BATCH_SIZE_BUCKETS] + ["inf"]
+        return {
+            "enabled": self.enabled,
+            "batches": self.batches,
+            "operations": self.operations,
+            "avg_batch_size": self.operations / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "batch_size_histogram": dict(zip(labels, self.batch_size_counts)),
+            "avg_queue_wait_ms": self.wait_total / self.operations * 1000 if self.operations else 0.0,
+            "max_queue_wait_ms": self.wait_max * 1000,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+        }
+
+
+group_writer = GroupCommitWriter()
@@ -1,127 +1,553 @@
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, Body
-from fastapi.responses import HTMLResponse, RedirectResponse
+import csv
+import hashlib
+import io
+import json
+import re
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Request, Response, Body, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from core.db import get_session
-from core import queries
+from core.db import AsyncSessionLocal, WriteSessionLocal, get_session, get_write_session
+from core import queries, statements
+from core.admission import admission
+from core.archive import task_archiver
+from core.cache import task_cache
+from core.events import event_stream, outbox_relay
+from core.hashing import password_hasher
+from core.metrics import metrics
+from core.serialization import render
+from core.writequeue import OPERATIONS, group_writer
 from core.models import User
-from schemas import TaskCreate, TaskUpdate, TaskOut
+from schemas import TaskCreate, TaskUpdate, TaskOut, TaskPage, TaskBulkRequest, TaskBulkResult, TaskSearchPage, TaskStats, CurrentUser, projected_page_model
 from fastapi.templating import Jinja2Templates
-from utils.logger import logger
-from typing import List
-from fastapi.security import OAuth2PasswordBearer
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup
+from utils.logger import log_stats, logger
+from typing import List, Optional
 from schemas import Token, UserCreate, UserLogin
-from auth import create_access_token, create_refresh_token, verify_token
-from core.db import get_session
+from auth import REFRESH_TOKEN, create_access_token, create_refresh_token, decode_token, get_current_user, get_page_user, oauth2_scheme, revoke_token, verify_token
 
 router = APIRouter()
 
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
-base_url = "http://127.0.0.1:8000/tasks/api/"
+# Async environment for pages streamed with generate_async().
+page_templates = Environment(loader=FileSystemLoader("templates"), autoescape=True, enable_async=True)
+
+
+def compile_templates() -> int:
+    """Compile every template into both environments' caches; returns how many.
+
+    Run at startup so the first request of each page doesn't pay for parsing.
+    """
+    count = 0
+    for environment in (templates.env, page_templates):
+        for name in environment.list_templates(extensions=["html"]):
+            environment.get_template(name)
+            count += 1
+    return count
+
+async def run_write(session: AsyncSession, operation: str, **kwargs):
+    """Run a task write directly, or through the group-commit writer when enabled."""
+    if group_writer.enabled:
+        return await group_writer.submit(operation, **kwargs)
+    return await OPERATIONS[operation](session, **kwargs)
+
+
+# Conditional requests. A task's validator is its ``updated_at``; a listing's
+# is the owner's change counter (see core.db.TASK_CHANGES_DDL) combined with
+# the query parameters, so both can be checked without loading tasks.
+
+def task_etag(task: dict) -> str:
+    stamp = re.sub(r"\D", "", str(task.get("updated_at") or "")) or "0"
+    return f'"{task["task_id"]}.{stamp}"'
+
+
+def _updated_at_from_etag(etag: str, task_id: int) -> Optional[str]:
+    """Invert task_etag(): the ``updated_at`` an If-Match tag stands for, or None."""
+    match = re.fullmatch(r'"(\d+)\.(\d+)"', etag)
+    if not match or int(match.group(1)) != task_id:
+        return None
+    d = match.group(2)
+    if d == "0":
+        return ""
+    if len(d) != 17:
+        return None
+    return f"{d[0:4]}-{d[4:6]}-{d[6:8]} {d[8:10]}:{d[10:12]}:{d[12:14]}.{d[14:]}"
+
+
+def _http_date(timestamp) -> Optional[str]:
+    if not timestamp:
+        return None
+    moment = datetime.fromisoformat(str(timestamp)).replace(tzinfo=timezone.utc)
+    return format_datetime(moment, usegmt=True)
+
+
+def _etags(header: str):
+    return [tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()]
+
+
+def _not_modified(request: Request, etag: str, last_modified) -> bool:
+    """Evaluate If-None-Match, or failing that If-Modified-Since, per RFC 9110."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etags(if_none_match)
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        modified = datetime.fromisoformat(str(last_modified)).replace(tzinfo=timezone.utc, microsecond=0)
+        return modified <= since
+    return False
+
+
+def _validator_headers(etag: str, last_modified) -> dict:
+    headers = {"ETag": etag}
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def _expected_updated_at(if_match: Optional[str], task_id: int):
+    """Map an If-Match header to update_task's ``expected_updated_at``.
+
+    Returns None when there is no precondition (absent or ``*``); raises 412
+    when none of the tags can belong to this task.
+    """
+    if if_match is None:
+        return None
+    tags = _etags(if_match)
+    if "*" in tags:
+        return None
+    for tag in tags:
+        expected = _updated_at_from_etag(tag, task_id)
+        if expected is not None:
+            return expected
+    raise HTTPException(status_code=412, detail="Precondition failed")
+
+
+async def _write_failed(session: AsyncSession, task_id: int, user_id: int, expected, archive_writable: bool = False) -> HTTPException:
+    # A write that found no row hit an archived, read-only task (409), lost
+    # the race of a conditional write (412) or targeted a missing task (404).
+    if not archive_writable and await queries.is_archived(session, task_id, user_id=user_id):
+        return HTTPException(status_code=409, detail="Archived tasks are read-only")
+    if expected is not None and await queries.get_task_by_id(session, task_id, user_id=user_id):
+        return HTTPException(status_code=412, detail="Precondition failed")
+    return HTTPException(status_code=404, detail="Task not found")
+
 
 @router.post("/api/", response_model=TaskOut)
-async def create_task(task: TaskCreate, session: AsyncSession = Depends(get_session)):
+async def create_task(
+    task: TaskCreate,
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_write_session),
+):
     try:
-        task_id = await queries.create_task(
+        new_task = await run_write(
             session,
+            "create",
             title=task.title,
             description=task.description,
             due_date=task.due_date,
             priority=task.priority,
             status=task.status,
+            user_id=user.id,
         )
-        new_task = await queries.get_task_by_id(session, task_id)
-        logger.info(f"Task created: {new_task}")
+        logger.info("Task created: ID %s", new_task["task_id"])
         return new_task
     except Exception as e:
-        logger.error(f"Error creating task: {e}")
+        logger.error("Error creating task: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/api/bulk", response_model=TaskBulkResult)
+async def bulk_tasks(
+    payload: TaskBulkRequest,
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_write_session),
+):
+    try:
+        results = await queries.bulk_write(
+            session,
+            creates=[task.model_dump() for task in payload.create],
+            updates=[task.model_dump() for task in payload.update],
+            deletes=payload.delete,
+            batch_size=payload.batch_size,
+            atomic=payload.atomic,
+            user_id=user.id,
+        )
+        logger.info(
+            "Bulk request applied: %d creates, %d updates, %d deletes",
+            len(payload.create), len(payload.update), len(payload.delete),
+        )
+        return results
+    except SQLAlchemyError as e:
+        logger.error("Bulk request rolled back: %s", e)
+        raise HTTPException(status_code=409, detail="Bulk request failed and was rolled back")
+    except Exception as e:
+        logger.error("Error applying bulk request: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.get("/api/", response_model=List[TaskOut])
-async def list_tasks(session: AsyncSession = Depends(get_session)):
+@router.get("/api/", response_model=TaskPage)
+async def list_tasks(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: str = queries.DEFAULT_SORT,
+    status: Optional[str] = None,
+    priority: Optional[int] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    include_archived: bool = False,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. task_id,title,status"),
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
     try:
-        tasks = await queries.get_all_tasks(session)
-        logger.info(f"Fetched {len(tasks)} tasks")
-        return tasks
+        params = {
+            "limit": limit,
+            "cursor": cursor,
+            "sort": sort,
+            "status": status,
+            "priority": priority,
+            "due_from": due_from,
+            "due_to": due_to,
+            "include_archived": include_archived,
+            "fields": queries.parse_fields(fields),
+            "user_id": user.id,
+        }
+
+        # Read in the same transaction as the page, so the ETag never
+        # describes a newer state than the page it is sent with.
+        version, changed_at = await queries.get_change_version(session, user.id)
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        etag = f'"{version}.{digest}"'
+        headers = _validator_headers(etag, changed_at)
+        if _not_modified(request, etag, changed_at):
+            return Response(status_code=304, headers=headers)
+
+        async def load_page():
+            tasks, next_cursor = await queries.list_tasks(session, **params)
+            return {"items": tasks, "next_cursor": next_cursor}
+
+        # Keying the cached page by version too keeps it in step with the ETag.
+        page = await task_cache.get_page({**params, "version": version}, load_page)
+        response.headers.update(headers)
+        logger.info("Fetched %d tasks", len(page["items"]))
+        if params["fields"]:
+            return render("list_tasks", projected_page_model(params["fields"]), page, headers, declared=False)
+        return render("list_tasks", TaskPage, page, headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error fetching tasks: {e}")
+        logger.error("Error fetching tasks: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def _export_chunks(export_format: str, user_id: int, status: Optional[str], priority: Optional[int]):
+    # The session is owned by the generator rather than a dependency: it has
+    # to stay open until the last chunk has been sent. Its read transaction
+    # lasts as long: under the production profile (WAL) writers carry on, but
+    # with the development profile's rollback journal its SHARED lock holds
+    # off every write commit until the export finishes.
+    async with AsyncSessionLocal() as session:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=queries.TASK_COLUMNS)
+            writer.writeheader()
+            yield buffer.getvalue()
+        async for rows in queries.stream_tasks(session, status=status, priority=priority, user_id=user_id):
+            if export_format == "ndjson":
+                yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+                continue
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=queries.TASK_COLUMNS)
+            writer.writerows(rows)
+            yield buffer.getvalue()
+
+
+@router.get("/api/export")
+async def export_tasks(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: Optional[str] = None,
+    priority: Optional[int] = None,
+    user: CurrentUser = Depends(get_current_user),
+):
+    logger.info("Exporting tasks as %s", format)
+    return StreamingResponse(
+        _export_chunks(format, user.id, status, priority),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="tasks.{format}"'},
+    )
+
+
+@router.get("/api/search", response_model=TaskSearchPage)
+async def search_tasks(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        hits, next_cursor = await queries.search_tasks(session, q, limit=limit, cursor=cursor, user_id=user.id)
+        logger.info("Search returned %d tasks", len(hits))
+        return render("search_tasks", TaskSearchPage, {"items": hits, "next_cursor": next_cursor})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Error searching tasks: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/api/stats", response_model=TaskStats)
+async def task_stats(
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        return await queries.get_task_stats(session, user_id=user.id)
+    except Exception as e:
+        logger.error("Error fetching task stats: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/api/cache/stats", dependencies=[Depends(get_current_user)])
+async def cache_stats():
+    return task_cache.stats()
+
+
+@router.get("/api/writes/stats", dependencies=[Depends(get_current_user)])
+async def write_stats():
+    return group_writer.stats()
+
+
+@router.get("/api/hashing/stats", dependencies=[Depends(get_current_user)])
+async def hashing_stats():
+    return password_hasher.stats()
+
+
+@router.get("/api/logging/stats", dependencies=[Depends(get_current_user)])
+async def logging_stats():
+    return log_stats()
+
+
+@router.get("/api/events/stats", dependencies=[Depends(get_current_user)])
+async def event_stats():
+    return outbox_relay.stats()
+
+
+@router.get("/api/admission/stats", dependencies=[Depends(get_current_user)])
+async def admission_stats():
+    return admission.stats()
+
+
+@router.get("/api/archive/stats", dependencies=[Depends(get_current_user)])
+async def archive_stats():
+    return task_archiver.stats()
+
+
+@router.get("/api/statements/stats", dependencies=[Depends(get_current_user)])
+async def statement_stats():
+    return {"engines": metrics.compiled_cache_stats(), "shapes": statements.stats()}
+
+
+@router.get("/api/events")
+async def task_events(
+    after: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Header(None),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Stream the caller's task changes as Server-Sent Events.
+
+    Resumes after ``after`` or, when a browser reconnects, the
+    ``Last-Event-ID`` it sends; otherwise starts with the next change.
+    """
+    if after is None and last_event_id:
+        if not last_event_id.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        after = int(last_event_id)
+    outbox_relay.start()
+    return StreamingResponse(
+        event_stream(user.id, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/api/{task_id}", response_model=TaskOut)
-async def get_task(task_id: int, session: AsyncSession = Depends(get_session)):
+async def get_task(
+    task_id: int,
+    request: Request,
+    response: Response,
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
     try:
-        task = await queries.get_task_by_id(session, task_id)
-        if not task:
-            logger.warning(f"Task not found with ID {task_id}")
+        task = await task_cache.get_task(
+            task_id, lambda: queries.get_task_by_id(session, task_id, user_id=user.id)
+        )
+        # The cache is shared by all users: check ownership of cached rows too.
+        if not task or task["user_id"] != user.id:
+            logger.warning("Task not found with ID %s", task_id)
             raise HTTPException(status_code=404, detail="Task not found")
-        logger.info(f"Fetched task: {task}")
-        return task
+        headers = _validator_headers(task_etag(task), task.get("updated_at"))
+        if _not_modified(request, headers["ETag"], task.get("updated_at")):
+            return Response(status_code=304, headers=headers)
+        logger.info("Fetched task: ID %s", task_id)
+        response.headers.update(headers)
+        return render("get_task", TaskOut, task, headers)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching task {task_id}: {e}")
+        logger.error("Error fetching task %s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.put("/api/{task_id}", response_model=TaskOut)
-async def update_task(task_id: int, task: TaskUpdate, session: AsyncSession = Depends(get_session)):
+async def update_task(
+    task_id: int,
+    task: TaskUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_write_session),
+):
     try:
-        updated = await queries.update_task(
+        expected = _expected_updated_at(if_match, task_id)
+        updated_task = await run_write(
             session,
-            task_id,
+            "update",
+            task_id=task_id,
             title=task.title,
             description=task.description,
             due_date=task.due_date,
             priority=task.priority,
             status=task.status,
             completed_at=task.completed_at,
+            user_id=user.id,
+            expected_updated_at=expected,
         )
-        if not updated:
-            logger.warning(f"No update applied or task not found: ID {task_id}")
-            raise HTTPException(status_code=404, detail="Task not found or no update applied")
-
-        updated_task = await queries.get_task_by_id(session, task_id)
-        logger.info(f"Task updated: {updated_task}")
+        if not updated_task:
+            logger.warning("No update applied or task not found: ID %s", task_id)
+            error = await _write_failed(session, task_id, user.id, expected)
+            if error.status_code == 404:
+                error.detail = "Task not found or no update applied"
+            raise error
+
+        logger.info("Task updated: ID %s", task_id)
+        response.headers.update(_validator_headers(task_etag(updated_task), updated_task["updated_at"]))
         return updated_task
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error updating task {task_id}: {e}")
+        logger.error("Error updating task %s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.delete("/api/{task_id}")
-async def delete_task(task_id: int, session: AsyncSession = Depends(get_session)):
+async def delete_task(
+    task_id: int,
+    if_match: Optional[str] = Header(None),
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_write_session),
+):
     try:
-        task = await queries.get_task_by_id(session, task_id)
-        if not task:
-            logger.warning(f"Task not found for deletion: ID {task_id}")
-            raise HTTPException(status_code=404, detail="Task not found")
+        expected = _expected_updated_at(if_match, task_id)
+        if not await run_write(session, "delete", task_id=task_id, user_id=user.id, expected_updated_at=expected):
+            logger.warning("Task not found for deletion: ID %s", task_id)
+            # Deletes reach archived tasks too (queries.delete_task).
+            raise await _write_failed(session, task_id, user.id, expected, archive_writable=True)
 
-        await queries.delete_task(session, task_id)
-        logger.info(f"Task deleted: ID {task_id}")
+        logger.info("Task deleted: ID %s", task_id)
         return {"message": "Task deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error deleting task {task_id}: {e}")
+        logger.error("Error deleting task %s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # Frontend routes for Crud operations
+
+# Rows are rendered and flushed this many at a time.
+PAGE_ROW_CHUNK = 50
+
+
 @router.get("/tasks", response_class=HTMLResponse)
-async def list_tasks_page(request: Request):
-    async for session in get_session():
-        tasks = await queries.get_all_tasks(session)
-        break 
-    
-    return templates.TemplateResponse(
-        "list_tasks.html", 
-        {
-            "request": request,
-            "tasks": tasks,
-            "base_url": base_url
-        }
+async def list_tasks_page(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    sort: str = queries.DEFAULT_SORT,
+    status: Optional[str] = None,
+    priority: Optional[int] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    include_archived: bool = False,
+    user: CurrentUser = Depends(get_page_user),
+):
+    params = {
+        "limit": limit,
+        "cursor": cursor,
+        "sort": sort,
+        "status": status,
+        "priority": priority,
+        "due_from": due_from,
+        "due_to": due_to,
+        "include_archived": include_archived,
+        "user_id": user.id,
+    }
+    # The session is closed before the first byte goes out: rendering and a
+    # slow client must not keep a read transaction (and, with the rollback
+    # journal, a SHARED lock) open.
+    async with AsyncSessionLocal() as session:
+        version, changed_at = await queries.get_change_version(session, user.id)
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        etag = f'"page.{version}.{digest}"'
+        headers = _validator_headers(etag, changed_at)
+        if _not_modified(request, etag, changed_at):
+            return Response(status_code=304, headers=headers)
+
+        # The owner's change counter versions the rendered rows, like the ETag.
+        fragment_key = {**params, "version": version, "fragment": "task_rows"}
+        fragment = await task_cache.get_fragment(fragment_key)
+        if fragment is None:
+            try:
+                tasks, next_cursor = await queries.list_tasks(session, **params)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            next_cursor = fragment["next_cursor"]
+
+    async def row_chunks():
+        if fragment is not None:
+            yield Markup(fragment["rows"])
+            return
+        rendered = []
+        for start in range(0, len(tasks), PAGE_ROW_CHUNK):
+            rows = await page_templates.get_template("task_rows.html").render_async(tasks=tasks[start:start + PAGE_ROW_CHUNK])
+            rendered.append(rows)
+            yield Markup(rows)
+        await task_cache.set_fragment(fragment_key, {"rows": "".join(rendered), "next_cursor": next_cursor})
+
+    next_url = str(request.url.include_query_params(cursor=next_cursor)) if next_cursor else None
+    body = page_templates.get_template("list_tasks.html").generate_async(
+        filters=params, row_chunks=row_chunks(), next_url=next_url
     )
+    logger.info("Rendering task page for user %s (cached: %s)", user.id, fragment is not None)
+    return StreamingResponse(body, media_type="text/html; charset=utf-8", headers=headers)
 
 @router.get("/create-task", response_class=HTMLResponse)
 async def create_task_page(request: Request):
@@ -139,10 +565,12 @@ async def delete_task_page(request: Request):
 
 
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
 @router.post("/register", response_model=Token)
-async def register(user: UserCreate, session: AsyncSession = Depends(get_session)):
+async def register(user: UserCreate, session: AsyncSession = Depends(get_write_session)):
+    # Hash before the first query: that query opens the writer's transaction,
+    # and every other write would wait out the bcrypt cost behind it.
+    password_hash = await password_hasher.hash(user.password)
+
     # Check if user exists
     result = await session.execute(select(User).filter_by(username=user.username))
     existing_user = result.scalars().first()
@@ -150,13 +578,14 @@ async def register(user: UserCreate, session: AsyncSession = Depends(get_session
         raise HTTPException(status_code=400, detail="Username already exists")
 
     # Create new user
-    new_user = User(username=user.username, password=user.password)
+    new_user = User(username=user.username, password=password_hash)
     session.add(new_user)
     await session.commit()
     await session.refresh(new_user)  # fetch back from DB
 
-    access_token = create_access_token({"sub": new_user.username})
-    refresh_token = create_refresh_token({"sub": new_user.username})
+    claims = {"sub": new_user.username, "uid": new_user.id}
+    access_token = create_access_token(claims)
+    refresh_token = create_refresh_token(claims)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
@@ -164,26 +593,54 @@ async def register(user: UserCreate, session: AsyncSession = Depends(get_session
 @router.post("/login", response_model=Token)
 async def login(user: UserLogin, session: AsyncSession = Depends(get_session)):
     result = await session.execute(
-        text("SELECT * FROM users WHERE username=:username AND password=:password"),
-        {"username": user.username, "password": user.password}
+        text("SELECT id, password FROM users WHERE username=:username"),
+        {"username": user.username}
     )
     db_user = result.fetchone()
+    # Don't hold the read transaction (and its lock) while bcrypt runs.
+    await session.rollback()
     if not db_user:
+        await password_hasher.verify_missing_user(user.password)
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-
-    access_token = create_access_token({"sub": user.username})
-    refresh_token = create_refresh_token({"sub": user.username})
+    ok, new_hash = await password_hasher.verify_and_update(user.password, db_user.password)
+    if not ok:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if new_hash:
+        # Legacy plaintext (or old-cost) row: store the fresh hash. The
+        # password guard leaves a row alone if it changed meanwhile.
+        async with WriteSessionLocal() as write_session:
+            await write_session.execute(
+                text("UPDATE users SET password=:new WHERE id=:id AND password=:old"),
+                {"new": new_hash, "id": db_user.id, "old": db_user.password},
+            )
+            await write_session.commit()
+
+    claims = {"sub": user.username, "uid": db_user.id}
+    access_token = create_access_token(claims)
+    refresh_token = create_refresh_token(claims)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.post("/refresh", response_model=Token)
-async def refresh(refresh_token: str = Body(...)):
-    username = verify_token(refresh_token)
-    access_token = create_access_token({"sub": username})
-    new_refresh_token = create_refresh_token({"sub": username})
+async def refresh(refresh_token: str = Body(...), session: AsyncSession = Depends(get_session)):
+    # Only refresh tokens: an access token must not mint new tokens. (Every
+    # refresh token with a typ claim also carries the user id.)
+    payload = decode_token(refresh_token, REFRESH_TOKEN)
+    claims = {"sub": payload["sub"], "uid": payload["uid"]}
+    access_token = create_access_token(claims)
+    new_refresh_token = create_refresh_token(claims)
+    # Refresh tokens are single use: the old one stops working once rotated.
+    revoke_token(refresh_token)
     return {"access_token": access_token, "refresh_token": new_refresh_token, "token_type": "bearer"}
 
 
+@router.post("/logout", status_code=204)
+async def logout(refresh_token: Optional[str] = Body(None), token: str = Depends(oauth2_scheme)):
+    revoke_token(token)
+    if refresh_token:
+        revoke_token(refresh_token)
+
+
 @router.get("/protected")
 async def protected(token: str = Depends(oauth2_scheme)):
     username = verify_token(token)
@@ -1,6 +1,7 @@
 # app/schemas.py
-from typing import Optional
-from pydantic import BaseModel
+from functools import lru_cache
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field, create_model
 from datetime import date, datetime
 
 class TaskBase(BaseModel):
@@ -25,11 +26,82 @@ class TaskOut(TaskBase):
     task_id: int
     created_at: datetime
     completed_at: Optional[datetime] = None
+    user_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    # Set on tasks read from the archive (core.archive).
+    archived_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class TaskPage(BaseModel):
+    items: List[TaskOut]
+    next_cursor: Optional[str] = None
+
+
+@lru_cache(maxsize=256)
+def projected_task_model(fields: tuple):
+    """TaskOut narrowed to ``fields`` (a tuple from queries.parse_fields), built once per projection."""
+    return create_model(
+        "TaskOut_" + "_".join(fields),
+        __config__=TaskOut.model_config,
+        **{name: (TaskOut.model_fields[name].annotation, TaskOut.model_fields[name]) for name in fields},
+    )
+
+
+@lru_cache(maxsize=256)
+def projected_page_model(fields: tuple):
+    return create_model(
+        "TaskPage_" + "_".join(fields),
+        items=(List[projected_task_model(fields)], ...),
+        next_cursor=(Optional[str], None),
+    )
+
+
+class TaskSearchHit(TaskOut):
+    rank: float
+    title_snippet: Optional[str] = None
+    description_snippet: Optional[str] = None
+
+
+class TaskSearchPage(BaseModel):
+    items: List[TaskSearchHit]
+    next_cursor: Optional[str] = None
+
+
+class TaskStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_priority: Dict[int, int]
+    overdue: int
+
+
+class TaskBulkUpdate(TaskUpdate):
+    task_id: int
+
+
+class TaskBulkRequest(BaseModel):
+    create: List[TaskCreate] = Field(default_factory=list, max_length=10000)
+    update: List[TaskBulkUpdate] = Field(default_factory=list, max_length=10000)
+    delete: List[int] = Field(default_factory=list, max_length=10000)
+    batch_size: int = Field(500, ge=1, le=5000)
+    atomic: bool = True  # False: keep the items that succeeded when others fail
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    task_id: Optional[int] = None
+    status: str  # created, updated, noop, deleted, not_found, failed
+    detail: Optional[str] = None
+
+
+class TaskBulkResult(BaseModel):
+    created: List[BulkItemResult]
+    updated: List[BulkItemResult]
+    deleted: List[BulkItemResult]
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str
@@ -42,3 +114,7 @@ class UserCreate(BaseModel):
 class UserLogin(BaseModel):
     username: str
     password: str
+
+class CurrentUser(BaseModel):
+    id: int
+    username: str
@@ -0,0 +1,19 @@
+import asyncio
+import os
+import tempfile
+
+# Point the app at a throwaway database before core.db is imported, so test
+# runs never touch the checked-in todo.db.
+os.environ.setdefault("TODO_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="todo-tests-"), "todo.db"))
+# Minimum bcrypt cost keeps register/login fast under test.
+os.environ.setdefault("TODO_BCRYPT_ROUNDS", "4")
+
+
+def pytest_sessionstart(session):
+    from core.db import init_db, init_users_table
+
+    async def setup():
+        await init_db()
+        await init_users_table()
+
+    asyncio.run(setup())
@@ -1,4 +1,6 @@
 import asyncio
+import uuid
+import pytest
 from datetime import date, datetime
 from core import queries
 from core.db import get_session
@@ -8,7 +10,7 @@ def test_create_and_get_task():
     async def run():
         async for session in get_session():
             # Create
-            task_id = await queries.create_task(
+            created = await queries.create_task(
                 session,
                 title="Test Task",
                 description="Testing existing DB",
@@ -17,7 +19,8 @@ def test_create_and_get_task():
                 status="Pending",
             )
             # Get
-            task = await queries.get_task_by_id(session, task_id)
+            task = await queries.get_task_by_id(session, created["task_id"])
+            assert task == created
             return task
 
     task = asyncio.run(run())
@@ -31,15 +34,18 @@ def test_create_and_get_task():
 def test_update_task():
     async def run():
         async for session in get_session():
-            task_id = await queries.create_task(session, title="Old Task")
-            await queries.update_task(
+            task_id = (await queries.create_task(session, title="Old Task"))["task_id"]
+            updated = await queries.update_task(
                 session,
                 task_id=task_id,
                 title="Updated Task",
                 status="Completed",
                 completed_at=datetime(2025, 9, 15, 12, 30),
             )
-            return await queries.get_task_by_id(session, task_id)
+            assert await queries.update_task(session, task_id=-1, title="Missing") is None
+            task = await queries.get_task_by_id(session, task_id)
+            assert task == updated
+            return task
 
     task = asyncio.run(run())
 
@@ -51,8 +57,9 @@ def test_update_task():
 def test_delete_task():
     async def run():
         async for session in get_session():
-            task_id = await queries.create_task(session, title="Delete Me")
-            await queries.delete_task(session, task_id)
+            task_id = (await queries.create_task(session, title="Delete Me"))["task_id"]
+            assert await queries.delete_task(session, task_id) is True
+            assert await queries.delete_task(session, task_id) is False
             return await queries.get_task_by_id(session, task_id)
 
     task = asyncio.run(run())
@@ -71,3 +78,383 @@ def test_get_all_tasks():
     titles = [t["title"] for t in tasks]
     assert "Task 1" in titles
     assert "Task 2" in titles
+
+
+def test_list_tasks_keyset_pagination():
+    status = f"Paging {uuid.uuid4().hex}"
+
+    async def run():
+        async for session in get_session():
+            for i in range(5):
+                await queries.create_task(session, title=f"Page {i}", priority=i % 2 + 1, status=status)
+            pages = []
+            cursor = None
+            while True:
+                tasks, cursor = await queries.list_tasks(
+                    session, limit=2, cursor=cursor, sort="-priority", status=status
+                )
+                pages.append(tasks)
+                if cursor is None:
+                    return pages
+
+    pages = asyncio.run(run())
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    tasks = [task for page in pages for task in page]
+    assert len({task["task_id"] for task in tasks}) == 5
+    assert [task["priority"] for task in tasks] == [2, 2, 1, 1, 1]
+
+
+def test_list_tasks_filters_and_bad_cursor():
+    status = f"Filter {uuid.uuid4().hex}"
+
+    async def run():
+        async for session in get_session():
+            await queries.create_task(session, title="Early", due_date=date(2025, 1, 10), status=status)
+            await queries.create_task(session, title="Late", due_date=date(2025, 3, 10), status=status)
+            tasks, _ = await queries.list_tasks(
+                session, status=status, due_from=date(2025, 2, 1), sort="due_date"
+            )
+            with pytest.raises(ValueError):
+                await queries.list_tasks(session, cursor="not-a-cursor")
+            return tasks
+
+    tasks = asyncio.run(run())
+
+    assert [task["title"] for task in tasks] == ["Late"]
+
+
+def test_stream_tasks_yields_bounded_chunks():
+    status = f"Export {uuid.uuid4().hex}"
+
+    async def run():
+        async for session in get_session():
+            for i in range(5):
+                await queries.create_task(session, title=f"Export {i}", status=status)
+            return [
+                chunk
+                async for chunk in queries.stream_tasks(session, status=status, chunk_size=2)
+            ]
+
+    chunks = asyncio.run(run())
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [task["title"] for chunk in chunks for task in chunk] == [f"Export {i}" for i in range(5)]
+
+
+def test_bulk_write_single_transaction():
+    status = f"Bulk {uuid.uuid4().hex}"
+
+    async def run():
+        async for session in get_session():
+            existing = (await queries.create_task(session, title="Bulk target"))["task_id"]
+            results = await queries.bulk_write(
+                session,
+                creates=[{"title": f"Bulk {i}", "status": status} for i in range(5)],
+                updates=[{"task_id": existing, "title": "Bulk updated"}, {"task_id": -1, "title": "Missing"}],
+                deletes=[-2],
+                batch_size=2,
+            )
+            created = [await queries.get_task_by_id(session, r["task_id"]) for r in results["created"]]
+            return results, created, await queries.get_task_by_id(session, existing)
+
+    results, created, updated = asyncio.run(run())
+
+    assert [task["title"] for task in created] == [f"Bulk {i}" for i in range(5)]
+    assert [r["status"] for r in results["updated"]] == ["updated", "not_found"]
+    assert [r["status"] for r in results["deleted"]] == ["not_found"]
+    assert updated["title"] == "Bulk updated"
+    assert updated["status"] == "Pending"
+
+
+def test_bulk_create_reports_the_ids_actually_assigned(tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from core.db import create_engines, init_db
+
+    read_engine, write_engine = create_engines(tmp_path / "ids.db", profile="production")
+
+    async def run():
+        await init_db(write_engine)
+        async with AsyncSession(write_engine, expire_on_commit=False) as session:
+            # Takes an id after every row, so a batch's ids are not contiguous.
+            await session.execute(text(
+                "CREATE TEMP TRIGGER shadow_tasks AFTER INSERT ON tasks WHEN new.title LIKE 'Gap %' BEGIN "
+                "INSERT INTO tasks (title) VALUES ('Shadow'); END"
+            ))
+            results = await queries.bulk_write(session, creates=[{"title": f"Gap {i}"} for i in range(3)])
+            created = [await queries.get_task_by_id(session, r["task_id"]) for r in results["created"]]
+        await read_engine.dispose()
+        await write_engine.dispose()
+        return results, created
+
+    results, created = asyncio.run(run())
+    assert [task["title"] for task in created] == ["Gap 0", "Gap 1", "Gap 2"]
+    ids = [r["task_id"] for r in results["created"]]
+    assert ids[1] - ids[0] > 1
+
+
+def test_bulk_write_reports_noop_and_repeated_deletes():
+    async def run():
+        async for session in get_session():
+            first = (await queries.create_task(session, title="Bulk noop"))["task_id"]
+            second = (await queries.create_task(session, title="Bulk repeat"))["task_id"]
+            return await queries.bulk_write(
+                session,
+                updates=[{"task_id": first}, {"task_id": first, "status": "Completed"}],
+                deletes=[second, second],
+            )
+
+    results = asyncio.run(run())
+
+    assert [r["status"] for r in results["updated"]] == ["noop", "updated"]
+    assert [r["status"] for r in results["deleted"]] == ["deleted", "not_found"]
+
+
+def test_bulk_write_failure_semantics():
+    from sqlalchemy.exc import IntegrityError
+
+    status = f"Bulk failure {uuid.uuid4().hex}"
+    creates = [{"title": "Good", "status": status}, {"title": None, "status": status}]
+
+    async def run():
+        async for session in get_session():
+            with pytest.raises(IntegrityError):
+                await queries.bulk_write(session, creates=creates)
+            atomic_rows, _ = await queries.list_tasks(session, status=status)
+            results = await queries.bulk_write(session, creates=creates, atomic=False)
+            partial_rows, _ = await queries.list_tasks(session, status=status)
+            return atomic_rows, results, partial_rows
+
+    atomic_rows, results, partial_rows = asyncio.run(run())
+
+    assert atomic_rows == []
+    assert [r["status"] for r in results["created"]] == ["created", "failed"]
+    assert [task["title"] for task in partial_rows] == ["Good"]
+
+
+def test_production_profile_mixed_read_write_load(tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from core.db import create_engines, init_db
+
+    read_engine, write_engine = create_engines(tmp_path / "profile.db", profile="production")
+
+    async def writer(n):
+        for i in range(10):
+            async with AsyncSession(write_engine) as session:
+                await queries.create_task(session, title=f"Writer {n}-{i}")
+
+    async def reader():
+        counts = []
+        for _ in range(10):
+            async with AsyncSession(read_engine) as session:
+                tasks, _ = await queries.list_tasks(session, limit=5)
+                counts.append(len(tasks))
+        return counts
+
+    async def run():
+        await init_db(write_engine)
+        async with write_engine.connect() as conn:
+            journal_mode = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+
+        # A reader is not blocked by an open, uncommitted write transaction.
+        async with AsyncSession(write_engine) as pending:
+            await pending.execute(text("INSERT INTO tasks (title) VALUES ('Uncommitted')"))
+            async with AsyncSession(read_engine) as session:
+                visible, _ = await queries.list_tasks(session)
+            await pending.rollback()
+
+        results = await asyncio.gather(
+            *[writer(n) for n in range(10)], *[reader() for _ in range(10)]
+        )
+        async with AsyncSession(read_engine) as session:
+            total = (await session.execute(text("SELECT COUNT(*) FROM tasks"))).scalar()
+        await read_engine.dispose()
+        await write_engine.dispose()
+        return journal_mode, visible, total, results
+
+    journal_mode, visible, total, results = asyncio.run(run())
+
+    assert journal_mode == "wal"
+    assert visible == []
+    assert total == 100
+    assert all(len(counts) == 10 for counts in results[10:])
+
+
+def test_search_tasks_ranks_and_stays_in_sync():
+    word = f"zebra{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        async for session in get_session():
+            in_title = await queries.create_task(session, title=f"Feed the {word}", description="at noon")
+            in_description = await queries.create_task(
+                session, title="Zoo visit", description=f"Bring <snacks> for the {word}"
+            )
+            renamed = await queries.create_task(session, title="Unrelated")
+            await queries.update_task(session, renamed["task_id"], title=f"Now about {word}")
+            deleted = await queries.create_task(session, title=f"Gone {word}")
+            await queries.delete_task(session, deleted["task_id"])
+
+            first_page, cursor = await queries.search_tasks(session, word[:-2], limit=2)
+            second_page, _ = await queries.search_tasks(session, word[:-2], limit=2, cursor=cursor)
+            return in_title, in_description, renamed, first_page + second_page
+
+    in_title, in_description, renamed, hits = asyncio.run(run())
+
+    ids = [hit["task_id"] for hit in hits]
+    assert sorted(ids) == sorted([in_title["task_id"], in_description["task_id"], renamed["task_id"]])
+    assert ids[-1] == in_description["task_id"]
+    description_hit = hits[-1]
+    assert f"<mark>{word}</mark>" in description_hit["description_snippet"]
+    assert "&lt;snacks&gt;" in description_hit["description_snippet"]
+    with pytest.raises(ValueError):
+        queries.fts_query("  ** ")
+
+
+def test_queries_are_scoped_by_user():
+    status = f"Scoped {uuid.uuid4().hex}"
+
+    async def run():
+        async for session in get_session():
+            mine = await queries.create_task(session, title="Mine", status=status, user_id=101)
+            theirs = await queries.create_task(session, title="Theirs", status=status, user_id=102)
+            listed, _ = await queries.list_tasks(session, status=status, user_id=101)
+            exported = [
+                task
+                async for chunk in queries.stream_tasks(session, status=status, user_id=101)
+                for task in chunk
+            ]
+            other_get = await queries.get_task_by_id(session, theirs["task_id"], user_id=101)
+            other_update = await queries.update_task(session, theirs["task_id"], title="Hijacked", user_id=101)
+            other_delete = await queries.delete_task(session, theirs["task_id"], user_id=101)
+            bulk = await queries.bulk_write(session, deletes=[theirs["task_id"]], user_id=101)
+            return mine, listed, exported, other_get, other_update, other_delete, bulk
+
+    mine, listed, exported, other_get, other_update, other_delete, bulk = asyncio.run(run())
+
+    assert mine["user_id"] == 101
+    assert [task["title"] for task in listed] == ["Mine"]
+    assert [task["title"] for task in exported] == ["Mine"]
+    assert other_get is None and other_update is None and other_delete is False
+    assert bulk["deleted"][0]["status"] == "not_found"
+
+
+def test_init_db_migrates_legacy_tasks_table(tmp_path):
+    import sqlite3
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from core.db import SCHEMA_VERSION, assign_task_owner, create_engines, init_db, init_users_table, schema_version
+
+    path = tmp_path / "legacy.db"
+    legacy = sqlite3.connect(path)
+    legacy.execute(
+        "CREATE TABLE tasks (task_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, "
+        "description TEXT, due_date DATE, priority INTEGER DEFAULT 2, status TEXT DEFAULT 'Pending', "
+        "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, completed_at TIMESTAMP)"
+    )
+    legacy.execute("CREATE INDEX idx_tasks_created_at ON tasks (created_at)")
+    legacy.execute("INSERT INTO tasks (title) VALUES ('Legacy task')")
+    legacy.commit()
+    legacy.close()
+
+    read_engine, write_engine = create_engines(path, profile="development")
+
+    async def run():
+        applied = await init_db(write_engine)
+        assert await init_db(write_engine) == []  # already at SCHEMA_VERSION
+        assert await schema_version(write_engine) == SCHEMA_VERSION
+        await init_users_table(write_engine)
+        async with write_engine.begin() as conn:
+            await conn.exec_driver_sql("INSERT INTO users (username, password) VALUES ('owner', 'x')")
+        assigned = await assign_task_owner("owner", bind=write_engine)
+        async with AsyncSession(read_engine) as session:
+            tasks, _ = await queries.list_tasks(session, user_id=1)
+            found, _ = await queries.search_tasks(session, "legacy", user_id=1)
+            stats = await queries.get_task_stats(session, user_id=1)
+        await write_engine.dispose()
+        return applied, assigned, tasks, found, stats
+
+    applied, assigned, tasks, found, stats = asyncio.run(run())
+
+    assert applied == list(range(1, SCHEMA_VERSION + 1))
+    assert assigned == 1
+    assert [task["title"] for task in tasks] == ["Legacy task"]
+    assert [task["title"] for task in found] == ["Legacy task"]
+    assert stats["by_status"] == {"Pending": 1}
+    assert tasks[0]["updated_at"].startswith(str(tasks[0]["created_at"]))
+    indexes = {row[0] for row in sqlite3.connect(path).execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "idx_tasks_created_at" not in indexes
+    assert "idx_tasks_user_created_at" in indexes
+
+
+def test_writes_advance_updated_at_and_change_version():
+    async def run():
+        async for session in get_session():
+            before = await queries.get_change_version(session, 202)
+            task = await queries.create_task(session, title="Stamped", user_id=202)
+            first = await queries.update_task(session, task["task_id"], title="Stamped 1", user_id=202)
+            second = await queries.update_task(session, task["task_id"], title="Stamped 2", user_id=202)
+            stale = await queries.update_task(
+                session, task["task_id"], title="Stale", user_id=202, expected_updated_at=first["updated_at"]
+            )
+            current = await queries.delete_task(
+                session, task["task_id"], user_id=202, expected_updated_at=second["updated_at"]
+            )
+            after = await queries.get_change_version(session, 202)
+            return before, task, first, second, stale, current, after
+
+    before, task, first, second, stale, current, after = asyncio.run(run())
+
+    assert task["updated_at"] < first["updated_at"] < second["updated_at"]
+    assert stale is None
+    assert current is True
+    assert after[0] == before[0] + 4
+
+
+def test_task_stats_follow_every_write_and_can_be_rebuilt():
+    from sqlalchemy import text
+    from sqlalchemy.dialects import sqlite
+    from core import statements
+    from core.db import check_task_stats, rebuild_task_stats
+
+    named = sqlite.dialect(paramstyle="named")
+
+    async def run():
+        async for session in get_session():
+            today = date(2025, 6, 15)
+            old = await queries.create_task(session, title="Late", due_date="2025-06-01", priority=3, user_id=303)
+            await queries.create_task(session, title="Done late", due_date="2025-06-01", status="Completed", user_id=303)
+            await queries.create_task(session, title="Future", due_date="2025-07-01", user_id=303)
+            await queries.create_task(session, title="No date", user_id=303)
+            await queries.update_task(session, old["task_id"], status="In Progress", user_id=303)
+            gone = await queries.create_task(session, title="Gone", priority=1, user_id=303)
+            await queries.delete_task(session, gone["task_id"], user_id=303)
+            await queries.bulk_write(session, creates=[{"title": "Bulk", "priority": 1}], user_id=303)
+            stats = await queries.get_task_stats(session, user_id=303, today=today)
+            plan = (
+                await session.execute(
+                    text("EXPLAIN QUERY PLAN " + str(statements.OVERDUE_COUNT.compile(dialect=named))),
+                    {"owner_id": 303, "today": str(today)},
+                )
+            ).fetchall()
+
+            consistent = await check_task_stats()
+            await session.execute(text("UPDATE task_stats SET task_count = 99 WHERE user_id = 303 AND priority = 1"))
+            await session.commit()
+            drifted = await check_task_stats()
+            await rebuild_task_stats()
+            repaired = await check_task_stats()
+            return stats, plan, consistent, drifted, repaired
+
+    stats, plan, consistent, drifted, repaired = asyncio.run(run())
+
+    assert stats == {
+        "total": 5,
+        "by_status": {"Pending": 3, "In Progress": 1, "Completed": 1},
+        "by_priority": {1: 1, 2: 3, 3: 1},
+        "overdue": 1,
+    }
+    assert "idx_tasks_user_open_due_date" in " ".join(row[-1] for row in plan)
+    assert consistent == []
+    assert drifted == [(303, "Pending", 1, 99, 1)]
+    assert repaired == []
@@ -1,10 +1,31 @@
+import json
+import re
+import uuid
+from contextlib import contextmanager
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from app import app
+from core.cache import task_cache
+from core.db import engine
 from datetime import date, datetime
 
 client = TestClient(app) 
 
+
+def register_user():
+    """Register a fresh user and return its bearer-token headers."""
+    credentials = {"username": f"user-{uuid.uuid4().hex}", "password": "secret"}
+    token = client.post("/tasks/register", json=credentials).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(autouse=True, scope="module")
+def authenticated_client():
+    client.headers.update(register_user())
+    yield
+    client.headers.pop("Authorization")
+
 def test_create_task_api():
     payload = {
         "title": "API Task",
@@ -13,7 +34,7 @@ def test_create_task_api():
         "priority": 1,
         "status": "Pending"
     }
-    response = client.post("/tasks/", json=payload)
+    response = client.post("/tasks/api/", json=payload)
     assert response.status_code == 200
     data = response.json()
     assert data["title"] == "API Task"
@@ -21,9 +42,9 @@ def test_create_task_api():
     assert data["status"] == "Pending"
 
 def test_get_all_tasks_api():
-    response = client.get("/tasks/")
+    response = client.get("/tasks/api/")
     assert response.status_code == 200
-    data = response.json()
+    data = response.json()["items"]
     assert isinstance(data, list)
     # check for task
     assert any(task["title"] == "API Task" for task in data)
@@ -31,11 +52,11 @@ def test_get_all_tasks_api():
 def test_get_task_by_id_api():
     # create a task
     payload = {"title": "Get By ID", "priority": 2}
-    response = client.post("/tasks/", json=payload)
+    response = client.post("/tasks/api/", json=payload)
     task_id = response.json()["task_id"]
 
     # get by ID
-    response = client.get(f"/tasks/{task_id}")
+    response = client.get(f"/tasks/api/{task_id}")
     assert response.status_code == 200
     data = response.json()
     assert data["task_id"] == task_id
@@ -44,12 +65,12 @@ def test_get_task_by_id_api():
 def test_update_task_api():
     # Create task
     payload = {"title": "Old Title"}
-    response = client.post("/tasks/", json=payload)
+    response = client.post("/tasks/api/", json=payload)
     task_id = response.json()["task_id"]
 
     # Update
     update_payload = {"title": "New Title", "status": "Completed"}
-    response = client.put(f"/tasks/{task_id}", json=update_payload)
+    response = client.put(f"/tasks/api/{task_id}", json=update_payload)
     assert response.status_code == 200
     data = response.json()
     assert data["title"] == "New Title"
@@ -58,14 +79,383 @@ def test_update_task_api():
 def test_delete_task_api():
     # Create task
     payload = {"title": "Delete Me"}
-    response = client.post("/tasks/", json=payload)
+    response = client.post("/tasks/api/", json=payload)
     task_id = response.json()["task_id"]
 
     # delete
-    response = client.delete(f"/tasks/{task_id}")
+    response = client.delete(f"/tasks/api/{task_id}")
     assert response.status_code == 200
     assert response.json()["message"] == "Task deleted successfully"
 
     # check task is deleted
-    response = client.get(f"/tasks/{task_id}")
+    response = client.get(f"/tasks/api/{task_id}")
     assert response.status_code == 404
+
+def test_list_tasks_api_pagination():
+    status = "API Paging"
+    for i in range(3):
+        client.post("/tasks/api/", json={"title": f"Paged {i}", "status": status})
+
+    response = client.get("/tasks/api/", params={"status": status, "limit": 2})
+    assert response.status_code == 200
+    page = response.json()
+    assert len(page["items"]) == 2
+    assert page["next_cursor"]
+
+    response = client.get("/tasks/api/", params={"status": "x", "cursor": "garbage"})
+    assert response.status_code == 400
+
+def test_export_tasks_api():
+    client.post("/tasks/api/", json={"title": "Exported", "status": "API Export"})
+
+    response = client.get("/tasks/api/export", params={"format": "ndjson", "status": "API Export"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows and all(row["status"] == "API Export" for row in rows)
+
+    response = client.get("/tasks/api/export", params={"format": "csv", "status": "API Export"})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0].startswith("task_id,title")
+    assert len(lines) == len(rows) + 1
+
+    response = client.get("/tasks/api/export", params={"format": "csv", "status": f"Empty {uuid.uuid4().hex}"})
+    assert response.text.splitlines() == [",".join(["task_id", "title", "description", "due_date", "priority", "status", "created_at", "completed_at", "user_id", "updated_at"])]
+
+def test_bulk_tasks_api():
+    payload = {
+        "create": [{"title": f"Bulk API {i}", "status": "API Bulk"} for i in range(3)],
+        "delete": [-1],
+        "batch_size": 2,
+    }
+    response = client.post("/tasks/api/bulk", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["status"] for item in data["created"]] == ["created"] * 3
+    assert data["deleted"][0]["status"] == "not_found"
+
+    task_id = data["created"][0]["task_id"]
+    response = client.post("/tasks/api/bulk", json={"update": [{"task_id": task_id, "priority": 3}]})
+    assert response.json()["updated"][0]["status"] == "updated"
+
+
+@contextmanager
+def count_statements():
+    """Record the SQL statements and commits issued while the block runs."""
+    counts = {"statements": [], "commits": 0}
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement != "BEGIN":
+            counts["statements"].append(statement)
+
+    def on_commit(conn):
+        counts["commits"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    event.listen(engine.sync_engine, "commit", on_commit)
+    try:
+        yield counts
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+        event.remove(engine.sync_engine, "commit", on_commit)
+
+
+def test_mutations_use_one_statement_and_one_commit():
+    with count_statements() as counts:
+        response = client.post("/tasks/api/", json={"title": "Counted"})
+    assert response.status_code == 200
+    assert len(counts["statements"]) == 1
+    assert counts["commits"] == 1
+    task_id = response.json()["task_id"]
+
+    with count_statements() as counts:
+        response = client.put(f"/tasks/api/{task_id}", json={"status": "Completed"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "Completed"
+    assert len(counts["statements"]) == 1
+    assert counts["commits"] == 1
+
+    with count_statements() as counts:
+        response = client.delete(f"/tasks/api/{task_id}")
+    assert response.status_code == 200
+    assert len(counts["statements"]) == 1
+    assert counts["commits"] == 1
+
+    with count_statements() as counts:
+        assert client.put(f"/tasks/api/{task_id}", json={"title": "Gone"}).status_code == 404
+        assert client.delete(f"/tasks/api/{task_id}").status_code == 404
+    # Each miss also looks for the task in the archive.
+    assert len(counts["statements"]) == 4
+
+
+def test_updates_reuse_one_statement_per_field_combination():
+    task_id = client.post("/tasks/api/", json={"title": "Shaped"}).json()["task_id"]
+    with count_statements() as counts:
+        client.put(f"/tasks/api/{task_id}", json={"title": "Reshaped"})
+        client.put(f"/tasks/api/{task_id}", json={"title": "Reshaped again"})
+        client.put(f"/tasks/api/{task_id}", json={"priority": 3})
+    first, second, third = [s for s in counts["statements"] if s.startswith("UPDATE tasks")]
+    assert first == second != third
+    # Only the changed columns are set, so column-specific triggers stay quiet.
+    assert "title" in first.split("WHERE")[0] and "priority" not in first.split("WHERE")[0]
+
+    stats = client.get("/tasks/api/statements/stats").json()
+    assert stats["shapes"]["update_task"]["shapes"] >= 2 and stats["shapes"]["update_task"]["reused"] >= 1
+    assert stats["engines"]["read"]["hit"] >= 1 and 0 < stats["engines"]["read"]["hit_ratio"] <= 1
+    assert stats["engines"]["read"]["entries"] >= 1
+
+
+def test_task_reads_are_cached_and_invalidated_by_writes():
+    task_id = client.post("/tasks/api/", json={"title": "Cache me"}).json()["task_id"]
+    client.get(f"/tasks/api/{task_id}")
+    hits = client.get("/tasks/api/cache/stats").json()["hits"]
+
+    with count_statements() as counts:
+        assert client.get(f"/tasks/api/{task_id}").json()["title"] == "Cache me"
+    assert counts["statements"] == []
+    assert client.get("/tasks/api/cache/stats").json()["hits"] == hits + 1
+
+    client.put(f"/tasks/api/{task_id}", json={"title": "Changed"})
+    assert client.get(f"/tasks/api/{task_id}").json()["title"] == "Changed"
+    client.delete(f"/tasks/api/{task_id}")
+    assert client.get(f"/tasks/api/{task_id}").status_code == 404
+
+
+def test_writes_leave_other_users_cached_pages_alone():
+    alice, bob = register_user(), register_user()
+    client.post("/tasks/api/", json={"title": "Bob's task"}, headers=bob)
+    client.get("/tasks/api/", headers=bob)  # fills the cache
+    client.post("/tasks/api/", json={"title": "Alice's task"}, headers=alice)
+
+    hits = client.get("/tasks/api/cache/stats").json()["hits"]
+    with count_statements() as counts:
+        page = client.get("/tasks/api/", headers=bob).json()
+    assert [item["title"] for item in page["items"]] == ["Bob's task"]
+    assert client.get("/tasks/api/cache/stats").json()["hits"] == hits + 1
+    # Only the change version is read; the page itself came from the cache.
+    assert [s for s in counts["statements"] if "task_changes" not in s] == []
+
+    client.post("/tasks/api/", json={"title": "Bob's second"}, headers=bob)
+    assert len(client.get("/tasks/api/", headers=bob).json()["items"]) == 2
+
+
+def test_search_tasks_api():
+    client.post("/tasks/api/", json={"title": "Quarterly report draft", "description": "numbers"})
+
+    response = client.get("/tasks/api/search", params={"q": "quarterl"})
+    assert response.status_code == 200
+    hits = response.json()["items"]
+    assert hits and hits[0]["title_snippet"].startswith("<mark>Quarterly</mark>")
+
+    assert client.get("/tasks/api/search", params={"q": "!!"}).status_code == 400
+
+
+def test_tasks_are_scoped_to_their_owner():
+    other = register_user()
+    task_id = client.post("/tasks/api/", json={"title": "Mine only", "status": "Owned"}).json()["task_id"]
+    client.get(f"/tasks/api/{task_id}")  # warm the shared cache
+
+    assert client.get(f"/tasks/api/{task_id}", headers=other).status_code == 404
+    assert client.put(f"/tasks/api/{task_id}", json={"title": "Stolen"}, headers=other).status_code == 404
+    assert client.delete(f"/tasks/api/{task_id}", headers=other).status_code == 404
+    assert client.get("/tasks/api/", params={"status": "Owned"}, headers=other).json()["items"] == []
+    assert client.get("/tasks/api/search", params={"q": "Mine only"}, headers=other).json()["items"] == []
+    assert client.get("/tasks/api/export", params={"status": "Owned"}, headers=other).text == ""
+    bulk = client.post("/tasks/api/bulk", json={"delete": [task_id]}, headers=other).json()
+    assert bulk["deleted"][0]["status"] == "not_found"
+
+    assert client.get(f"/tasks/api/{task_id}").json()["title"] == "Mine only"
+    assert client.get("/tasks/api/", headers={"Authorization": ""}).status_code == 401
+
+
+def test_refresh_rotates_refresh_token():
+    credentials = {"username": f"user-{uuid.uuid4().hex}", "password": "secret"}
+    tokens = client.post("/tasks/register", json=credentials).json()
+
+    rotated = client.post("/tasks/refresh", json=tokens["refresh_token"])
+    assert rotated.status_code == 200
+    replay = client.post("/tasks/refresh", json=tokens["refresh_token"])
+    assert replay.status_code == 401
+    assert client.post("/tasks/refresh", json=rotated.json()["refresh_token"]).status_code == 200
+
+
+def test_refresh_token_is_not_a_bearer_credential():
+    credentials = {"username": f"user-{uuid.uuid4().hex}", "password": "secret"}
+    tokens = client.post("/tasks/register", json=credentials).json()
+    refresh = tokens["refresh_token"]
+
+    assert client.get("/tasks/api/", headers={"Authorization": f"Bearer {refresh}"}).status_code == 401
+    page = client.get("/tasks/tasks", headers={"Authorization": "", "Cookie": f"access_token={refresh}"})
+    assert page.status_code == 401
+    assert client.get("/tasks/protected", headers={"Authorization": f"Bearer {refresh}"}).status_code == 401
+
+
+def test_access_token_cannot_be_refreshed():
+    credentials = {"username": f"user-{uuid.uuid4().hex}", "password": "secret"}
+    tokens = client.post("/tasks/register", json=credentials).json()
+
+    assert client.post("/tasks/refresh", json=tokens["access_token"]).status_code == 401
+    assert client.post("/tasks/refresh", json=tokens["refresh_token"]).status_code == 200
+
+
+def test_logout_revokes_tokens():
+    credentials = {"username": f"user-{uuid.uuid4().hex}", "password": "secret"}
+    tokens = client.post("/tasks/register", json=credentials).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/tasks/api/", headers=headers).status_code == 200
+
+    response = client.post("/tasks/logout", json=tokens["refresh_token"], headers=headers)
+    assert response.status_code == 204
+    assert client.get("/tasks/api/", headers=headers).status_code == 401
+    assert client.post("/tasks/refresh", json=tokens["refresh_token"]).status_code == 401
+
+
+def test_login_rehashes_legacy_plaintext_password():
+    import sqlite3
+    from core.db import DB_PATH
+
+    username = f"legacy-{uuid.uuid4().hex}"
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, "plain"))
+
+    assert client.post("/tasks/login", json={"username": username, "password": "wrong"}).status_code == 400
+    assert client.post("/tasks/login", json={"username": username, "password": "plain"}).status_code == 200
+    with sqlite3.connect(DB_PATH) as conn:
+        stored = conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()[0]
+    assert stored.startswith("$2b$")
+    assert client.post("/tasks/login", json={"username": username, "password": "plain"}).status_code == 200
+
+
+def test_stats_endpoints_require_auth():
+    for path in ("/tasks/api/cache/stats", "/tasks/api/writes/stats", "/tasks/api/hashing/stats", "/tasks/api/logging/stats"):
+        assert client.get(path).status_code == 200
+        assert client.get(path, headers={"Authorization": ""}).status_code == 401
+
+
+def test_list_conditional_get():
+    status = f"ETag {uuid.uuid4().hex}"
+    client.post("/tasks/api/", json={"title": "Polled", "status": status})
+    first = client.get("/tasks/api/", params={"status": status})
+    etag = first.headers["etag"]
+    assert first.headers["last-modified"]
+
+    unchanged = client.get("/tasks/api/", params={"status": status}, headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.headers["etag"] == etag
+    assert unchanged.content == b""
+    since = client.get("/tasks/api/", params={"status": status}, headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+    other_params = client.get("/tasks/api/", params={"status": status, "limit": 5}, headers={"If-None-Match": etag})
+    assert other_params.status_code == 200
+
+    client.post("/tasks/api/", json={"title": "Polled again", "status": status})
+    changed = client.get("/tasks/api/", params={"status": status}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert len(changed.json()["items"]) == 2
+
+
+def test_list_etag_ignores_other_users_writes():
+    first = client.get("/tasks/api/")
+    other = register_user()
+    client.post("/tasks/api/", json={"title": "Someone else's"}, headers=other)
+    assert client.get("/tasks/api/", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+
+def test_task_conditional_get_and_if_match():
+    task_id = client.post("/tasks/api/", json={"title": "Versioned"}).json()["task_id"]
+    first = client.get(f"/tasks/api/{task_id}")
+    etag = first.headers["etag"]
+    assert first.json()["updated_at"]
+    assert client.get(f"/tasks/api/{task_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    updated = client.put(f"/tasks/api/{task_id}", json={"title": "Versioned 2"}, headers={"If-Match": etag})
+    assert updated.status_code == 200
+    new_etag = updated.headers["etag"]
+    assert new_etag != etag
+
+    stale = client.put(f"/tasks/api/{task_id}", json={"title": "Lost update"}, headers={"If-Match": etag})
+    assert stale.status_code == 412
+    assert client.delete(f"/tasks/api/{task_id}", headers={"If-Match": etag}).status_code == 412
+    assert client.get(f"/tasks/api/{task_id}").json()["title"] == "Versioned 2"
+
+    assert client.delete(f"/tasks/api/{task_id}", headers={"If-Match": new_etag}).status_code == 200
+    assert client.delete(f"/tasks/api/{task_id}", headers={"If-Match": new_etag}).status_code == 404
+
+
+def test_task_page_streams_filtered_pages_and_caches_rows():
+    headers = register_user()
+    status = f"Page {uuid.uuid4().hex}"
+    for title in ("First", "Second", "<b>Third</b>"):
+        client.post("/tasks/api/", json={"title": title, "status": status}, headers=headers)
+
+    assert client.get("/tasks/tasks", headers={"Authorization": ""}).status_code == 401
+
+    response = client.get("/tasks/tasks", params={"status": status, "limit": 2, "sort": "created_at"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert "First" in response.text and "Second" in response.text and "Third" not in response.text
+    next_url = re.search(r'id="nextPage" href="([^"]+)"', response.text).group(1).replace("&amp;", "&")
+
+    # The second page arrives through the cookie a browser would send.
+    token = headers["Authorization"].split(" ", 1)[1]
+    page_two = client.get(next_url, headers={"Authorization": "", "Cookie": f"access_token={token}"})
+    assert page_two.status_code == 200
+    assert "&lt;b&gt;Third&lt;/b&gt;" in page_two.text
+    assert 'id="nextPage"' not in page_two.text
+
+    hits = task_cache.fragment_hits
+    again = client.get("/tasks/tasks", params={"status": status, "limit": 2, "sort": "created_at"}, headers=headers)
+    assert again.text == response.text
+    assert task_cache.fragment_hits == hits + 1
+
+    etag = again.headers["etag"]
+    assert client.get("/tasks/tasks", params={"status": status, "limit": 2, "sort": "created_at"},
+                      headers={**headers, "If-None-Match": etag}).status_code == 304
+    client.post("/tasks/api/", json={"title": "Fourth", "status": status}, headers=headers)
+    assert client.get("/tasks/tasks", params={"status": status, "limit": 2, "sort": "created_at"},
+                      headers={**headers, "If-None-Match": etag}).status_code == 200
+
+
+def test_task_stats_api():
+    headers = register_user()
+    client.post("/tasks/api/", json={"title": "Overdue", "due_date": "2000-01-01", "priority": 3}, headers=headers)
+    client.post("/tasks/api/", json={"title": "Done", "status": "Completed", "priority": 1}, headers=headers)
+
+    response = client.get("/tasks/api/stats", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "total": 2,
+        "by_status": {"Pending": 1, "Completed": 1},
+        "by_priority": {"1": 1, "3": 1},
+        "overdue": 1,
+    }
+
+
+def test_list_projection_narrows_the_select_and_the_schema():
+    headers = register_user()
+    for n in range(3):
+        client.post("/tasks/api/", json={"title": f"Slim {n}", "description": "long " * 200}, headers=headers)
+
+    with count_statements() as counts:
+        response = client.get("/tasks/api/", params={"fields": "title,status", "limit": 2}, headers=headers)
+    assert response.status_code == 200
+    page = response.json()
+    assert [set(item) for item in page["items"]] == [{"task_id", "title", "status"}] * 2
+    (select,) = [s for s in counts["statements"] if "FROM tasks" in s and "task_changes" not in s]
+    assert " ".join(select.split()).startswith(
+        "SELECT tasks.task_id, tasks.title, tasks.status, tasks.created_at FROM tasks"
+    )
+
+    rest = client.get(
+        "/tasks/api/", params={"fields": "title,status", "limit": 2, "cursor": page["next_cursor"]}, headers=headers
+    ).json()
+    assert [item["title"] for item in page["items"] + rest["items"]] == ["Slim 2", "Slim 1", "Slim 0"]
+    # A projection is its own cached page and ETag.
+    full = client.get("/tasks/api/", params={"limit": 2}, headers=headers)
+    assert "description" in full.json()["items"][0]
+    assert full.headers["etag"] != response.headers["etag"]
+
+    bad = client.get("/tasks/api/", params={"fields": "title,password"}, headers=headers)
+    assert bad.status_code == 400 and "password" in bad.json()["detail"]
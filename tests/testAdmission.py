@@ -0,0 +1,274 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError, WatchError
+
+import auth
+from app import app
+from core.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    ConcurrencyLimiter,
+    MemoryRateLimiter,
+    RedisRateLimiter,
+    Rejected,
+    take_token,
+)
+
+client = TestClient(app)
+
+
+def verified_headers(uid):
+    """Auth headers with an access token the token cache has already verified."""
+    token = auth.create_access_token({"sub": f"user{uid}", "uid": uid})
+    auth.decode_token(token)
+    return {"Authorization": f"Bearer {token}"}
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio.Redis (decode_responses=True) for the rate limiter."""
+
+    def __init__(self, conflicts=0, down=False):
+        self.data = {}
+        self.versions = {}
+        self.conflicts = conflicts  # transactions to spoil with a concurrent write
+        self.down = down
+        self.expiries = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.watched = {}
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def watch(self, key):
+        if self.redis.down:
+            raise RedisConnectionError("connection refused")
+        self.watched[key] = self.redis.versions.get(key, 0)
+
+    async def hmget(self, key, *fields):
+        if self.redis.conflicts:
+            # Another worker writes the bucket between our read and EXEC.
+            self.redis.conflicts -= 1
+            self.redis.versions[key] = self.redis.versions.get(key, 0) + 1
+        stored = self.redis.data.get(key, {})
+        return [stored.get(field) for field in fields]
+
+    def multi(self):
+        self.commands = []
+
+    def hset(self, key, mapping):
+        self.commands.append(lambda: self.redis.data.setdefault(key, {}).update(mapping))
+
+    def pexpire(self, key, milliseconds):
+        self.commands.append(lambda: self.redis.expiries.__setitem__(key, milliseconds))
+
+    async def execute(self):
+        for key, version in self.watched.items():
+            if self.redis.versions.get(key, 0) != version:
+                raise WatchError("watched key changed")
+        for command in self.commands:
+            command()
+        for key in self.watched:
+            self.redis.versions[key] = self.redis.versions.get(key, 0) + 1
+
+
+def test_take_token_refills_up_to_the_burst():
+    assert take_token(2.0, 0.0, 0.0, rate=1.0, burst=2.0) == (1.0, 0.0)
+    assert take_token(0.0, 0.0, 0.25, rate=1.0, burst=2.0) == (0.25, 0.75)
+    assert take_token(0.0, 0.0, 100.0, rate=1.0, burst=2.0) == (1.0, 0.0)
+
+
+def test_memory_limiter_allows_the_burst_then_reports_the_wait():
+    async def run():
+        limiter = MemoryRateLimiter()
+        return [await limiter.take("a", rate=1.0, burst=2.0) for _ in range(3)] + [await limiter.take("b", 1.0, 2.0)]
+
+    first, second, third, other_client = asyncio.run(run())
+    assert first == second == 0.0 and other_client == 0.0
+    assert 0.9 < third <= 1.0
+
+
+def test_redis_limiter_shares_buckets_between_workers_and_retries_conflicts():
+    async def run():
+        redis = FakeRedis(conflicts=2)
+        worker_a, worker_b = RedisRateLimiter(redis), RedisRateLimiter(redis)
+        waits = [
+            await worker_a.take("client", rate=1.0, burst=2.0),
+            await worker_b.take("client", rate=1.0, burst=2.0),
+            await worker_a.take("client", rate=1.0, burst=2.0),
+        ]
+        return redis, waits
+
+    redis, waits = asyncio.run(run())
+    assert waits[:2] == [0.0, 0.0] and waits[2] > 0.9
+    assert redis.conflicts == 0  # both spoiled transactions were retried
+    (key,) = redis.data
+    assert key.startswith("admission:bucket:") and "client" not in key
+    assert redis.expiries[key] > 0
+
+
+def test_redis_limiter_lets_requests_through_when_redis_is_down():
+    assert asyncio.run(RedisRateLimiter(FakeRedis(down=True)).take("client", 1.0, 1.0)) == 0.0
+
+
+def test_concurrency_limiter_queues_in_order_and_sheds_beyond_the_queue():
+    async def run():
+        pool = ConcurrencyLimiter("read", limit=1, queue_size=1, timeout=1.0)
+        await pool.acquire()
+        queued = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as full:
+            await pool.acquire()
+        pool.release()
+        await queued  # got the slot handed over
+        assert pool.active == 1 and pool.queued == 0
+
+        pool.timeout = 0.01
+        with pytest.raises(Rejected) as late:
+            await pool.acquire()
+        # A cancelled waiter leaves no trace either.
+        cancelled = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        pool.release()
+        return pool, full.value, late.value
+
+    pool, full, late = asyncio.run(run())
+    assert (full.status_code, full.reason) == (503, "queue_full")
+    assert (late.status_code, late.reason) == (503, "timeout")
+    assert pool.active == 0 and pool.queued == 0
+    assert pool.wait_seconds.count == 3
+
+
+def build_app(controller):
+    test_app = FastAPI()
+    gate = asyncio.Event()
+
+    @test_app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        await gate.wait()
+        return {"item_id": item_id}
+
+    @test_app.post("/items")
+    async def write_item():
+        return {"ok": True}
+
+    @test_app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    test_app.add_middleware(AdmissionMiddleware, controller=controller)
+    return test_app, gate
+
+
+def test_middleware_sheds_reads_without_blocking_writes():
+    controller = AdmissionController(
+        [ConcurrencyLimiter("read", 1, queue_size=0), ConcurrencyLimiter("write", 1, queue_size=0)],
+        routes={"GET /health": {"pool": None}},
+        rate=0,
+    )
+    test_app, gate = build_app(controller)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=test_app), base_url="http://test") as http:
+            slow = asyncio.create_task(http.get("/items/1"))
+            while controller.pools["read"].active == 0:
+                await asyncio.sleep(0.001)
+            shed = await http.get("/items/2")
+            write = await http.post("/items")
+            health = await http.get("/health")
+            gate.set()
+            return shed, write, health, await slow
+
+    shed, write, health, slow = asyncio.run(run())
+    assert shed.status_code == 503 and shed.headers["Retry-After"] == "2"
+    assert write.status_code == 200 and health.status_code == 200 and slow.status_code == 200
+    assert controller.rejected == {("read", "queue_full"): 1}
+    assert controller.admitted == {"read": 1, "write": 1}
+    assert controller.pools["read"].active == 0
+
+
+def test_middleware_rate_limits_per_client_and_per_route():
+    controller = AdmissionController(
+        [ConcurrencyLimiter("read", 8), ConcurrencyLimiter("write", 8)],
+        routes={"POST /items": {"rate": 0.5, "burst": 1}},
+        rate=0,
+    )
+    test_app, gate = build_app(controller)
+    gate.set()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=test_app), base_url="http://test") as http:
+            alice = verified_headers(1)
+            first = await http.post("/items", headers=alice)
+            limited = await http.post("/items", headers=alice)
+            bob = await http.post("/items", headers=verified_headers(2))
+            reads = [await http.get("/items/1", headers=alice) for _ in range(5)]
+            return first, limited, bob, reads
+
+    first, limited, bob, reads = asyncio.run(run())
+    assert first.status_code == 200 and bob.status_code == 200
+    assert limited.status_code == 429 and limited.headers["Retry-After"] == "2"
+    assert limited.json() == {"detail": "Too many requests"}
+    assert {read.status_code for read in reads} == {200}  # no default rate
+    assert controller.rejected == {("write", "rate"): 1}
+
+
+def test_unverified_tokens_count_against_the_address():
+    controller = AdmissionController(
+        [ConcurrencyLimiter("read", 8), ConcurrencyLimiter("write", 8)],
+        routes={"POST /items": {"rate": 0.5, "burst": 1}},
+        rate=0,
+    )
+    test_app, _ = build_app(controller)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=test_app), base_url="http://test") as http:
+            junk = [await http.post("/items", headers={"Authorization": f"Bearer junk{n}"}) for n in range(3)]
+            cookie = await http.post("/items", headers={"Cookie": "access_token=junk"})
+            # A refresh token is no key either, verified or not.
+            refresh = auth.create_refresh_token({"sub": "user1", "uid": 1})
+            auth.decode_token(refresh)
+            refreshed = await http.post("/items", headers={"Authorization": f"Bearer {refresh}"})
+            return junk, cookie, refreshed
+
+    junk, cookie, refreshed = asyncio.run(run())
+    assert [response.status_code for response in junk] == [200, 429, 429]
+    assert cookie.status_code == 429 and refreshed.status_code == 429
+    assert controller.rejected == {("write", "rate"): 4}
+
+
+def test_unknown_pool_in_route_config_is_an_error():
+    controller = AdmissionController([ConcurrencyLimiter("read", 1)], routes={"GET /x": {"pool": "bulk"}})
+    with pytest.raises(ValueError):
+        controller.policy("GET /x")
+
+
+def test_admission_shows_up_in_metrics_and_stats():
+    token = client.post("/tasks/register", json={"username": "admission-stats", "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/tasks/api/", headers=headers)
+
+    stats = client.get("/tasks/api/admission/stats", headers=headers).json()
+    assert set(stats["pools"]) == {"read", "write"}
+    assert stats["pools"]["read"]["admitted"] >= 1 and stats["pools"]["read"]["active"] == 1  # this request
+
+    body = client.get("/metrics").text
+    assert 'todo_admission_limit{pool="read"}' in body
+    assert 'todo_admission_admitted_total{pool="write"}' in body
+    assert 'todo_admission_queue_wait_seconds_count{pool="read"}' in body
@@ -0,0 +1,138 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import app
+from core import queries
+from core.archive import TaskArchiver, archive_cutoff
+from core.db import create_engines, init_db
+from core.events import load_events
+
+client = TestClient(app)
+
+# Everything the tests archive finished in 2000, so archiving "30 days before
+# 2001" never touches other tests' tasks in the shared database.
+NOW = datetime(2001, 1, 1)
+
+
+def test_cutoff_is_a_date_prefix():
+    assert archive_cutoff(30, now=datetime(2001, 1, 1, 12, 30)) == "2000-12-02"
+
+
+def test_archiver_moves_old_completed_tasks_in_batches_and_frees_pages(tmp_path):
+    read_engine, write_engine = create_engines(tmp_path / "todo.db", profile="production")
+    archiver = TaskArchiver(
+        session_factory=lambda: AsyncSession(write_engine, expire_on_commit=False), after_days=30, batch_size=2
+    )
+    filler = "x" * 4000
+
+    async def run():
+        await init_db(write_engine)
+        async with AsyncSession(write_engine, expire_on_commit=False) as session:
+            old = [
+                await queries.create_task(session, f"Old {n}", description=filler, status="Completed", user_id=1)
+                for n in range(5)
+            ]
+            for task in old:
+                await queries.update_task(session, task["task_id"], completed_at="2000-06-01 10:00:00")
+            # Completed without a completed_at: its last write decides.
+            undated = await queries.create_task(session, "Undated", status="Completed", user_id=1)
+            await session.execute(
+                text("UPDATE tasks SET updated_at = '2000-06-01 00:00:00.000' WHERE task_id = :id"),
+                {"id": undated["task_id"]},
+            )
+            await session.commit()
+            recent = await queries.create_task(session, "Recent", status="Completed", user_id=1)
+            await queries.update_task(session, recent["task_id"], completed_at="2000-12-20T10:00:00")
+            await queries.create_task(session, "Open", due_date="2000-01-01", user_id=1)
+
+        moved = await archiver.run_once(now=NOW)
+        again = await archiver.run_once(now=NOW)
+
+        async with AsyncSession(read_engine) as session:
+            archived = await queries.get_task_by_id(session, old[0]["task_id"], user_id=1)
+            other_user = await queries.get_task_by_id(session, old[0]["task_id"], user_id=2)
+            live, _ = await queries.list_tasks(session, user_id=1)
+            pages, cursor = [], None
+            while True:
+                page, cursor = await queries.list_tasks(
+                    session, limit=3, sort="created_at", cursor=cursor, user_id=1, include_archived=True
+                )
+                pages += page
+                if cursor is None:
+                    break
+            events = await load_events(session, 0, user_id=1)
+            stats = await queries.get_task_stats(session, user_id=1)
+            auto_vacuum = (await session.execute(text("PRAGMA auto_vacuum"))).scalar()
+
+        async with AsyncSession(write_engine, expire_on_commit=False) as session:
+            not_updated = await queries.update_task(session, old[1]["task_id"], title="Changed", user_id=1)
+            deleted = await queries.delete_task(session, old[1]["task_id"], user_id=1)
+        async with AsyncSession(read_engine) as session:
+            gone = await queries.get_task_by_id(session, old[1]["task_id"], user_id=1)
+            after_delete = await load_events(session, events[-1]["event_id"], user_id=1)
+        await read_engine.dispose()
+        await write_engine.dispose()
+        return locals()
+
+    result = asyncio.run(run())
+    assert result["moved"] == 6 and result["again"] == 0
+    assert archiver.batches == 3 and archiver.archived == 6
+    assert result["archived"]["title"] == "Old 0" and result["archived"]["archived_at"]
+    assert result["other_user"] is None
+    assert sorted(task["title"] for task in result["live"]) == ["Open", "Recent"]
+    assert [task["title"] for task in result["pages"]] == [f"Old {n}" for n in range(5)] + ["Undated", "Recent", "Open"]
+    assert [bool(task["archived_at"]) for task in result["pages"]] == [True] * 6 + [False, False]
+    # The move is announced as "archived", not as a delete.
+    ops = [event["op"] for event in result["events"]]
+    assert ops.count("archived") == 6 and "deleted" not in ops
+    assert result["stats"]["total"] == 2
+    assert result["auto_vacuum"] == 2  # INCREMENTAL on a database created by migrate()
+    assert archiver.pages_freed > 0
+    # Archived tasks are read-only, but can be deleted.
+    assert result["not_updated"] is None
+    assert result["deleted"] is True and result["gone"] is None
+    assert [event["op"] for event in result["after_delete"]] == ["deleted"]
+
+
+def test_api_reads_archived_tasks_and_refuses_to_update_them():
+    credentials = {"username": f"archive-{uuid.uuid4().hex}", "password": "secret"}
+    token = client.post("/tasks/register", json=credentials).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    task = client.post("/tasks/api/", json={"title": "Filed away", "status": "Completed"}, headers=headers).json()
+    client.put(f"/tasks/api/{task['task_id']}", json={"completed_at": "2000-03-01T00:00:00"}, headers=headers)
+    client.post("/tasks/api/", json={"title": "Still open"}, headers=headers)
+
+    assert asyncio.run(TaskArchiver(after_days=30).run_once(now=NOW)) >= 1
+
+    found = client.get(f"/tasks/api/{task['task_id']}", headers=headers)
+    assert found.status_code == 200 and found.json()["title"] == "Filed away"
+    live = client.get("/tasks/api/", headers=headers).json()["items"]
+    assert [item["title"] for item in live] == ["Still open"]
+    everything = client.get("/tasks/api/", params={"include_archived": "true"}, headers=headers).json()["items"]
+    assert sorted(item["title"] for item in everything) == ["Filed away", "Still open"]
+    update = client.put(f"/tasks/api/{task['task_id']}", json={"title": "Changed"}, headers=headers)
+    assert update.status_code == 409
+    assert client.get("/tasks/api/archive/stats", headers=headers).json()["after_days"] == 30
+    assert client.delete(f"/tasks/api/{task['task_id']}", headers=headers).status_code == 200
+    assert client.get(f"/tasks/api/{task['task_id']}", headers=headers).status_code == 404
+
+
+def test_archiving_drops_cached_copies_of_the_moved_tasks():
+    credentials = {"username": f"archive-{uuid.uuid4().hex}", "password": "secret"}
+    token = client.post("/tasks/register", json=credentials).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    task = client.post("/tasks/api/", json={"title": "Cached", "status": "Completed"}, headers=headers).json()
+    client.put(f"/tasks/api/{task['task_id']}", json={"completed_at": "2000-03-01T00:00:00"}, headers=headers)
+    before = client.get(f"/tasks/api/{task['task_id']}", headers=headers).json()
+    assert before.get("archived_at") is None
+    assert client.get(f"/tasks/api/{task['task_id']}", headers=headers).json() == before  # now cached
+
+    assert asyncio.run(TaskArchiver(after_days=30).run_once(now=NOW)) >= 1
+
+    after = client.get(f"/tasks/api/{task['task_id']}", headers=headers).json()
+    assert after["archived_at"] is not None
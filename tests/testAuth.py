@@ -0,0 +1,82 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+from auth import VerifiedTokenCache
+
+
+def current_user(token):
+    return asyncio.run(auth.get_current_user(token))
+
+
+@pytest.fixture(autouse=True)
+def fresh_token_cache(monkeypatch):
+    monkeypatch.setattr(auth, "token_cache", VerifiedTokenCache(max_entries=2))
+
+
+def test_verified_token_is_cached():
+    token = auth.create_access_token({"sub": "alice", "uid": 1})
+    first = current_user(token)
+    second = current_user(token)
+
+    assert first == second
+    assert auth.token_cache.stats()["hits"] == 1
+    assert auth.token_cache.stats()["misses"] == 1
+
+
+def test_cached_entry_expires_with_token():
+    token = auth.create_access_token({"sub": "alice", "uid": 1})
+    auth.decode_token(token)
+    digest = VerifiedTokenCache.digest(token)
+    auth.token_cache._entries[digest]["exp"] = time.time() - 1
+
+    assert auth.token_cache.get(digest) is None
+    assert auth.token_cache.stats()["entries"] == 0
+
+
+def test_expired_token_is_rejected():
+    token = auth.create_access_token({"sub": "alice", "uid": 1}, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(HTTPException) as exc:
+        current_user(token)
+    assert exc.value.status_code == 401
+
+
+def test_cache_is_bounded():
+    for uid in range(3):
+        auth.decode_token(auth.create_access_token({"sub": "alice", "uid": uid}))
+    stats = auth.token_cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_revoked_token_is_rejected_until_expiry():
+    token = auth.create_access_token({"sub": "alice", "uid": 1})
+    other = auth.create_access_token({"sub": "alice", "uid": 1})
+    current_user(token)
+    auth.revoke_token(token)
+
+    with pytest.raises(HTTPException) as exc:
+        current_user(token)
+    assert exc.value.status_code == 401
+    assert current_user(other).id == 1
+    assert auth.token_cache.stats()["revoked"] == 1
+
+
+def test_expired_entries_are_purged_before_evicting_live_ones():
+    stale = auth.create_access_token({"sub": "alice", "uid": 1})
+    live = auth.create_access_token({"sub": "alice", "uid": 2})
+    auth.decode_token(stale)
+    auth.decode_token(live)
+    stale_digest = VerifiedTokenCache.digest(stale)
+    auth.token_cache._entries[stale_digest]["exp"] = time.time() - 1
+    auth.token_cache._expiry = [(time.time() - 1, stale_digest), (time.time() + 60, VerifiedTokenCache.digest(live))]
+
+    auth.decode_token(auth.create_access_token({"sub": "alice", "uid": 3}))
+
+    assert stale_digest not in auth.token_cache._entries
+    assert VerifiedTokenCache.digest(live) in auth.token_cache._entries
+    assert auth.token_cache.stats()["evictions"] == 0
@@ -0,0 +1,137 @@
+import asyncio
+from core.cache import LRUBackend, RedisBackend, TaskCache
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio.Redis (decode_responses=True) for the cache."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+def load(value, calls):
+    async def loader():
+        calls.append(value)
+        return value
+
+    return loader
+
+
+def test_lru_backend_evicts_and_expires():
+    async def run():
+        backend = LRUBackend(max_entries=2, ttl=60)
+        for task_id in (1, 2, 3):
+            await backend.set_task(task_id, {"task_id": task_id})
+        evicted = await backend.get_task(1)
+        kept = await backend.get_task(3)
+
+        backend.ttl = -1
+        await backend.set_task(4, {"task_id": 4})
+        return evicted, kept, await backend.get_task(4), backend.evictions
+
+    evicted, kept, expired, evictions = asyncio.run(run())
+
+    assert evicted is None
+    assert kept == {"task_id": 3}
+    assert expired is None
+    assert evictions >= 1
+
+
+def test_task_cache_read_through_and_invalidation():
+    async def run():
+        cache = TaskCache(LRUBackend())
+        calls = []
+        task = {"task_id": 1, "title": "Cached"}
+        first = await cache.get_task(1, load(task, calls))
+        second = await cache.get_task(1, load(task, calls))
+        page_params = {"limit": 10, "status": None, "user_id": 1, "version": 1}
+        await cache.get_page(page_params, load({"items": [task], "next_cursor": None}, calls))
+        await cache.get_page(page_params, load({"items": [task], "next_cursor": None}, calls))
+
+        await cache.invalidate([1])
+        await cache.get_task(1, load(task, calls))
+        # The write bumped the owner's change version, so the page is a new key.
+        await cache.get_page({**page_params, "version": 2}, load({"items": [], "next_cursor": None}, calls))
+        return first, second, len(calls), cache.stats()
+
+    first, second, loads, stats = asyncio.run(run())
+
+    assert first == second
+    assert loads == 4
+    assert stats["hits"] == 2
+    assert stats["misses"] == 4
+    assert stats["invalidations"] == 1
+
+
+def test_task_cache_skips_fill_when_invalidated_during_load():
+    async def run():
+        cache = TaskCache(LRUBackend())
+
+        async def slow_loader():
+            await cache.invalidate([1])
+            return {"task_id": 1, "title": "Stale"}
+
+        await cache.get_task(1, slow_loader)
+        return await cache.backend.get_task(1)
+
+    assert asyncio.run(run()) is None
+
+
+def test_redis_backend_with_fake_client():
+    async def run():
+        cache = TaskCache(RedisBackend(FakeRedis()))
+        calls = []
+        task = {"task_id": 7, "title": "Redis", "priority": 2, "completed_at": None}
+        await cache.get_task(7, load(task, calls))
+        cached = await cache.get_task(7, load(task, calls))
+        await cache.get_page({"limit": 5}, load({"items": [task], "next_cursor": "abc"}, calls))
+        page = await cache.get_page({"limit": 5}, load({}, calls))
+        await cache.invalidate([7])
+        return cached, page, await cache.backend.get_task(7), len(calls)
+
+    cached, page, dropped, loads = asyncio.run(run())
+
+    assert cached == {"task_id": 7, "title": "Redis", "priority": 2, "completed_at": None}
+    assert page == {"items": [cached], "next_cursor": "abc"}
+    assert dropped is None
+    assert loads == 2
@@ -0,0 +1,99 @@
+import asyncio
+import gzip
+import zlib
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from core.compression import CompressionMiddleware, GzipEncoder, negotiate
+
+BIG = "task " * 1000
+
+
+def build_app(**options):
+    test_app = FastAPI()
+
+    @test_app.get("/big")
+    async def big():
+        return PlainTextResponse(BIG, headers={"ETag": '"v1"'})
+
+    @test_app.get("/small")
+    async def small():
+        return PlainTextResponse("tiny")
+
+    @test_app.get("/stream")
+    async def stream():
+        async def chunks():
+            for n in range(3):
+                yield f"<tr><td>{n}</td></tr>" * 50
+
+        return StreamingResponse(chunks(), media_type="text/html")
+
+    @test_app.get("/events")
+    async def events():
+        async def frames():
+            yield "data: 1\n\n" * 200
+
+        return StreamingResponse(frames(), media_type="text/event-stream")
+
+    test_app.add_middleware(CompressionMiddleware, **options)
+    return test_app
+
+
+async def fetch(test_app, path, accept_encoding):
+    transport = httpx.ASGITransport(app=test_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        async with http.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+            return response, raw
+
+
+def test_negotiate_honours_q_values_and_availability():
+    available = {"gzip": GzipEncoder, "br": object}
+    assert negotiate("gzip, br", available) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", available) == "gzip"
+    assert negotiate("br;q=0, gzip", available) == "gzip"
+    assert negotiate("br", {"gzip": GzipEncoder}) is None
+    assert negotiate("*", {"gzip": GzipEncoder}) == "gzip"
+    assert negotiate("identity", available) is None
+    assert negotiate("", available) is None
+
+
+def test_gzip_above_the_threshold_only():
+    test_app = build_app(minimum_size=500)
+    response, raw = asyncio.run(fetch(test_app, "/big", "gzip"))
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"v1"'
+    assert int(response.headers["content-length"]) == len(raw) < len(BIG) / 10
+    assert gzip.decompress(raw).decode() == BIG
+
+    response, raw = asyncio.run(fetch(test_app, "/small", "gzip"))
+    assert "content-encoding" not in response.headers and raw == b"tiny"
+
+    response, raw = asyncio.run(fetch(test_app, "/big", "identity"))
+    assert "content-encoding" not in response.headers and raw.decode() == BIG
+
+
+def test_streamed_chunks_are_flushed_and_event_streams_left_alone():
+    test_app = build_app()
+    response, raw = asyncio.run(fetch(test_app, "/stream", "gzip"))
+    assert response.headers["content-encoding"] == "gzip" and "content-length" not in response.headers
+    assert zlib.decompress(raw, 16 + zlib.MAX_WBITS).decode() == "".join(f"<tr><td>{n}</td></tr>" * 50 for n in range(3))
+
+    # Each chunk is a complete deflate block: its prefix decodes on its own.
+    encoder = GzipEncoder()
+    first = encoder.compress(b"<tr>first</tr>")
+    assert zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(first) == b"<tr>first</tr>"
+
+    response, raw = asyncio.run(fetch(test_app, "/events", "gzip"))
+    assert "content-encoding" not in response.headers and raw.startswith(b"data: 1")
+
+
+def test_brotli_when_installed():
+    brotli = pytest.importorskip("brotli")
+    response, raw = asyncio.run(fetch(build_app(), "/big", "br, gzip"))
+    assert response.headers["content-encoding"] == "br"
+    assert brotli.decompress(raw).decode() == BIG
@@ -0,0 +1,181 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app import app
+from core import queries
+from core.db import AsyncSessionLocal, WriteSessionLocal
+from core.events import HEAD_SQL, EventBroker, KafkaSink, OutboxRelay, event_stream, load_events
+
+client = TestClient(app)
+
+# Owner ids no registered user has, so other tests' writes don't interleave.
+OWNER = 900001
+
+
+class StubFuture:
+    def __init__(self, error=None):
+        self.error = error
+
+    def get(self, timeout=None):
+        if self.error:
+            raise self.error
+
+
+class StubProducer:
+    """Stands in for kafka.KafkaProducer: records what would have been sent."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.flushes = 0
+
+    def send(self, topic, key=None, value=None):
+        if self.fail:
+            return StubFuture(RuntimeError("broker unavailable"))
+        self.sent.append((topic, key, json.loads(value)))
+        return StubFuture()
+
+    def flush(self):
+        self.flushes += 1
+
+
+async def head():
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(HEAD_SQL)).scalar()
+
+
+def test_writes_and_only_committed_writes_leave_events():
+    async def run():
+        start = await head()
+        async with WriteSessionLocal() as session:
+            task = await queries.create_task(session, title="Evented", user_id=OWNER)
+            await queries.update_task(session, task["task_id"], status="Completed", user_id=OWNER)
+            await queries.delete_task(session, task["task_id"], user_id=OWNER)
+        async with WriteSessionLocal() as session:
+            await queries.create_task(session, title="Rolled back", user_id=OWNER, commit=False)
+            await session.rollback()
+        async with AsyncSessionLocal() as session:
+            return task, await load_events(session, start, user_id=OWNER)
+
+    task, events = asyncio.run(run())
+    assert [event["op"] for event in events] == ["created", "updated", "deleted"]
+    assert {event["task_id"] for event in events} == {task["task_id"]}
+    assert events[0]["task"]["title"] == "Evented"
+    assert events[1]["task"]["status"] == "Completed"
+    assert events[2]["task"] == {"task_id": task["task_id"]}
+
+
+def test_relay_feeds_broker_and_kafka_in_batches_and_resumes_from_offset():
+    async def run():
+        producer = StubProducer()
+        broker = EventBroker()
+        subscription = broker.subscribe(OWNER + 1)
+        relay = OutboxRelay(broker, sinks=[KafkaSink(producer, topic="events")], batch_size=2)
+        # Start from the current head rather than replaying older tests' events.
+        relay.position = await head()
+        await relay._store_offsets()
+        async with WriteSessionLocal() as session:
+            for n in range(3):
+                await queries.create_task(session, title=f"Relayed {n}", user_id=OWNER + 1)
+
+        assert await relay.relay_once() == 2
+        assert relay.lag_events == 1
+        assert await relay.relay_once() == 1
+        assert await relay.relay_once() == 0
+
+        # A relay started afresh continues from the stored Kafka offset.
+        restarted = OutboxRelay(EventBroker(), sinks=[KafkaSink(producer, topic="events")])
+        assert await restarted.relay_once() == 0
+        assert restarted.position == relay.position
+
+        queued = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        return producer, relay, queued
+
+    producer, relay, queued = asyncio.run(run())
+    assert [value["task"]["title"] for _, _, value in producer.sent] == ["Relayed 0", "Relayed 1", "Relayed 2"]
+    assert {(topic, key) for topic, key, _ in producer.sent} == {("events", str(OWNER + 1).encode())}
+    assert producer.flushes == 2
+    assert [event["task"]["title"] for event in queued] == ["Relayed 0", "Relayed 1", "Relayed 2"]
+    stats = relay.stats()
+    assert stats["batches"] == 2 and stats["relayed"] == 3 and stats["lag_events"] == 0
+
+
+def test_failed_sink_keeps_events_for_the_next_poll():
+    async def run():
+        producer = StubProducer(fail=True)
+        relay = OutboxRelay(EventBroker(), sinks=[KafkaSink(producer, topic="events")])
+        relay.position = await head()
+        async with WriteSessionLocal() as session:
+            await queries.create_task(session, title="Retried", user_id=OWNER + 2)
+        position = relay.position
+        try:
+            await relay.relay_once()
+        except RuntimeError:
+            pass
+        assert relay.position == position
+        producer.fail = False
+        assert await relay.relay_once() == 1
+        return producer
+
+    producer = asyncio.run(run())
+    assert [value["task"]["title"] for _, _, value in producer.sent] == ["Retried"]
+
+
+def test_event_stream_replays_after_offset_then_goes_live():
+    async def run():
+        broker = EventBroker()
+        relay = OutboxRelay(broker)
+        relay.position = await head()
+        async with WriteSessionLocal() as session:
+            first = await queries.create_task(session, title="Before", user_id=OWNER + 3)
+            await queries.create_task(session, title="Other user", user_id=OWNER + 4)
+        await relay.relay_once()
+        async with AsyncSessionLocal() as session:
+            (created,) = await load_events(session, relay.position - 2, user_id=OWNER + 3)
+
+        stream = event_stream(OWNER + 3, after=created["event_id"] - 1, broker=broker, heartbeat=0.05)
+        frames = [await stream.__anext__()]
+        async with WriteSessionLocal() as session:
+            await queries.update_task(session, first["task_id"], title="After", user_id=OWNER + 3)
+        await relay.relay_once()
+        frames.append(await stream.__anext__())
+        frames.append(await stream.__anext__())  # nothing new: heartbeat
+        await stream.aclose()
+        return broker, frames
+
+    broker, frames = asyncio.run(run())
+    assert frames[0].startswith("id: ") and "event: created" in frames[0] and '"Before"' in frames[0]
+    assert "event: updated" in frames[1] and '"After"' in frames[1]
+    assert "Other user" not in "".join(frames)
+    assert frames[2] == ": keep-alive\n\n"
+    assert broker.subscriber_count() == 0
+
+
+def test_overflowing_subscriber_catches_up_from_the_table():
+    async def run():
+        broker = EventBroker(max_queue=1)
+        relay = OutboxRelay(broker)
+        relay.position = await head()
+        stream = event_stream(OWNER + 5, after=relay.position, broker=broker, heartbeat=0.05)
+        assert await stream.__anext__() == ": keep-alive\n\n"
+        async with WriteSessionLocal() as session:
+            for n in range(3):
+                await queries.create_task(session, title=f"Burst {n}", user_id=OWNER + 5)
+        await relay.relay_once()
+        assert broker.overflows == 1
+        frames = [await stream.__anext__() for _ in range(3)]
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(run())
+    assert [f"Burst {n}" in frame for n, frame in enumerate(frames)] == [True, True, True]
+
+
+def test_events_endpoint_requires_auth_and_a_numeric_last_event_id():
+    assert client.get("/tasks/api/events").status_code == 401
+    token = client.post("/tasks/register", json={"username": f"events-{OWNER}", "password": "secret"}).json()["access_token"]
+    response = client.get("/tasks/api/events", headers={"Authorization": f"Bearer {token}", "Last-Event-ID": "abc"})
+    assert response.status_code == 400
+    assert client.get("/tasks/api/events/stats", headers={"Authorization": f"Bearer {token}"}).json()["sinks"] == []
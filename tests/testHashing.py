@@ -0,0 +1,92 @@
+import asyncio
+
+from core.hashing import PasswordHasher, is_hashed
+
+
+def test_hash_and_verify():
+    async def run():
+        hasher = PasswordHasher(rounds=4)
+        stored = await hasher.hash("secret")
+        return stored, await hasher.verify("secret", stored), await hasher.verify("wrong", stored)
+
+    stored, ok, wrong = asyncio.run(run())
+
+    assert is_hashed(stored) and "secret" not in stored
+    assert ok is True
+    assert wrong is False
+
+
+def test_legacy_plaintext_and_old_cost_are_rehashed():
+    async def run():
+        hasher = PasswordHasher(rounds=5)
+        legacy = await hasher.verify_and_update("secret", "secret")
+        rejected = await hasher.verify_and_update("wrong", "secret")
+        old_cost = await hasher.verify_and_update("secret", await PasswordHasher(rounds=4).hash("secret"))
+        current = await hasher.verify_and_update("secret", await hasher.hash("secret"))
+        return legacy, rejected, old_cost, current, hasher.rehashes
+
+    legacy, rejected, old_cost, current, rehashes = asyncio.run(run())
+
+    assert legacy[0] and legacy[1].startswith("$2b$05$")
+    assert rejected == (False, None)
+    assert old_cost[0] and old_cost[1].startswith("$2b$05$")
+    assert current == (True, None)
+    assert rehashes == 2
+
+
+def test_concurrency_cap_queues_callers():
+    async def run():
+        hasher = PasswordHasher(rounds=4, workers=4, max_concurrency=1)
+        await asyncio.gather(*(hasher.hash(f"password{n}") for n in range(5)))
+        return hasher.stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["hashes"] == 5
+    assert stats["max_queue_depth"] == 4
+    assert stats["queue_depth"] == 0
+    assert stats["running"] == 0
+
+
+def test_login_storm_keeps_other_routes_flat(monkeypatch):
+    import statistics
+    import time
+    import uuid
+
+    import httpx
+
+    import routes
+    from app import app
+
+    # A real cost, so inline hashing would visibly stall the loop.
+    monkeypatch.setattr(routes, "password_hasher", PasswordHasher(rounds=10, workers=2, max_concurrency=2))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            credentials = {"username": f"storm-{uuid.uuid4().hex}", "password": "secret"}
+            token = (await client.post("/tasks/register", json=credentials)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            async def timed_reads(count):
+                samples = []
+                for _ in range(count):
+                    started = time.perf_counter()
+                    assert (await client.get("/tasks/api/", headers=headers)).status_code == 200
+                    samples.append(time.perf_counter() - started)
+                return samples
+
+            baseline = await timed_reads(20)
+            started = time.perf_counter()
+            logins = [client.post("/tasks/login", json=credentials) for _ in range(20)]
+            *responses, during = await asyncio.gather(*logins, timed_reads(20))
+            storm = time.perf_counter() - started
+        return baseline, during, storm, responses
+
+    baseline, during, storm, responses = asyncio.run(run())
+
+    assert all(response.status_code == 200 for response in responses)
+    # Twenty hashes queued two at a time keep the storm going far longer
+    # than any single read; reads must not be stuck behind them.
+    assert max(during) < storm / 4
+    assert statistics.median(during) < statistics.median(baseline) + 0.05
@@ -0,0 +1,34 @@
+import asyncio
+import copy
+
+from benchmarks.load import compare, run
+
+
+def test_load_run_reports_every_endpoint():
+    # The test database runs the development profile, whose shared engine
+    # answers concurrent writers with "database is locked"; one client at a
+    # time keeps this about the harness.
+    results = asyncio.run(run(rows=40, users=2, requests=8, concurrency=1))
+
+    assert set(results["endpoints"]) == {"login", "create", "get", "list", "update", "delete"}
+    for stats in results["endpoints"].values():
+        assert stats["errors"] == 0
+        assert stats["count"] > 0
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert results["endpoints"]["delete"]["count"] == results["endpoints"]["create"]["count"] == 8
+
+
+def test_compare_flags_only_regressions_beyond_margin():
+    baseline = {"endpoints": {"get": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "per_second": 100.0}}}
+    current = copy.deepcopy(baseline)
+    current["endpoints"]["get"]["p95_ms"] = 23.0
+    current["endpoints"]["get"]["per_second"] = 90.0
+    current["endpoints"]["list"] = {"p50_ms": 99.0, "p95_ms": 99.0, "p99_ms": 99.0, "per_second": 1.0}
+    assert compare(current, baseline, margin=0.2) == []
+
+    current["endpoints"]["get"]["p99_ms"] = 40.0
+    current["endpoints"]["get"]["per_second"] = 50.0
+    assert compare(current, baseline, margin=0.2) == [
+        "get p99_ms: 40.00 > 30.00 (+20%)",
+        "get per_second: 50.0 < 100.0 (-20%)",
+    ]
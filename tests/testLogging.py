@@ -0,0 +1,69 @@
+import json
+import logging
+import queue
+
+from utils.logger import DroppingQueueHandler, JSONFormatter, SamplingFilter, log_stats
+
+
+class Rendered:
+    """Argument that records whether the message was ever built."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "rendered"
+
+
+def make_logger(name, handler):
+    log = logging.getLogger(name)
+    log.handlers = [handler]
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    return log
+
+
+def test_queue_handler_defers_formatting_and_drops_when_full():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    log = make_logger("todo_app.test.queue", handler)
+    argument = Rendered()
+
+    log.info("first %s", argument)
+    log.info("second %s", argument)
+
+    assert argument.calls == 0
+    assert handler.enqueued == 1
+    assert handler.dropped == 1
+    record = handler.queue.get_nowait()
+    assert record.getMessage() == "first rendered"
+
+
+def test_sampling_filter_is_per_level():
+    handler = DroppingQueueHandler(queue.Queue())
+    sampling = SamplingFilter({"INFO": 0.0})
+    handler.addFilter(sampling)
+    log = make_logger("todo_app.test.sampling", handler)
+
+    for _ in range(5):
+        log.info("hot line")
+    log.warning("kept")
+
+    assert sampling.sampled_out == 5
+    assert [record.levelname for record in list(handler.queue.queue)] == ["WARNING"]
+
+
+def test_json_formatter_includes_extras():
+    record = logging.makeLogRecord(
+        {"name": "todo_app", "levelname": "INFO", "msg": "Task %s", "args": (7,), "task_id": 7}
+    )
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry["message"] == "Task 7"
+    assert entry["level"] == "INFO"
+    assert entry["task_id"] == 7
+
+
+def test_log_stats_counters():
+    stats = log_stats()
+    assert {"queued", "enqueued", "dropped", "sampled_out"} <= set(stats)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import app
+from core.metrics import LATENCY_BUCKETS, Histogram, MetricsMiddleware, MetricsRegistry, instrument_engine, normalize_sql
+
+client = TestClient(app)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram()
+    for value in (0.00005, 0.0003, 0.0003, 20.0):
+        histogram.observe(value)
+
+    buckets = dict(histogram.cumulative())
+    assert buckets[LATENCY_BUCKETS[0]] == 1
+    assert buckets[0.0005] == 3
+    assert buckets[10.0] == 3
+    assert buckets[float("inf")] == 4
+    assert histogram.count == 4
+    assert abs(histogram.sum - 20.00065) < 1e-9
+
+
+def test_normalize_sql_collapses_whitespace_and_in_lists():
+    assert normalize_sql("SELECT *\n  FROM tasks\n WHERE task_id IN (?, ?, ?)") == "SELECT * FROM tasks WHERE task_id IN (?, ...)"
+    assert normalize_sql("SELECT * FROM tasks WHERE task_id IN (?)") == "SELECT * FROM tasks WHERE task_id IN (?)"
+
+
+def test_render_escapes_labels():
+    registry = MetricsRegistry()
+    registry.observe_query('SELECT "a\\b"', 0.001)
+
+    body = registry.render()
+    assert 'statement="SELECT \\"a\\\\b\\""' in body
+    assert 'le="+Inf"' in body
+
+
+def test_metrics_endpoint_labels_requests_by_route_template():
+    token = client.post("/tasks/register", json={"username": f"user-{uuid.uuid4().hex}", "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    task_id = client.post("/tasks/api/", json={"title": "Metrics"}, headers=headers).json()["task_id"]
+    client.get(f"/tasks/api/{task_id}", headers=headers)
+    client.get("/no/such/path")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'todo_http_requests_total{method="GET",route="/tasks/api/{task_id}",status="200"}' in body
+    assert f"/tasks/api/{task_id}\"" not in body
+    assert 'route="unmatched",status="404"' in body
+    assert "todo_http_request_duration_seconds_bucket{" in body
+    assert "todo_db_query_duration_seconds_count{statement=\"INSERT INTO tasks" in body
+    assert 'todo_db_pool_size{engine="read"}' in body
+
+
+def test_query_hooks_time_statements_and_count_errors():
+    registry = MetricsRegistry()
+    path = os.path.join(tempfile.mkdtemp(prefix="todo-metrics-"), "metrics.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    instrument_engine(engine, "test", registry)
+    instrument_engine(engine, "again", registry)
+
+    async def run():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 1"))
+            try:
+                await conn.execute(text("SELECT * FROM missing"))
+            except Exception:
+                pass
+        await engine.dispose()
+
+    asyncio.run(run())
+    assert list(registry.engines) == ["test"]
+    assert registry.query_latency["SELECT 1"].count == 2
+    assert registry.query_errors["SELECT * FROM missing"] == 1
+    # The second SELECT 1 reused the statement compiled for the first.
+    assert registry.compiled_cache[("test", "miss")] == 1 and registry.compiled_cache[("test", "hit")] == 1
+    assert registry.compiled_cache_stats()["test"]["hit_ratio"] == 0.5
+    assert 'todo_db_compiled_cache_total{engine="test",result="hit"} 1' in registry.render()
+
+
+def test_middleware_overhead_is_a_few_microseconds():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    async def timed(target, rounds=5000):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await target({"type": "http", "method": "GET", "path": "/"}, receive, send)
+        return (time.perf_counter() - started) / rounds
+
+    registry = MetricsRegistry()
+    wrapped = MetricsMiddleware(app, registry)
+    bare_cost = asyncio.run(timed(app))
+    wrapped_cost = asyncio.run(timed(wrapped))
+    assert registry.requests[("GET", "unmatched", 204)] == 5000
+    # Generous bound for slow CI machines; locally this is ~2µs.
+    assert wrapped_cost - bare_cost < 50e-6
+
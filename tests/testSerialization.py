@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from core import serialization
+from schemas import TaskPage
+
+PAGE = {
+    "items": [
+        {
+            "task_id": 1,
+            "title": "Serialized",
+            "description": None,
+            "due_date": "2025-09-20",
+            "priority": 2,
+            "status": "Pending",
+            "created_at": "2025-01-01 12:00:00",
+            "completed_at": None,
+            "user_id": 7,
+            "updated_at": "2025-01-01 12:00:00.250",
+        }
+    ],
+    "next_cursor": "abc",
+}
+
+
+def model_output(page):
+    field = create_model_field("response", TaskPage, mode="serialization")
+    content = asyncio.run(serialize_response(field=field, response_content=page))
+    return json.loads(JSONResponse(content).body)
+
+
+def test_adapter_matches_response_model(monkeypatch):
+    monkeypatch.setattr(serialization, "SERIALIZATION", "adapter")
+    response = serialization.render("list_tasks", TaskPage, PAGE, {"ETag": '"1"'})
+
+    assert json.loads(response.body) == model_output(PAGE)
+    assert response.headers["etag"] == '"1"'
+    assert response.media_type == "application/json"
+
+
+def test_trusted_encodes_rows_as_is(monkeypatch):
+    monkeypatch.setattr(serialization, "SERIALIZATION", "trusted")
+    assert json.loads(serialization.render("list_tasks", TaskPage, PAGE).body) == PAGE
+
+
+def test_mode_is_switchable_per_route(monkeypatch):
+    monkeypatch.setattr(serialization, "SERIALIZATION", "adapter")
+    monkeypatch.setattr(serialization, "ROUTE_SERIALIZATION", serialization._parse_routes("get_task=model, list_tasks=trusted"))
+
+    assert serialization.render("get_task", TaskPage, PAGE) is PAGE
+    assert serialization.mode_for("list_tasks") == "trusted"
+    assert serialization.mode_for("search_tasks") == "adapter"
+
+
+def test_adapter_rejects_malformed_rows(monkeypatch):
+    from pydantic import ValidationError
+
+    monkeypatch.setattr(serialization, "SERIALIZATION", "adapter")
+    with pytest.raises(ValidationError):
+        serialization.render("list_tasks", TaskPage, {"items": [{"title": "No id"}]})
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from core.shards import SHARD_ID_BITS, ShardedTaskStore, shard_of, shard_paths
+
+
+def make_store(tmp_path, shard_key, count=3):
+    return ShardedTaskStore(shard_paths(count, tmp_path / "todo.db"), profile="development", shard_key=shard_key)
+
+
+def test_shard_paths_keep_the_main_file_as_shard_zero(tmp_path):
+    paths = shard_paths(3, tmp_path / "todo.db")
+    assert [path.name for path in paths] == ["todo.db", "todo.shard1.db", "todo.shard2.db"]
+
+
+def test_task_ids_encode_their_shard_and_route_point_operations(tmp_path):
+    store = make_store(tmp_path, "task")
+
+    async def run():
+        await store.init()
+        await store.init()  # idempotent
+        created = [await store.create_task(f"Task {n}", user_id=7) for n in range(6)]
+        found = await store.get_task_by_id(created[4]["task_id"], user_id=7)
+        other_user = await store.get_task_by_id(created[4]["task_id"], user_id=8)
+        updated = await store.update_task(created[5]["task_id"], status="Completed", user_id=7)
+        deleted = await store.delete_task(created[0]["task_id"], user_id=7)
+        missing = await store.get_task_by_id(created[0]["task_id"], user_id=7)
+        unknown = await store.get_task_by_id(99 << SHARD_ID_BITS)
+        await store.dispose()
+        return created, found, other_user, updated, deleted, missing, unknown
+
+    created, found, other_user, updated, deleted, missing, unknown = asyncio.run(run())
+    assert [shard_of(task["task_id"]) for task in created] == [0, 1, 2, 0, 1, 2]
+    assert len({task["task_id"] for task in created}) == 6
+    assert found["title"] == "Task 4" and other_user is None
+    assert updated["status"] == "Completed"
+    assert deleted is True and missing is None and unknown is None
+
+
+@pytest.mark.parametrize("shard_key", ["user", "task"])
+def test_listing_merges_shards_in_sort_order_across_pages(tmp_path, shard_key):
+    store = make_store(tmp_path, shard_key)
+    priorities = [3, 1, 2, 2, None, 1, 3, 2, 1, None]
+
+    async def run():
+        await store.init()
+        for n, priority in enumerate(priorities):
+            await store.create_task(f"Task {n}", user_id=n % 3, priority=priority)
+        pages = {}
+        for sort in ("priority", "-priority", "-created_at"):
+            rows, cursor = [], None
+            while True:
+                tasks, cursor = await store.list_tasks(limit=3, sort=sort, cursor=cursor)
+                rows += tasks
+                if cursor is None:
+                    break
+            pages[sort] = rows
+        scoped, _ = await store.list_tasks(limit=50, user_id=1)
+        await store.dispose()
+        return pages, scoped
+
+    pages, scoped = asyncio.run(run())
+    # Ties break on task_id, as in a single database.
+    key = lambda task: (task["priority"] is not None, task["priority"] or 0, task["task_id"])
+    assert len(pages["priority"]) == 10
+    assert pages["priority"] == sorted(pages["priority"], key=key)
+    assert pages["-priority"] == sorted(pages["priority"], key=key, reverse=True)
+    assert pages["-priority"][-1]["priority"] is None
+    assert sorted(task["task_id"] for task in pages["-created_at"]) == sorted(task["task_id"] for task in pages["priority"])
+    assert sorted(task["title"] for task in scoped) == ["Task 1", "Task 4", "Task 7"]
+
+
+def test_search_and_stats_fan_out(tmp_path):
+    store = make_store(tmp_path, "task")
+
+    async def run():
+        await store.init()
+        for n in range(7):
+            await store.create_task(f"Report {n}", description="quarterly numbers", user_id=5, due_date="2000-01-01")
+        await store.create_task("Unrelated", user_id=5, status="Completed", priority=1)
+        await store.create_task("Report elsewhere", user_id=6)
+        titles, cursor = [], None
+        while True:
+            hits, cursor = await store.search_tasks("report", limit=3, cursor=cursor, user_id=5)
+            titles += [hit["title"] for hit in hits]
+            if cursor is None:
+                break
+        stats = await store.get_task_stats(user_id=5, today=date(2025, 1, 1))
+        await store.dispose()
+        return titles, stats
+
+    titles, stats = asyncio.run(run())
+    assert sorted(titles) == [f"Report {n}" for n in range(7)]
+    assert stats == {
+        "total": 8,
+        "by_status": {"Pending": 7, "Completed": 1},
+        "by_priority": {2: 7, 1: 1},
+        "overdue": 7,
+    }
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app import app
+from core.db import SCHEMA_VERSION, migrate, schema_version
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Generous ceilings: they catch something heavy creeping into import or
+# startup (a query at import time, an unbounded warm-up), not jitter.
+IMPORT_BUDGET_S = 5.0
+STARTUP_BUDGET_S = 5.0
+
+# Cold start in a fresh interpreter against an empty database.
+COLD_START = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+from fastapi.testclient import TestClient
+client = TestClient(app.app)
+before = client.get("/ready").status_code
+started = time.perf_counter()
+with client:
+    startup = time.perf_counter() - started
+    ready = client.get("/ready")
+print(json.dumps({"import_s": imported, "startup_s": startup, "before": before,
+                  "after": ready.status_code, "body": ready.json()}))
+"""
+
+
+def test_cold_start_migrates_warms_up_and_stays_within_budget(tmp_path):
+    env = {
+        **os.environ,
+        "TODO_DB_PATH": str(tmp_path / "todo.db"),
+        "TODO_DB_PROFILE": "production",
+        "TODO_LOG_LEVEL": "WARNING",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    timing = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"import {timing['import_s'] * 1000:.0f} ms, startup {timing['startup_s'] * 1000:.0f} ms")
+
+    assert timing["before"] == 503
+    assert timing["after"] == 200
+    startup = timing["body"]["startup"]
+    assert timing["body"]["schema_version"] == SCHEMA_VERSION
+    assert startup["migrations"] == list(range(1, SCHEMA_VERSION + 1))
+    assert startup["connections"] == 9  # 8 readers + the writer
+    assert startup["templates"] >= 5
+    assert timing["import_s"] < IMPORT_BUDGET_S
+    assert timing["startup_s"] < STARTUP_BUDGET_S
+
+
+def test_ready_reports_warm_only_inside_the_lifespan():
+    client = TestClient(app)
+    assert client.get("/health").json() == {"status": "ok"}
+    assert client.get("/ready").status_code == 503
+    with client:
+        body = client.get("/ready").json()
+        assert body["ready"] is True
+        # The session's database is already current, so nothing re-runs.
+        assert body["startup"]["migrations"] == []
+    assert client.get("/ready").status_code == 503
+
+
+def test_migrate_is_a_no_op_once_current():
+    async def run():
+        return await migrate(), await schema_version()
+
+    assert asyncio.run(run()) == ([], SCHEMA_VERSION)
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from sqlalchemy import event
+from core.db import WriteSessionLocal, write_engine
+from core.writequeue import GroupCommitWriter
+
+
+def test_group_commit_merges_concurrent_writes():
+    commits = []
+
+    def on_commit(conn):
+        commits.append(1)
+
+    async def run():
+        writer = GroupCommitWriter(WriteSessionLocal, window=0.05, max_batch=20, enabled=True)
+        created = await asyncio.gather(
+            *[writer.submit("create", title=f"Grouped {i}") for i in range(30)]
+        )
+        updated, deleted, missing = await asyncio.gather(
+            writer.submit("update", task_id=created[0]["task_id"], title="Grouped update"),
+            writer.submit("delete", task_id=created[1]["task_id"]),
+            writer.submit("delete", task_id=-1),
+        )
+        await writer.stop()
+        return created, updated, deleted, missing, writer.stats()
+
+    event.listen(write_engine.sync_engine, "commit", on_commit)
+    try:
+        created, updated, deleted, missing, stats = asyncio.run(run())
+    finally:
+        event.remove(write_engine.sync_engine, "commit", on_commit)
+
+    assert [task["title"] for task in created] == [f"Grouped {i}" for i in range(30)]
+    assert len({task["task_id"] for task in created}) == 30
+    assert updated["title"] == "Grouped update"
+    assert deleted is True and missing is False
+    assert stats["operations"] == 33
+    assert stats["max_batch_size"] == 20
+    assert len(commits) == stats["batches"] < 33
+    assert stats["max_queue_wait_ms"] >= stats["avg_queue_wait_ms"] > 0
+
+
+def test_group_commit_isolates_failing_operation():
+    from sqlalchemy.exc import IntegrityError
+
+    async def run():
+        writer = GroupCommitWriter(WriteSessionLocal, window=0.05, enabled=True)
+        results = await asyncio.gather(
+            writer.submit("create", title="Survivor"),
+            writer.submit("create", title=None),
+            return_exceptions=True,
+        )
+        await writer.stop()
+        return results
+
+    good, bad = asyncio.run(run())
+
+    assert good["title"] == "Survivor"
+    assert isinstance(bad, IntegrityError)
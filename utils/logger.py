@@ -1,25 +1,125 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Records are handed to a bounded queue on the calling thread and written by a
+# QueueListener thread, so requests never wait on file or console I/O. When the
+# queue is full the record is dropped (and counted) rather than blocking.
+LOG_LEVEL = os.getenv("TODO_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("TODO_LOG_FORMAT", "json")  # json or text
+LOG_QUEUE_SIZE = int(os.getenv("TODO_LOG_QUEUE_SIZE", "10000"))
+# Fraction of records kept per level, e.g. TODO_LOG_SAMPLE_INFO=0.1 keeps one
+# in ten INFO lines. Levels without a setting are always kept.
+LOG_SAMPLE_RATES = {
+    level: float(os.environ[f"TODO_LOG_SAMPLE_{level}"])
+    for level in ("DEBUG", "INFO", "WARNING")
+    if f"TODO_LOG_SAMPLE_{level}" in os.environ
+}
+
+# Attributes every LogRecord has; anything else came in through ``extra=``.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extras."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.sampled_out = 0
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelname)
+        if rate is None or rate >= 1 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener.
+
+    The stock ``prepare`` renders the message on the calling thread; here the
+    record travels as is, so ``%``-style arguments are only formatted by the
+    background writer (or never, for dropped records). Arguments must
+    therefore not be mutated after logging.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+def _formatter(console: bool = False):
+    if LOG_FORMAT == "json":
+        return JSONFormatter()
+    if console:
+        return logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    return logging.Formatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s")
 
-# Create logger
-logger = logging.getLogger("todo_app")
-logger.setLevel(logging.INFO)
 
 # File handler (rotates when file reaches 5MB, keeps 3 backups)
 file_handler = RotatingFileHandler("app.log", maxBytes=5*1024*1024, backupCount=3)
-file_formatter = logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(name)s - %(message)s"
-)
-file_handler.setFormatter(file_formatter)
+file_handler.setFormatter(_formatter())
 
 # Console handler
 console_handler = logging.StreamHandler(sys.stdout)
-console_formatter = logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(message)s"
-)
-console_handler.setFormatter(console_formatter)
-
-# Add handlers to logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+console_handler.setFormatter(_formatter(console=True))
+
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = DroppingQueueHandler(log_queue)
+sampling_filter = SamplingFilter(LOG_SAMPLE_RATES)
+queue_handler.addFilter(sampling_filter)
+listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+
+# Create logger
+logger = logging.getLogger("todo_app")
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(queue_handler)
+# Handlers on the root logger would bring back synchronous I/O.
+logger.propagate = False
+
+listener.start()
+# Drain what is still queued when the process exits.
+atexit.register(listener.stop)
+
+
+def log_stats():
+    return {
+        "queued": log_queue.qsize(),
+        "capacity": LOG_QUEUE_SIZE,
+        "enqueued": queue_handler.enqueued,
+        "dropped": queue_handler.dropped,
+        "sampled_out": sampling_filter.sampled_out,
+        "sample_rates": sampling_filter.rates,
+    }